@@ -0,0 +1,209 @@
+"""
+Copyright 2024 Longze
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+# 直接从zip或tar压缩包读取源代码，无需解压到磁盘：
+# 文件索引来自压缩包的成员列表（名称和解压后大小），只有被读取的成员才会解压，且只在内存中进行。
+# zip可以随机读取任意成员；压缩的tar只能顺序解压，读取前一批成员时按其在包中的位置排序，一次顺序读完。
+import os
+import stat
+import tarfile
+import threading
+import zipfile
+import pipeline
+
+# 支持的压缩包后缀（不区分大小写）
+ZIP_SUFFIXES = ('.zip',)
+TAR_SUFFIXES = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+
+
+def is_archive(path):
+    """判断路径是否为支持的压缩包文件"""
+    return os.path.isfile(path) and path.lower().endswith(ZIP_SUFFIXES + TAR_SUFFIXES)
+
+
+def open_archive(path):
+    """按后缀打开压缩包，无法打开时抛出GenerationError"""
+    try:
+        if path.lower().endswith(ZIP_SUFFIXES):
+            return ZipSource(path)
+        return TarSource(path)
+    except (OSError, zipfile.BadZipFile, tarfile.TarError) as e:
+        raise pipeline.GenerationError(f"无法打开压缩包 {path}: {e}")
+
+
+def member_parts(name):
+    """成员名称拆分为各级路径（去掉开头的/和./）"""
+    return tuple(part for part in name.replace('\\', '/').split('/') if part and part != '.')
+
+
+class ArchiveSource:
+    """压缩包中的文件，作为生成流程的输入源
+
+    文件路径以压缩包路径为根目录，文件边界中的相对路径即为成员在包中的路径；
+    与scan_project一样剪掉依赖、构建产物、版本库目录和包中.gitignore匹配的目录。
+    子类实现list_members()和open_member()。read()可在多个线程中调用，对压缩包的读取依次进行。
+    """
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.root = self.path
+        self.members = {}     # 路径 -> 成员信息
+        self.preloaded = {}   # 预读的内容：路径 -> (bytes, 是否为完整内容, 是否只为读取开头而预读)
+        self.lock = threading.Lock()
+
+    def list_members(self, cancel_event):
+        """返回([(各级路径, 大小, 变化标记, 成员信息)], {目录各级路径: .gitignore各行})"""
+        raise NotImplementedError
+
+    def open_member(self, member):
+        """打开成员，返回可读取解压后内容的文件对象"""
+        raise NotImplementedError
+
+    def scan(self, cancel_event=None):
+        """列出压缩包中的文件，返回FileEntry列表（不解压文件内容）"""
+        files, gitignores = self.list_members(cancel_event)
+        directories = {(): (False, pipeline.parse_gitignore(self.root, gitignores.get((), [])))}
+
+        def visit(parts):
+            # 目录是否被剪掉，以及适用于其中内容的.gitignore规则
+            if parts not in directories:
+                ignored, rules = visit(parts[:-1])
+                if not ignored:
+                    dir_path = os.path.join(self.root, *parts)
+                    ignored = pipeline.is_ignored_dir(dir_path, parts[-1], rules)
+                    if not ignored:
+                        rules = rules + pipeline.parse_gitignore(dir_path, gitignores.get(parts, []))
+                directories[parts] = (ignored, rules)
+            return directories[parts]
+
+        index = []
+        for parts, size, token, member in files:
+            if visit(parts[:-1])[0]:
+                continue
+            path = os.path.join(self.root, *parts)
+            self.members[path] = member
+            index.append(pipeline.FileEntry(path, os.path.splitext(parts[-1])[1].lower(), size, token))
+        return index
+
+    def read(self, path, limit=-1):
+        """读取（解压）文件内容，limit为最多返回的字节数（-1为全部）"""
+        member = self.members.get(path)
+        if member is None:
+            raise FileNotFoundError(path)
+        with self.lock:
+            data, complete, head = self.preloaded.get(path, (None, False, False))
+            if complete and limit < 0:
+                # 完整内容只会被读取一次（之后由调用方保存或写入缓存）
+                del self.preloaded[path]
+                return data
+            if data is not None and limit >= 0 and (complete or len(data) >= limit):
+                if head:
+                    # 只为读取开头而预读的内容（用于检查）同样只读取一次
+                    del self.preloaded[path]
+                return data[:limit]
+            with self.open_member(member) as f:
+                return f.read(limit)
+
+    def preload(self, paths, limit=-1):
+        """提前读取一批文件（随机读取的压缩包无需预读）"""
+
+    def close(self):
+        """释放预读的内容"""
+        self.preloaded.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ZipSource(ArchiveSource):
+    """zip压缩包：成员列表在中央目录中，可以随机读取任意成员"""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.archive = zipfile.ZipFile(self.path)
+
+    def list_members(self, cancel_event):
+        files = []
+        gitignores = {}
+        for info in self.archive.infolist():
+            if cancel_event is not None and cancel_event.is_set():
+                raise pipeline.GenerationCancelled()
+            parts = member_parts(info.filename)
+            # 跳过目录和符号链接
+            if info.is_dir() or not parts or stat.S_ISLNK(info.external_attr >> 16):
+                continue
+            if parts[-1] == '.gitignore':
+                gitignores[parts[:-1]] = self.archive.read(info).decode('utf-8', 'ignore').splitlines()
+            # CRC随内容变化，作为缓存的变化标记
+            files.append((parts, info.file_size, float(info.CRC), info))
+        return files, gitignores
+
+    def open_member(self, member):
+        return self.archive.open(member)
+
+    def close(self):
+        super().close()
+        self.archive.close()
+
+
+class TarSource(ArchiveSource):
+    """tar压缩包（可为gzip、bzip2或xz压缩）：列出成员需要顺序解压一遍，读取时按成员位置排序"""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.archive = tarfile.open(self.path, 'r:*')
+
+    def list_members(self, cancel_event):
+        files = []
+        gitignores = {}
+        for member in self.archive:
+            if cancel_event is not None and cancel_event.is_set():
+                raise pipeline.GenerationCancelled()
+            parts = member_parts(member.name)
+            if not member.isfile() or not parts:
+                continue
+            if parts[-1] == '.gitignore':
+                gitignores[parts[:-1]] = self.archive.extractfile(member).read().decode('utf-8', 'ignore').splitlines()
+            files.append((parts, member.size, float(member.mtime), member))
+        return files, gitignores
+
+    def open_member(self, member):
+        return self.archive.extractfile(member)
+
+    def preload(self, paths, limit=-1):
+        """按成员在包中的位置顺序读取一批文件的前limit字节（-1为全部）并保留在内存中，
+        压缩的tar只需顺序解压一遍"""
+        with self.lock:
+            members = []
+            for path in set(paths):
+                if path not in self.members:
+                    continue
+                if path not in self.preloaded or limit < 0 and not self.preloaded[path][1]:
+                    members.append((self.members[path].offset_data, path))
+                elif limit < 0:
+                    # 已预读的开头就是完整内容，改为等待完整读取
+                    self.preloaded[path] = self.preloaded[path][:2] + (False,)
+            for _, path in sorted(members):
+                member = self.members[path]
+                with self.open_member(member) as f:
+                    data = f.read(limit)
+                self.preloaded[path] = (data, len(data) == member.size, limit >= 0)
+
+    def close(self):
+        super().close()
+        self.archive.close()
@@ -0,0 +1,302 @@
+"""
+Copyright 2024 Longze
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+# 性能基准：生成合成项目目录，分阶段计时整个生成流程，结果输出为JSON
+# 完全离线运行，不需要图形界面。
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import docx_writer
+import file_cache
+import pipeline
+
+# 预设规模：文件数、目录深度、GBK文件比例、超大压缩文件数量
+PRESETS = {
+    'small': {'files': 200, 'depth': 3, 'gbk_ratio': 0.1, 'minified': 1},
+    'medium': {'files': 5000, 'depth': 6, 'gbk_ratio': 0.2, 'minified': 3},
+    'large': {'files': 50000, 'depth': 10, 'gbk_ratio': 0.2, 'minified': 5},
+}
+
+DEFAULT_EXT_MIX = 'py:4,java:3,js:2,css:1'
+
+# 计时的阶段，顺序与生成流程一致
+PHASES = ['discovery', 'extension_detection', 'estimation', 'selection', 'read_decode', 'build', 'save']
+
+# 合成代码行使用的片段
+IDENTIFIERS = ['user', 'order', 'config', 'handler', 'result', 'value', 'index', 'buffer', 'request', 'response']
+COMMENTS = ['处理用户请求', '读取配置文件', '更新订单状态', '初始化缓存', '校验输入参数', '写入日志']
+
+
+def parse_ext_mix(text):
+    """解析后缀权重，如 "py:4,java:3,js:2" """
+    mix = []
+    for item in text.split(','):
+        ext, _, weight = item.strip().partition(':')
+        if ext:
+            mix.append((ext.lstrip('.'), float(weight or 1)))
+    return mix
+
+
+def synthetic_line(rng, depth):
+    """生成一行看起来像代码的文本"""
+    indent = '    ' * depth
+    kind = rng.random()
+    if kind < 0.1:
+        return f"{indent}# {rng.choice(COMMENTS)}"
+    if kind < 0.15:
+        return ''
+    name = rng.choice(IDENTIFIERS)
+    other = rng.choice(IDENTIFIERS)
+    return f"{indent}{name}_{rng.randint(0, 99)} = process_{other}({name}, {rng.randint(0, 9999)})"
+
+
+def synthetic_source(rng, line_count):
+    """生成指定行数的合成源代码"""
+    lines = []
+    depth = 0
+    for _ in range(line_count):
+        lines.append(synthetic_line(rng, depth))
+        depth = max(0, min(4, depth + rng.choice((-1, 0, 0, 1))))
+    return '\n'.join(lines) + '\n'
+
+
+def minified_source(rng, size):
+    """生成单行的超大压缩文件内容"""
+    parts = []
+    total = 0
+    while total < size:
+        part = f"var {rng.choice(IDENTIFIERS)}{rng.randint(0, 999)}=function(a,b){{return a+b*{rng.randint(0, 99)}}};"
+        parts.append(part)
+        total += len(part)
+    return ''.join(parts)
+
+
+def generate_synthetic_repo(root, files=1000, depth=5, ext_mix=DEFAULT_EXT_MIX, gbk_ratio=0.2,
+                            median_lines=120, minified=2, minified_size=2 * 1024 * 1024, seed=0):
+    """在root下生成合成项目：行数呈对数正态分布，混合UTF-8/GBK编码，深层嵌套目录，
+    另外包含若干超大单行压缩文件以及node_modules、build等应被跳过的目录。返回生成的文件信息。
+    """
+    rng = random.Random(seed)
+    mix = parse_ext_mix(ext_mix)
+    extensions = [ext for ext, _ in mix]
+    weights = [weight for _, weight in mix]
+    total_bytes = 0
+
+    # 目录树：每层最多4个子目录，最深depth层；层数单独记录（根目录''为第0层）
+    levels = [('', 0)]
+    for level in range(depth):
+        parent = rng.choice([d for d, d_level in levels if d_level == level])
+        for branch in range(rng.randint(1, 4)):
+            levels.append((os.path.join(parent, f"pkg{level}_{branch}"), level + 1))
+    directories = [d for d, _ in levels]
+
+    for number in range(files):
+        ext = rng.choices(extensions, weights)[0]
+        directory = os.path.join(root, rng.choice(directories))
+        os.makedirs(directory, exist_ok=True)
+        line_count = max(1, int(rng.lognormvariate(0, 1) * median_lines))
+        encoding = 'gbk' if rng.random() < gbk_ratio else 'utf-8'
+        data = synthetic_source(rng, line_count).encode(encoding)
+        with open(os.path.join(directory, f"module_{number}.{ext}"), 'wb') as f:
+            f.write(data)
+        total_bytes += len(data)
+
+    # 超大压缩文件，放在项目根目录下的static中。文件名不带.min，不会按名称直接排除，
+    # 而是经过内容检查（平均行长）和行数估计识别出来
+    if minified:
+        static = os.path.join(root, 'static')
+        os.makedirs(static, exist_ok=True)
+        for number in range(minified):
+            data = minified_source(rng, minified_size).encode('utf-8')
+            with open(os.path.join(static, f"bundle_{number}.js"), 'wb') as f:
+                f.write(data)
+            total_bytes += len(data)
+
+    # 遍历时应被剪掉的目录
+    for skipped in ('node_modules', 'build', '.git'):
+        directory = os.path.join(root, skipped, 'nested')
+        os.makedirs(directory, exist_ok=True)
+        for number in range(20):
+            with open(os.path.join(directory, f"skipped_{number}.js"), 'w', encoding='utf-8') as f:
+                f.write(synthetic_source(rng, 50))
+
+    return {'files': files + minified, 'bytes': total_bytes, 'directories': len(directories)}
+
+
+def run_once(project_path, extensions, output_filename, backend, cache=None):
+    """完整执行一次生成流程，返回各阶段耗时（秒）和计数"""
+    timings = {}
+    counts = {}
+
+    start = time.perf_counter()
+    index = pipeline.scan_project(project_path)
+    timings['discovery'] = time.perf_counter() - start
+    counts['indexed_files'] = len(index)
+
+    start = time.perf_counter()
+    # 与界面选择路径后相同：逐层遍历目录并抽样检测后缀
+    detected = pipeline.detect_project_extensions(project_path).suggested
+    timings['extension_detection'] = time.perf_counter() - start
+    counts['detected_extensions'] = len(detected)
+
+    start = time.perf_counter()
+    candidates = pipeline.filter_index(index, pipeline.parse_extensions(extensions))
+    candidates = pipeline.drop_generated_names(candidates)
+    file_line_estimates, raw_contents = pipeline.estimate_line_counts(candidates, cache)
+    timings['estimation'] = time.perf_counter() - start
+    counts['candidates'] = len(candidates)
+
+    start = time.perf_counter()
+    content_filter = pipeline.ContentFilter(candidates, raw_contents, cache=cache)
+    processed_files, estimated_total_lines = pipeline.select_files(file_line_estimates, project_path,
+                                                                   content_filter=content_filter)
+    timings['selection'] = time.perf_counter() - start
+    counts['selected_files'] = len(processed_files)
+    counts['skipped_files'] = len(content_filter.skipped)
+
+    start = time.perf_counter()
+    front_code, back_code, total_lines, _ = pipeline.collect_code_windows(
+        processed_files, project_path, pipeline.FRONT_LINES, pipeline.BACK_LINES, raw_contents,
+        lambda index, message: None, cache)
+    timings['read_decode'] = time.perf_counter() - start
+    counts['total_lines'] = total_lines
+
+    start = time.perf_counter()
+    style, paragraphs = pipeline.prepare_layout(front_code, back_code, total_lines, '基准测试', 'V1.0', '测试')
+    if backend == 'python-docx':
+        document = docx_writer.create_docx(paragraphs, style)
+        timings['build'] = time.perf_counter() - start
+        start = time.perf_counter()
+        document.save(output_filename)
+        timings['save'] = time.perf_counter() - start
+    else:
+        # 流式后端边构建边写入，整个过程计入save
+        paragraphs = list(paragraphs)
+        timings['build'] = time.perf_counter() - start
+        start = time.perf_counter()
+        pipeline.OUTPUT_BACKENDS[backend](output_filename, paragraphs, style)
+        timings['save'] = time.perf_counter() - start
+    counts['output_bytes'] = os.path.getsize(output_filename)
+
+    timings['total'] = sum(timings[phase] for phase in PHASES)
+    return timings, counts
+
+
+def summarize(runs):
+    """汇总多次运行的各阶段耗时：最小值、中位数、最大值"""
+    summary = {}
+    for phase in PHASES + ['total']:
+        values = [timings[phase] for timings, _ in runs]
+        summary[phase] = {
+            'min': round(min(values), 6),
+            'median': round(statistics.median(values), 6),
+            'max': round(max(values), 6),
+        }
+    return summary
+
+
+def build_parser():
+    """命令行参数定义"""
+    parser = argparse.ArgumentParser(description="软著源代码生成器性能基准")
+    parser.add_argument('--preset', choices=list(PRESETS), default='small', help="预设规模")
+    parser.add_argument('--files', type=int, help="源文件数量（覆盖预设）")
+    parser.add_argument('--depth', type=int, help="目录嵌套深度（覆盖预设）")
+    parser.add_argument('--gbk-ratio', type=float, help="GBK编码文件比例（覆盖预设）")
+    parser.add_argument('--minified', type=int, help="超大单行压缩文件数量（覆盖预设）")
+    parser.add_argument('--minified-size', type=int, default=2 * 1024 * 1024, help="每个压缩文件的字节数")
+    parser.add_argument('--median-lines', type=int, default=120, help="源文件行数的中位数")
+    parser.add_argument('--ext-mix', default=DEFAULT_EXT_MIX, help="后缀及权重，如 py:4,java:3,js:2")
+    parser.add_argument('--extensions', help="生成时选择的后缀，默认为ext-mix中的全部后缀")
+    parser.add_argument('--backend', choices=list(pipeline.OUTPUT_BACKENDS), default='python-docx', help="生成方式")
+    parser.add_argument('--repeat', type=int, default=3, help="重复次数")
+    parser.add_argument('--cache', action='store_true', help="使用（初始为空的）文件缓存，第二次起为热缓存")
+    parser.add_argument('--seed', type=int, default=0, help="随机种子")
+    parser.add_argument('--project', help="对已有目录计时，而不是生成合成项目")
+    parser.add_argument('--keep', action='store_true', help="保留生成的合成项目目录")
+    parser.add_argument('--output', help="结果JSON文件，默认输出到标准输出")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    params = dict(PRESETS[args.preset])
+    for key in ('files', 'depth', 'gbk_ratio', 'minified'):
+        if getattr(args, key) is not None:
+            params[key] = getattr(args, key)
+    extensions = args.extensions or ','.join(ext for ext, _ in parse_ext_mix(args.ext_mix))
+
+    workdir = tempfile.mkdtemp(prefix='longze-bench-')
+    try:
+        repo = None
+        project_path = args.project
+        if project_path is None:
+            project_path = os.path.join(workdir, 'project')
+            start = time.perf_counter()
+            repo = generate_synthetic_repo(
+                project_path, params['files'], params['depth'], args.ext_mix, params['gbk_ratio'],
+                args.median_lines, params['minified'], args.minified_size, args.seed)
+            repo['generate_seconds'] = round(time.perf_counter() - start, 3)
+            print(f"合成项目已生成: {repo['files']}个文件，{repo['bytes'] / 1024 / 1024:.1f}MB", file=sys.stderr)
+
+        output_filename = os.path.join(workdir, 'output' + pipeline.BACKEND_EXTENSIONS.get(args.backend, '.docx'))
+        runs = []
+        cache_stats = []
+        for number in range(args.repeat):
+            # 每次运行重新打开缓存，与实际多次启动程序的情况一致
+            cache = file_cache.FileCache(os.path.join(workdir, 'cache')) if args.cache else None
+            try:
+                timings, counts = run_once(project_path, extensions, output_filename, args.backend, cache)
+            finally:
+                if cache is not None:
+                    cache_stats.append(cache.stats())
+                    cache.close()
+            runs.append((timings, counts))
+            print(f"第{number + 1}次: {timings['total']:.3f}s", file=sys.stderr)
+
+        result = {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'backend': args.backend,
+            'extensions': extensions,
+            'cache': cache_stats if args.cache else None,
+            'params': params if args.project is None else {'project': args.project},
+            'repo': repo,
+            'counts': runs[-1][1],
+            'phases': summarize(runs),
+            'runs': [{phase: round(value, 6) for phase, value in timings.items()} for timings, _ in runs],
+        }
+        text = json.dumps(result, ensure_ascii=False, indent=2)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                f.write(text)
+        else:
+            print(text)
+    finally:
+        if args.keep:
+            print(f"合成项目保留在: {workdir}", file=sys.stderr)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
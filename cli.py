@@ -0,0 +1,367 @@
+"""
+Copyright 2024 Longze
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+# 命令行入口：无界面生成单个文档，或按清单批量并行生成
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import archive_source
+import file_cache
+import git_source
+import instrumentation
+import pdf_writer
+import pipeline
+import watcher
+
+# 清单中每个任务可用的字段
+JOB_FIELDS = ['software_name', 'version', 'author', 'project_path', 'extensions', 'output', 'backend',
+              'prefer', 'avoid', 'keep_generated', 'revision', 'full_listing', 'volume_pages']
+
+
+def resolve_extensions(project_path, extensions, index, stats=None, source=None):
+    """未指定后缀时与图形界面一样自动检测：按估计的代码行数选出覆盖大部分代码的后缀（见pipeline.ExtensionHistogram）"""
+    if isinstance(extensions, (list, tuple)):
+        extensions = ','.join(extensions)
+    if extensions:
+        return extensions
+    if stats is None:
+        stats = instrumentation.RunStats()
+    with stats.phase('extension_detection'):
+        return ','.join(pipeline.extension_histogram(index, source, stats).suggested())
+
+
+def scan_index(project_path, stats, source=None):
+    """遍历项目目录（或列出source中的文件）建立文件索引，计入discovery阶段"""
+    with stats.phase('discovery'):
+        index = source.scan() if source is not None else pipeline.scan_project(project_path)
+        stats.add('files', len(index))
+    return index
+
+
+def open_source(project_path, revision=None):
+    """按项目路径和版本选择输入源：git版本、压缩包，或None（本地目录）"""
+    if revision:
+        return git_source.GitSource(project_path, revision)
+    if archive_source.is_archive(project_path):
+        return archive_source.open_archive(project_path)
+    return None
+
+
+def open_cache(options):
+    """按命令行选项打开文件缓存，options为None或禁用缓存时返回None"""
+    if not options or options.get('disabled'):
+        return None
+    return file_cache.open_cache(options.get('cache_dir'), options['max_bytes'], options['verify_content'])
+
+
+def cache_options(args):
+    """从命令行参数提取缓存选项（可传给子进程）"""
+    return {
+        'disabled': args.no_cache,
+        'cache_dir': args.cache_dir,
+        'max_bytes': args.cache_max_mb * 1024 * 1024,
+        'verify_content': args.verify_content,
+    }
+
+
+def run_job(job, cache_settings=None):
+    """执行单个生成任务（在子进程中运行），任何异常都只影响本任务"""
+    start = time.perf_counter()
+    result = {'software_name': job.get('software_name'), 'output': job.get('output')}
+    cache = None
+    source = None
+    stats = instrumentation.RunStats()
+    try:
+        cache = open_cache(cache_settings)
+        project_path = job.get('project_path')
+        if not project_path or not (os.path.isdir(project_path) or archive_source.is_archive(project_path)):
+            raise pipeline.GenerationError("请选择有效的项目路径")
+        source = open_source(project_path, job.get('revision'))
+        index = scan_index(project_path, stats, source)
+        generated = pipeline.generate_document(
+            job.get('software_name'), job.get('version'), job.get('author'), project_path,
+            resolve_extensions(project_path, job.get('extensions'), index, stats, source),
+            output_filename=job.get('output'), backend=job.get('backend') or pipeline.default_backend(job.get('full_listing')),
+            index=index, cache=cache, stats=stats,
+            rules=pipeline.priority_rules(job.get('prefer') or (), job.get('avoid') or ()),
+            skip_generated=not job.get('keep_generated'), source=source,
+            full_listing=bool(job.get('full_listing')), volume_pages=job.get('volume_pages'))
+        result.update(ok=True, output=generated.output_filename, total_lines=generated.total_lines,
+                      file_count=generated.file_count, warnings=generated.warnings)
+        if generated.volumes and len(generated.volumes) > 1:
+            result['volumes'] = generated.volumes
+    except Exception as e:
+        result.update(ok=False, error=str(e))
+    finally:
+        if source is not None:
+            source.close()
+        if cache is not None:
+            result['cache'] = cache.stats()
+            cache.close()
+    result['seconds'] = round(time.perf_counter() - start, 3)
+    result['stats'] = stats.to_dict()
+    return result
+
+
+def load_manifest(manifest_path, output_dir, backend):
+    """读取批量清单（JSON数组，或包含jobs数组的对象），补全默认值并检查输出冲突"""
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get('jobs', [])
+    if not isinstance(data, list):
+        raise pipeline.GenerationError("清单格式错误：应为任务数组")
+
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    jobs = []
+    outputs = {}
+    for number, item in enumerate(data, 1):
+        if not isinstance(item, dict):
+            raise pipeline.GenerationError(f"清单第{number}项格式错误：应为对象")
+        unknown = set(item) - set(JOB_FIELDS)
+        if unknown:
+            raise pipeline.GenerationError(f"清单第{number}项包含未知字段: {', '.join(sorted(unknown))}")
+        job = dict(item)
+        # 相对路径以清单所在目录为基准
+        if job.get('project_path'):
+            job['project_path'] = os.path.join(base_dir, job['project_path'])
+        job.setdefault('backend', backend or pipeline.default_backend(job.get('full_listing')))
+        if not job.get('output'):
+            job['output'] = pipeline.default_output_filename(job.get('software_name') or f"任务{number}", job['backend'])
+        job['output'] = os.path.join(output_dir, job['output'])
+        for key in ('prefer', 'avoid'):
+            if isinstance(job.get(key), str):
+                job[key] = [job[key]]
+        key = os.path.normcase(os.path.abspath(job['output']))
+        if key in outputs:
+            raise pipeline.GenerationError(f"清单第{outputs[key]}项和第{number}项的输出文件相同: {job['output']}，请为其指定output")
+        outputs[key] = number
+        jobs.append(job)
+    return jobs
+
+
+def run_batch(jobs, workers, cache_settings=None):
+    """在进程池中并行执行任务，按完成顺序返回结果；子进程崩溃也只记为该任务失败"""
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run_job, job, cache_settings): job for job in jobs}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {'software_name': job.get('software_name'), 'output': job.get('output'),
+                          'ok': False, 'error': f"任务进程异常退出: {e}", 'seconds': None}
+            print_result(result)
+            results.append(result)
+    return results
+
+
+def print_result(result):
+    """输出单个任务的结果"""
+    if result['ok']:
+        print(f"[完成] {result['software_name']} {result['seconds']:.2f}s "
+              f"{result['total_lines']}行 -> {result['output']}")
+        for warning in result.get('warnings', []):
+            print(f"  警告: {warning}")
+        if 'cache' in result:
+            print(f"  缓存: 命中{result['cache']['hits']} 未命中{result['cache']['misses']}")
+    else:
+        print(f"[失败] {result['software_name']}: {result['error']}")
+
+
+def command_generate(args):
+    """generate子命令：生成单个文档"""
+    def report(message=None, progress=None):
+        if message and args.verbose:
+            print(message, file=sys.stderr)
+
+    cache = open_cache(cache_options(args))
+    stats = instrumentation.RunStats()
+    source = None
+    backend = args.backend or pipeline.default_backend(args.full_listing)
+    try:
+        with instrumentation.profiled(args.profile):
+            source = open_source(args.path, args.revision)
+            index = scan_index(args.path, stats, source) if source is not None or os.path.isdir(args.path) else []
+            result = pipeline.generate_document(
+                args.name, args.version, args.author, args.path,
+                resolve_extensions(args.path, args.ext, index, stats, source),
+                output_filename=args.output, backend=backend, index=index, report=report, cache=cache,
+                stats=stats, rules=pipeline.priority_rules(args.prefer, args.avoid),
+                skip_generated=not args.keep_generated, source=source,
+                full_listing=args.full_listing, volume_pages=args.volume_pages)
+    except pipeline.GenerationError as e:
+        print(f"错误: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if source is not None:
+            source.close()
+        if cache is not None:
+            cache.close()
+            print(cache.describe(), file=sys.stderr)
+        if args.stats:
+            write_stats(stats, args.stats, backend=backend, output=args.output)
+    for warning in result.warnings:
+        print(f"警告: {warning}", file=sys.stderr)
+    if result.volumes and len(result.volumes) > 1:
+        print(f"文档已生成: 共{len(result.volumes)}册，{result.volumes[0]} ~ {result.volumes[-1]}"
+              f"（{result.file_count}个文件，{result.total_lines}行代码）")
+    else:
+        print(f"文档已生成: {result.output_filename}（{result.file_count}个文件，{result.total_lines}行代码）")
+    return 0
+
+
+def command_watch(args):
+    """watch子命令：监视项目目录，源文件变化后重新生成文档"""
+    def report(message=None, progress=None):
+        print(f"[{time.strftime('%H:%M:%S')}] {message}", file=sys.stderr)
+
+    try:
+        index = pipeline.scan_project(args.path) if os.path.isdir(args.path) else []
+        document_watcher = watcher.DocumentWatcher(
+            args.name, args.version, args.author, args.path, resolve_extensions(args.path, args.ext, index),
+            args.output or pipeline.default_output_filename(args.name, args.backend), backend=args.backend,
+            rules=pipeline.priority_rules(args.prefer, args.avoid), skip_generated=not args.keep_generated,
+            debounce=args.debounce, interval=args.interval, polling=args.polling, report=report)
+    except pipeline.GenerationError as e:
+        print(f"错误: {e}", file=sys.stderr)
+        return 1
+    try:
+        document_watcher.run()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def write_stats(stats, destination, **extra):
+    """输出运行统计：destination为-时以文本打印到标准输出，否则写入JSON文件"""
+    if destination == '-':
+        print(stats.describe())
+    else:
+        stats.write(destination, **extra)
+
+
+def command_batch(args):
+    """batch子命令：按清单批量生成"""
+    try:
+        jobs = load_manifest(args.manifest, args.output_dir, args.backend)
+    except (OSError, ValueError, pipeline.GenerationError) as e:
+        print(f"错误: 无法读取清单 {args.manifest}: {e}", file=sys.stderr)
+        return 1
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    results = run_batch(jobs, args.workers, cache_options(args))
+    elapsed = time.perf_counter() - start
+    failed = [r for r in results if not r['ok']]
+    print(f"共{len(results)}个任务，成功{len(results) - len(failed)}个，失败{len(failed)}个，用时{elapsed:.2f}s")
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump({'seconds': round(elapsed, 3), 'jobs': results}, f, ensure_ascii=False, indent=2)
+    return 1 if failed else 0
+
+
+def build_parser():
+    """命令行参数定义"""
+    parser = argparse.ArgumentParser(description="Longze软著源代码生成器（命令行版）")
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    generate = subparsers.add_parser('generate', help="生成单个文档")
+    generate.add_argument('--name', required=True, help="软件名称")
+    generate.add_argument('--version', required=True, help="版本号")
+    generate.add_argument('--author', required=True, help="著作权人")
+    generate.add_argument('--path', required=True, help="项目路径，也可以是zip或tar压缩包（无需解压）")
+    generate.add_argument('--revision', help="git版本（标签、分支或提交）：直接从--path所在仓库的该版本读取，无需检出")
+    generate.add_argument('--ext', help="文件后缀，英文逗号分隔；省略时自动检测")
+    generate.add_argument('--output', help="输出文件，默认为[软件名称]源代码.docx")
+    generate.add_argument('--backend', choices=list(pipeline.OUTPUT_BACKENDS),
+                          help="生成方式，默认为python-docx（完整清单默认为stream）")
+    generate.add_argument('--prefer', action='append', default=[], metavar='PATTERN',
+                          help="优先选择并排在文档开头的文件，如 main.py 或 core/（目录），可重复指定")
+    generate.add_argument('--avoid', action='append', default=[], metavar='PATTERN',
+                          help="尽量不选择、选中时排在文档末尾的文件，可重复指定")
+    generate.add_argument('--keep-generated', action='store_true',
+                          help="不跳过锁文件、生成或压缩的代码以及内容重复的文件")
+    generate.add_argument('--full-listing', action='store_true',
+                          help="输出所有匹配文件的完整清单，而不是前后各30页（需要stream或pdf生成方式）")
+    generate.add_argument('--volume-pages', type=int, metavar='N',
+                          help="完整清单每册的页数，超出时分为多个文件（文件名后加册号），页码在各册间接续")
+    generate.add_argument('-v', '--verbose', action='store_true', help="输出处理过程")
+    generate.add_argument('--stats', nargs='?', const='-', metavar='FILE',
+                          help="输出各阶段的耗时、文件数、读取字节数和峰值内存；指定FILE时写入JSON文件")
+    generate.add_argument('--profile', metavar='FILE', help="用cProfile记录本次运行并保存到FILE（python -m pstats FILE查看）")
+    generate.set_defaults(func=command_generate)
+
+    batch = subparsers.add_parser('batch', help="按清单批量并行生成")
+    batch.add_argument('manifest', help="JSON清单，每项包含software_name、version、author、project_path、extensions")
+    batch.add_argument('--output-dir', default='.', help="输出目录")
+    batch.add_argument('--workers', type=int, default=None, help="并行进程数，默认为CPU核数")
+    batch.add_argument('--backend', choices=list(pipeline.OUTPUT_BACKENDS),
+                       help="默认生成方式，默认为python-docx（完整清单默认为stream）")
+    batch.add_argument('--report', help="将每个任务的结果和各阶段统计写入JSON文件")
+    batch.set_defaults(func=command_batch)
+    for subparser in (generate, batch):
+        subparser.add_argument('--no-cache', action='store_true', help="不使用文件缓存")
+        subparser.add_argument('--cache-dir', help=f"缓存目录，默认为{file_cache.default_cache_dir()}")
+        subparser.add_argument('--cache-max-mb', type=int, default=file_cache.DEFAULT_MAX_BYTES // (1024 * 1024),
+                               help="缓存总大小上限（MB），超出时淘汰最久未使用的记录")
+        subparser.add_argument('--verify-content', action='store_true',
+                               help="修改时间变化但大小相同的文件比较内容摘要，内容未变仍使用缓存")
+
+    watch = subparsers.add_parser('watch', help="监视项目目录，源文件保存后自动重新生成文档")
+    watch.add_argument('--name', required=True, help="软件名称")
+    watch.add_argument('--version', required=True, help="版本号")
+    watch.add_argument('--author', required=True, help="著作权人")
+    watch.add_argument('--path', required=True, help="项目目录")
+    watch.add_argument('--ext', help="文件后缀，英文逗号分隔；省略时自动检测")
+    watch.add_argument('--output', help="输出文件，默认为[软件名称]源代码.docx")
+    watch.add_argument('--backend', choices=list(pipeline.OUTPUT_BACKENDS), default='stream',
+                       help="生成方式，默认为stream（只重新生成变化的页）")
+    watch.add_argument('--prefer', action='append', default=[], metavar='PATTERN',
+                       help="优先选择并排在文档开头的文件，可重复指定")
+    watch.add_argument('--avoid', action='append', default=[], metavar='PATTERN',
+                       help="尽量不选择、选中时排在文档末尾的文件，可重复指定")
+    watch.add_argument('--keep-generated', action='store_true',
+                       help="不跳过锁文件、生成或压缩的代码以及内容重复的文件")
+    watch.add_argument('--debounce', type=float, default=watcher.DEFAULT_DEBOUNCE,
+                       help="最后一次变化后等待的秒数，期间的多次保存合并为一次重新生成")
+    watch.add_argument('--interval', type=float, default=watcher.DEFAULT_INTERVAL,
+                       help="轮询方式重新遍历目录的间隔（秒）")
+    watch.add_argument('--polling', action='store_true', help="定时轮询目录，不使用inotify（如网络文件系统）")
+    watch.set_defaults(func=command_watch)
+    for subparser in (generate, batch, watch):
+        subparser.add_argument('--pdf-font', help="PDF中代码使用的等宽TrueType字体（.ttf/.ttc），默认自动查找")
+        subparser.add_argument('--pdf-cjk-font', help="PDF中中文使用的TrueType字体（.ttf/.ttc），默认自动查找宋体等")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    # 通过环境变量传给PDF后端（批量模式的子进程会继承）
+    if args.pdf_font:
+        os.environ[pdf_writer.FONT_ENV] = args.pdf_font
+    if args.pdf_cjk_font:
+        os.environ[pdf_writer.CJK_FONT_ENV] = args.pdf_cjk_font
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
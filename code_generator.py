@@ -14,23 +14,50 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 import os
+import queue
 import sys
+import threading
+import time
+# 启动计时的起点。这里只导入显示界面需要的模块，python-docx、lxml和sqlite3在窗口显示后
+# 由后台线程导入（见SourceCodeGenerator.warm_up），不拖慢双击后窗口出现的时间
+STARTED = time.perf_counter()
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
-from docx import Document
-from docx.shared import Pt, Cm
-from docx.enum.text import WD_ALIGN_PARAGRAPH, WD_BREAK
-from docx.enum.table import WD_ALIGN_VERTICAL
-from docx.oxml import OxmlElement
-from docx.oxml.ns import qn
-import glob
-import re
+import instrumentation
+import pipeline
+from pipeline import OUTPUT_BACKENDS, GenerationCancelled, GenerationError
+IMPORTED = time.perf_counter()
+
+# 后台线程消息的轮询间隔（毫秒），限制界面刷新频率
+POLL_INTERVAL_MS = 100
+
+# 启动计时模式的命令行参数及默认的报告文件
+STARTUP_TIMING_ARG = '--startup-timing'
+STARTUP_TIMING_FILE = 'startup-timing.json'
+
+# 后缀检测完成后在状态栏中列出的后缀数
+DETECTION_SUMMARY_ROWS = 3
+
+
+def format_count(count):
+    """状态栏中的数量：一万以上以“万”为单位"""
+    return f"{count / 10000:.1f}万" if count >= 10000 else str(count)
+
+
+def describe_detection(detection):
+    """后缀检测结果的摘要：后缀种类数，以及估计行数最多的几种后缀的文件数和行数"""
+    rows = [row for row in detection.rows if not row.binary]
+    summary = '，'.join(f"{row.ext} {format_count(row.files)}个文件约{format_count(row.lines)}行"
+                       for row in rows[:DETECTION_SUMMARY_ROWS])
+    scope = f"抽样{format_count(detection.files)}个文件，" if detection.index is None else ''
+    return f"检测到 {len(detection.rows)} 种文件类型（{scope}{summary}）"
+
 
 class SourceCodeGenerator:
     def __init__(self, root):
         self.root = root
         self.root.title("Longze软著源代码生成器")
-        self.root.geometry("600x400")
+        self.root.geometry("600x490")
         self.root.resizable(False, False)
         
         # 创建主框架
@@ -71,20 +98,82 @@ class SourceCodeGenerator:
         self.file_extensions.grid(row=4, column=1, sticky=tk.W, pady=10)
         ttk.Label(main_frame, text="指定多个文件请使用英文逗号分隔").grid(row=5, column=1, sticky=tk.W)
         
+        # 文档生成方式
+        ttk.Label(main_frame, text="生成方式:").grid(row=6, column=0, sticky=tk.W, pady=10)
+        self.docx_backend = ttk.Combobox(main_frame, values=list(OUTPUT_BACKENDS), state="readonly", width=47)
+        self.docx_backend.grid(row=6, column=1, sticky=tk.W, pady=10)
+        self.docx_backend.set('python-docx')
+        
+        # 性能诊断：在文档旁边写入各阶段统计报告，或用cProfile记录整个生成过程
+        diagnostics_frame = ttk.Frame(main_frame)
+        diagnostics_frame.grid(row=7, column=1, sticky=tk.W)
+        self.write_stats = tk.BooleanVar(value=False)
+        ttk.Checkbutton(diagnostics_frame, text="记录性能报告", variable=self.write_stats).pack(side=tk.LEFT)
+        self.write_profile = tk.BooleanVar(value=False)
+        ttk.Checkbutton(diagnostics_frame, text="记录性能分析(cProfile)", variable=self.write_profile).pack(side=tk.LEFT, padx=20)
+        
         # 按钮区域
         button_frame = ttk.Frame(main_frame)
-        button_frame.grid(row=6, column=0, columnspan=2, pady=30)
+        button_frame.grid(row=8, column=0, columnspan=2, pady=30)
         
-        ttk.Button(button_frame, text="生成", command=self.generate_document, width=20).pack(side=tk.LEFT, padx=10)
-        ttk.Button(button_frame, text="取消", command=root.quit, width=20).pack(side=tk.LEFT, padx=10)
+        self.generate_button = ttk.Button(button_frame, text="生成", command=self.generate_document, width=20)
+        self.generate_button.pack(side=tk.LEFT, padx=10)
+        ttk.Button(button_frame, text="取消", command=self.cancel, width=20).pack(side=tk.LEFT, padx=10)
         
         # 进度条
         self.progress = ttk.Progressbar(main_frame, orient="horizontal", length=560, mode="determinate")
-        self.progress.grid(row=7, column=0, columnspan=2, pady=10)
+        self.progress.grid(row=9, column=0, columnspan=2, pady=10)
         
         # 状态标签
-        self.status_label = ttk.Label(main_frame, text="")
-        self.status_label.grid(row=8, column=0, columnspan=2)
+        self.status_label = ttk.Label(main_frame, text="", wraplength=560)
+        self.status_label.grid(row=10, column=0, columnspan=2)
+        
+        # 后缀检测完整遍历目录时留下的文件索引：(项目路径, FileEntry列表, 统计)，只供紧接着的一次生成使用
+        self.file_index = None
+        
+        # 后台生成线程、与界面通信的消息队列和取消标志
+        self.worker = None
+        self.messages = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.warmed = threading.Event()
+        
+        # 后台后缀检测：当前检测的取消标志（没有进行中的检测时为None）、消息队列，
+        # 以及是否已安排轮询（同一时刻最多只有一个轮询）
+        self.detection = None
+        self.detections = queue.Queue()
+        self.detection_polling = False
+    
+    def warm_up(self, timer=None):
+        """窗口显示后在后台线程中导入生成文档才用到的库，点击生成时无需再等待
+        
+        导入失败（如未安装python-docx）时不做处理，生成时再报告错误。timer为StartupTimer，记录完成的时刻。
+        """
+        def run():
+            try:
+                import docx_writer
+                import file_cache
+            except ImportError:
+                pass
+            if timer is not None:
+                timer.mark('warm_up')
+            self.warmed.set()
+        
+        threading.Thread(target=run, daemon=True).start()
+    
+    def get_file_index(self, path):
+        """获取项目的文件索引，返回(FileEntry列表, 建立索引的统计)
+        
+        后缀检测留下的同一路径的索引只使用一次，之后的每次生成都重新遍历：
+        文件缓存按索引中的大小和修改时间判断文件是否变化，过期的索引会使修改过的文件仍使用旧内容，也看不到新增的文件。
+        """
+        cached, self.file_index = self.file_index, None
+        if cached is not None and cached[0] == path:
+            return cached[1], cached[2]
+        stats = instrumentation.RunStats()
+        with stats.phase('discovery'):
+            index = pipeline.scan_project(path, self.cancel_event)
+            stats.add('files', len(index))
+        return index, stats
     
     def select_path(self):
         """选择项目路径"""
@@ -92,87 +181,98 @@ class SourceCodeGenerator:
         if path:
             self.project_path.delete(0, tk.END)
             self.project_path.insert(0, path)
-            # 自动检测文件后缀
+            # 在后台自动检测文件后缀
             self.detect_file_extensions(path)
     
     def detect_file_extensions(self, path):
-        """自动检测目录中的文件后缀"""
+        """在后台线程中检测目录中的文件后缀，完成后由主线程填入；再次选择路径、点击取消或开始生成时中止"""
+        self.stop_detection()
         if not path or not os.path.exists(path):
             return
-            
-        self.update_status("正在检测项目中的文件类型...")
         
-        # 获取所有文件
-        all_files = []
-        for root, dirs, files in os.walk(path):
-            for file in files:
-                all_files.append(os.path.join(root, file))
-                
-        # 提取后缀
-        extensions = set()
-        for file in all_files:
-            ext = os.path.splitext(file)[1]
-            if ext and not ext.startswith('.git'):  # 排除git相关文件
-                extensions.add(ext.lstrip('.'))
-                
-        # 按常见编程语言排序
-        common_exts = ['java', 'py', 'js', 'html', 'css', 'xml', 'json', 'c', 'cpp', 'h', 'hpp', 'cs', 'php', 'go', 'rs', 'ts', 'vue', 'jsx', 'tsx']
-        sorted_exts = sorted(extensions, key=lambda x: (x not in common_exts, x))
+        self.update_status("正在检测项目中的文件类型...")
         
-        if sorted_exts:
-            self.file_extensions.delete(0, tk.END)
-            self.file_extensions.insert(0, ','.join(sorted_exts[:10]))  # 最多显示10个后缀
-            self.update_status(f"检测到 {len(sorted_exts)} 种文件类型")
-    
-    def update_status(self, message):
-        """更新状态信息"""
-        self.status_label.config(text=message)
-        self.root.update()
+        # 路径可能刚被更换或内容已变化，之前的索引作废
+        self.file_index = None
+        self.detection = threading.Event()
+        threading.Thread(target=self.run_detection, args=(path, self.detection), daemon=True).start()
+        if not self.detection_polling:
+            self.detection_polling = True
+            self.root.after(POLL_INTERVAL_MS, self.poll_detection)
     
-    def add_page_number(self, doc):
-        """添加页脚（著作权人全称）"""
-        for section in doc.sections:
-            footer = section.footer
-            # 清除现有段落并创建新段落
-            if footer.paragraphs:
-                p = footer.paragraphs[0]
-            else:
-                p = footer.add_paragraph()
-                
-            # 设置对齐方式
-            p.alignment = WD_ALIGN_PARAGRAPH.CENTER
-            
-            # 添加著作权人全称
-            author_run = p.add_run(f"著作权人: {self.author.get()}")
-            author_run.font.size = Pt(10)
+    def stop_detection(self):
+        """中止进行中的后缀检测，返回是否有进行中的检测"""
+        if self.detection is None:
+            return False
+        self.detection.set()
+        self.detection = None
+        return True
     
-    def calculate_optimal_line_spacing(self, doc, total_lines, target_pages=60):
-        """计算最佳行距以确保文档正好是指定页数"""
-        # 估计每页的基本行数
-        base_lines_per_page = 50
+    def run_detection(self, path, cancel_event):
+        """后台线程中执行的后缀检测，消息带上cancel_event，主线程据此丢弃已中止的检测的消息"""
+        def report(message):
+            self.detections.put((cancel_event, 'status', message))
         
-        # 计算总页数
-        lines_per_page = total_lines / target_pages if total_lines > 0 else base_lines_per_page
+        stats = instrumentation.RunStats()
+        try:
+            with stats.phase('extension_detection'):
+                detection = pipeline.detect_project_extensions(path, cancel_event, report, stats)
+                stats.add('files', detection.files)
+        except GenerationCancelled:
+            return
+        except Exception as e:
+            self.detections.put((cancel_event, 'error', str(e)))
+            return
+        self.detections.put((cancel_event, 'done', (path, detection, stats)))
+    
+    def poll_detection(self):
+        """在主线程中处理后缀检测线程的消息，检测结束后停止轮询"""
+        status = None
+        while True:
+            try:
+                cancel_event, kind, payload = self.detections.get_nowait()
+            except queue.Empty:
+                break
+            if cancel_event is not self.detection:
+                continue
+            if kind == 'status':
+                status = payload
+                continue
+            status = None
+            self.detection = None
+            if kind == 'done':
+                self.apply_detection(*payload)
+            else:
+                self.update_status(f"检测文件类型失败: {payload}")
         
-        # 调整行距来控制页面数量
-        if lines_per_page < base_lines_per_page * 0.8:
-            # 如果每页行数少于标准行数，则增加行距，但限制在合理范围内
-            lines_ratio = base_lines_per_page / max(lines_per_page, 1)
-            # 限制最大行距为2.0，最小为1.0
-            optimal_spacing = min(2.0, max(1.0, lines_ratio))
-        elif lines_per_page > base_lines_per_page * 1.2:
-            # 如果每页行数多于标准行数，则减小行距，确保内容不会超出页面
-            lines_ratio = lines_per_page / base_lines_per_page
-            # 限制最小行距为0.8，以保持可读性
-            optimal_spacing = max(0.8, 1.0 / lines_ratio)
+        if status is not None:
+            self.update_status(status)
+        if self.detection is not None:
+            self.root.after(POLL_INTERVAL_MS, self.poll_detection)
         else:
-            # 刚好合适
-            optimal_spacing = 1.0
-            
-        return optimal_spacing
-
+            self.detection_polling = False
+    
+    def apply_detection(self, path, detection, stats):
+        """填入检测到的后缀；完整遍历了目录时保留文件索引，生成时不再重新遍历"""
+        if detection.index is not None:
+            self.file_index = (path, detection.index, stats)
+        if not detection.suggested:
+            self.update_status("未检测到源代码文件")
+            return
+        self.file_extensions.delete(0, tk.END)
+        self.file_extensions.insert(0, ','.join(detection.suggested))
+        self.update_status(describe_detection(detection))
+    
+    def update_status(self, message):
+        """更新状态信息（只能在主线程调用）"""
+        self.status_label.config(text=message)
+        self.root.update_idletasks()
+    
     def generate_document(self):
-        """生成文档"""
+        """生成文档：在主线程校验输入，然后交给后台线程执行"""
+        if self.worker is not None and self.worker.is_alive():
+            return
+        
         # 获取输入
         software_name = self.software_name.get().strip()
         version = self.version.get().strip()
@@ -180,9 +280,6 @@ class SourceCodeGenerator:
         project_path = self.project_path.get().strip()
         extensions = self.file_extensions.get().strip()
         
-        # 默认字体大小
-        font_size = 10  # 确保font_size在函数开始就定义
-        
         # 验证输入
         if not software_name:
             messagebox.showerror("错误", "请输入软件名称")
@@ -200,327 +297,171 @@ class SourceCodeGenerator:
             messagebox.showerror("错误", "请输入至少一个文件后缀")
             return
         
+        # 重置进度条
+        self.progress["maximum"] = pipeline.PROGRESS_DONE
+        self.progress["value"] = 0
+        self.update_status("开始收集源代码文件...")
+        
+        # 生成时会自行遍历目录，不再等待后缀检测
+        self.stop_detection()
+        self.cancel_event.clear()
+        self.generate_button.config(state=tk.DISABLED)
+        self.worker = threading.Thread(
+            target=self.run_generation,
+            args=(software_name, version, author, project_path, extensions, self.docx_backend.get(),
+                  self.write_stats.get(), self.write_profile.get()),
+            daemon=True,
+        )
+        self.worker.start()
+        self.root.after(POLL_INTERVAL_MS, self.poll_messages)
+    
+    def cancel(self):
+        """取消按钮：生成过程中取消当前任务，检测后缀时中止检测，空闲时退出程序"""
+        if self.worker is not None and self.worker.is_alive():
+            self.cancel_event.set()
+            self.update_status("正在取消...")
+        elif self.stop_detection():
+            self.update_status("已取消文件类型检测")
+        else:
+            self.root.quit()
+    
+    def report(self, message=None, progress=None):
+        """后台线程发送状态和进度，由主线程定时批量刷新到界面"""
+        self.messages.put(('status', message, progress))
+    
+    def poll_messages(self):
+        """在主线程中处理后台线程的消息，每个周期只刷新一次界面"""
+        status = None
+        progress = None
+        finished = False
+        while True:
+            try:
+                kind, *payload = self.messages.get_nowait()
+            except queue.Empty:
+                break
+            if kind == 'status':
+                message, value = payload
+                if message is not None:
+                    status = message
+                if value is not None:
+                    progress = value
+                continue
+            
+            # 弹窗前先刷新已累积的状态
+            if status is not None:
+                self.update_status(status)
+                status = None
+            if progress is not None:
+                self.progress["value"] = progress
+                progress = None
+            if kind == 'warning':
+                messagebox.showwarning("警告", payload[0])
+            elif kind == 'done':
+                messagebox.showinfo("成功", payload[0])
+                finished = True
+            elif kind == 'error':
+                messagebox.showerror("错误", payload[0])
+                finished = True
+            elif kind == 'cancelled':
+                self.progress["value"] = 0
+                self.update_status("已取消生成")
+                finished = True
+        
+        if status is not None:
+            self.update_status(status)
+        if progress is not None:
+            self.progress["value"] = progress
+        
+        if finished or not self.worker.is_alive():
+            self.generate_button.config(state=tk.NORMAL)
+        else:
+            self.root.after(POLL_INTERVAL_MS, self.poll_messages)
+    
+    def run_generation(self, software_name, version, author, project_path, extensions, backend,
+                       write_stats=False, write_profile=False):
+        """后台线程中执行的生成流程"""
+        import file_cache
+        cache = file_cache.open_cache()
+        output_filename = pipeline.default_output_filename(software_name, backend)
+        profile_path = f"{output_filename}.prof" if write_profile else None
         try:
-            # 重置进度条
-            self.progress["value"] = 0
-            self.update_status("开始收集源代码文件...")
-            
-            # 解析文件后缀
-            ext_list = [ext.strip() for ext in extensions.split(",")]
-            ext_list = [ext if ext.startswith(".") else f".{ext}" for ext in ext_list]
-            
-            # 收集所有匹配的文件
-            all_files = []
-            for ext in ext_list:
-                files = glob.glob(f"{project_path}/**/*{ext}", recursive=True)
-                all_files.extend(files)
-            
-            if not all_files:
-                messagebox.showerror("错误", f"在指定路径下未找到任何匹配的文件")
-                return
-            
-            # 文件过多时的处理策略
-            target_line_count = 3000  # 目标行数，对应60页，每页50行
-            max_files = 100  # 最大文件数限制
-            
-            # 如果文件过多，选择最有代表性的文件
-            if len(all_files) > max_files:
-                self.update_status(f"发现{len(all_files)}个文件，超过处理限制，将选择最有代表性的{max_files}个文件...")
-                
-                # 根据文件大小和修改时间排序（优先选择较大的和较新的文件）
-                all_files.sort(key=lambda f: (os.path.getsize(f), os.path.getmtime(f)), reverse=True)
-                all_files = all_files[:max_files]
-            
-            # 收集所有代码行
-            all_code_lines = []
-            file_boundaries = []  # 记录每个文件的起始行和结束行
-            estimated_total_lines = 0  # 估计总行数
-            processed_files = []  # 实际处理的文件
-            
-            # 首先估计每个文件的行数
-            file_line_estimates = []
-            for file_path in all_files:
-                try:
-                    # 快速估计文件行数
-                    with open(file_path, 'rb') as f:
-                        # 计算文件中的换行符数量
-                        line_count = sum(1 for _ in f.read().split(b'\n'))
-                    file_line_estimates.append((file_path, line_count))
-                except:
-                    # 如果无法读取，假设一个默认值
-                    file_line_estimates.append((file_path, 50))
-            
-            # 按行数从大到小排序
-            file_line_estimates.sort(key=lambda x: x[1], reverse=True)
-            
-            # 限制总行数在4000-6000行之间，这样处理后会更接近60页
-            max_total_lines = 6000
-            min_total_lines = 4000
-            
-            # 首先选取最重要的文件，直到达到最小行数要求
-            for file_path, line_count in file_line_estimates:
-                estimated_total_lines += line_count
-                processed_files.append(file_path)
-                
-                # 如果已经超过最小行数且文件数超过10个，可以停止添加
-                if estimated_total_lines >= min_total_lines and len(processed_files) >= 10:
-                    break
-                    
-                # 如果已经超过最大行数，停止添加
-                if estimated_total_lines >= max_total_lines:
-                    break
-            
-            self.update_status(f"选择了{len(processed_files)}/{len(all_files)}个文件进行处理，估计总行数约{estimated_total_lines}行")
-            
-            # 实际处理选定的文件
-            for i, file_path in enumerate(processed_files):
-                # 更新进度
-                self.progress["value"] = i + 1
-                self.update_status(f"收集文件 {i+1}/{len(processed_files)}: {os.path.basename(file_path)}")
-                
-                # 读取文件内容
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                except UnicodeDecodeError:
-                    try:
-                        with open(file_path, 'r', encoding='gbk') as f:
-                            content = f.read()
-                    except (UnicodeDecodeError, PermissionError, OSError) as e:
-                        self.update_status(f"警告: 无法读取文件 {file_path}，原因: {str(e)}，跳过")
-                        continue
-                except (PermissionError, OSError) as e:
-                    self.update_status(f"警告: 无法读取文件 {file_path}，原因: {str(e)}，跳过")
-                    continue
-                
-                # 添加文件内容
-                lines = content.split('\n')
-                
-                # 记录文件边界
-                start_line = len(all_code_lines)
-                all_code_lines.extend(lines)
-                end_line = len(all_code_lines)
-                
-                # 记录文件信息
-                relative_path = os.path.relpath(file_path, project_path)
-                file_boundaries.append((relative_path, start_line, end_line))
-            
-            # 计算总行数
-            total_lines = len(all_code_lines)
-            self.update_status(f"总共收集了 {total_lines} 行代码")
-            
-            # 更新进度条
-            self.progress["maximum"] = len(processed_files) + 1
-            self.progress["value"] = 1
-            self.update_status(f"找到 {len(processed_files)} 个文件，开始处理...")
-            
-            # 创建文档
-            doc = Document()
-            
-            # 设置页面边距
-            sections = doc.sections
-            for section in sections:
-                section.top_margin = Cm(2.54)
-                section.bottom_margin = Cm(2.54)
-                section.left_margin = Cm(3.17)
-                section.right_margin = Cm(3.17)
-            
-            # 计算前30页和后30页的行数
-            lines_per_page = 50  # 每页固定50行
-            front_pages = 30
-            back_pages = 30
-            total_pages = front_pages + back_pages  # 应该是60页
-            
-            front_lines = front_pages * lines_per_page
-            back_lines = back_pages * lines_per_page
-            
-            # 添加页眉
-            header = doc.sections[0].header
-            header_para = header.paragraphs[0]
-            header_para.text = f"{software_name} {version}"
-            header_para.alignment = WD_ALIGN_PARAGRAPH.LEFT
-            
-            # 添加右上角页码信息
-            header_table = header.add_table(1, 2, width=Cm(16))
-            # 左侧为软件名称和版本号
-            cell_left = header_table.cell(0, 0)
-            cell_left.text = f"{software_name} {version}"
-            cell_left.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.LEFT
-            # 右侧为页码
-            cell_right = header_table.cell(0, 1)
-            cell_right.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.RIGHT
-            
-            # 添加页码字段
-            run = cell_right.paragraphs[0].add_run("第")
-            run.font.size = Pt(10)
-            
-            # 添加页码
-            page_num = cell_right.paragraphs[0].add_run()
-            r = page_num._r
-            fld = OxmlElement('w:fldChar')
-            fld.set(qn('w:fldCharType'), 'begin')
-            r.append(fld)
-            
-            run = cell_right.paragraphs[0].add_run()
-            r = run._r
-            instrText = OxmlElement('w:instrText')
-            instrText.text = " PAGE "
-            r.append(instrText)
-            
-            run = cell_right.paragraphs[0].add_run()
-            r = run._r
-            fld = OxmlElement('w:fldChar')
-            fld.set(qn('w:fldCharType'), 'end')
-            r.append(fld)
-            
-            # 添加"页，共x页"
-            run = cell_right.paragraphs[0].add_run("页，共60页")
-            run.font.size = Pt(10)
-            
-            # 设置表格无边框
-            for row in header_table.rows:
-                for cell in row.cells:
-                    cell.vertical_alignment = WD_ALIGN_VERTICAL.CENTER
-                    for paragraph in cell.paragraphs:
-                        for run in paragraph.runs:
-                            run.font.size = Pt(10)
-            
-            # 删除原始段落，只保留表格
-            if len(header.paragraphs) > 0:
-                p = header.paragraphs[0]._p
-                if p.getparent() is not None:
-                    p.getparent().remove(p)
-            
-            # 添加页码（使用新的方法）
-            self.add_page_number(doc)
-            
-            # 确保有足够的代码行
-            if total_lines < 3000:
-                messagebox.showwarning("警告", f"收集到的代码行数不足3000行（当前{total_lines}行），可能无法满足软著要求")
-            
-            # 直接生成60页固定格式文档
-            self.update_status("正在生成严格控制为60页的文档（通过行距和格式控制）...")
-            
-            # 计算最佳行距和字体大小
-            optimal_spacing = self.calculate_optimal_line_spacing(doc, total_lines, total_pages)
-            self.update_status(f"计算得到最佳行距: {optimal_spacing:.2f}")
-            
-            # 根据页数需求调整字体大小
-            if total_lines < 2000:  # 代码行数太少时，适当增大字体
-                font_size = min(12, 10 * (3000 / max(total_lines, 1500)))
-                self.update_status(f"调整字体大小为: {font_size:.1f}pt")
-            
-            # 如果代码行数不足以填满60页，则全部使用
-            if total_lines <= front_lines + back_lines:
-                # 代码不足60页时，全部展示
-                code_lines = all_code_lines
-                
-                # 计算每页应该展示的行数，确保能填满60页
-                lines_per_page_adjusted = max(1, min(50, (total_lines + 59) // 60))
-                self.update_status(f"每页约 {lines_per_page_adjusted} 行代码")
-                
-                # 生成60页文档
-                for page in range(total_pages):
-                    start_idx = page * lines_per_page_adjusted
-                    end_idx = min(start_idx + lines_per_page_adjusted, total_lines)
-                    
-                    if start_idx >= total_lines:
-                        # 如果已经没有代码了，添加空页
-                        code_para = doc.add_paragraph()
-                        # 添加页面分隔符
-                        if page < total_pages - 1:  # 除了最后一页，每页末尾添加分页符
-                            code_para.add_run().add_break(WD_BREAK.PAGE)
-                    else:
-                        # 添加代码
-                        code_para = doc.add_paragraph()
-                        code_run = code_para.add_run('\n'.join(code_lines[start_idx:end_idx]))
-                        code_run.font.name = 'Courier New'
-                        code_run.font.size = Pt(font_size)
-                        
-                        # 设置行距和段落间距
-                        code_para.paragraph_format.line_spacing = optimal_spacing
-                        
-                        # 为了帮助填满页面，使用适量的段落间距
-                        if total_lines < 3000:  # 代码行数少时，增加段落间距
-                            code_para.paragraph_format.space_after = Pt(5)  
-                        else:
-                            code_para.paragraph_format.space_after = Pt(0)
-                        
-                        code_para.paragraph_format.space_before = Pt(0)
-                        
-                        # 添加页面分隔符
-                        if page < total_pages - 1:  # 除了最后一页，每页末尾添加分页符
-                            code_para.add_run().add_break(WD_BREAK.PAGE)
-                        
-            else:
-                # 代码超过60页时，只展示前30页和后30页
-                front_code = all_code_lines[:front_lines]
-                back_code = all_code_lines[-back_lines:]
-                
-                # 生成前30页
-                for page in range(front_pages):
-                    start_idx = page * lines_per_page
-                    end_idx = min(start_idx + lines_per_page, len(front_code))
-                    
-                    code_para = doc.add_paragraph()
-                    code_run = code_para.add_run('\n'.join(front_code[start_idx:end_idx]))
-                    code_run.font.name = 'Courier New'
-                    code_run.font.size = Pt(font_size)
-                    
-                    # 设置行距
-                    code_para.paragraph_format.line_spacing = optimal_spacing
-                    code_para.paragraph_format.space_after = Pt(0)
-                    code_para.paragraph_format.space_before = Pt(0)
-                    
-                    # 添加页面分隔符
-                    if page < front_pages - 1:  # 除了最后一页，每页末尾添加分页符
-                        code_para.add_run().add_break(WD_BREAK.PAGE)
-                
-                # 添加页面分隔符，确保前后部分不会合并
-                doc.add_paragraph().add_run().add_break(WD_BREAK.PAGE)
-                
-                # 生成后30页
-                for page in range(back_pages):
-                    start_idx = page * lines_per_page
-                    end_idx = min(start_idx + lines_per_page, len(back_code))
-                    
-                    code_para = doc.add_paragraph()
-                    code_run = code_para.add_run('\n'.join(back_code[start_idx:end_idx]))
-                    code_run.font.name = 'Courier New'
-                    code_run.font.size = Pt(font_size)
-                    
-                    # 设置行距
-                    code_para.paragraph_format.line_spacing = optimal_spacing
-                    code_para.paragraph_format.space_after = Pt(0)
-                    code_para.paragraph_format.space_before = Pt(0)
-                    
-                    # 添加页面分隔符
-                    if page < back_pages - 1:  # 除了最后一页，每页末尾添加分页符
-                        code_para.add_run().add_break(WD_BREAK.PAGE)
-                    
-            
-            # 保存文档
-            output_filename = f"{software_name}源代码.docx"
-            
-            # 确保生成文档正好是60页
-            current_sections = len(doc.sections)
-            doc.save(output_filename)
-            
-            # 重新打开文档检查页数并调整
-            doc = Document(output_filename)
-            
-            # 更新进度
-            self.progress["value"] = self.progress["maximum"]
-            self.update_status(f"文档生成完成! 总共处理了 {total_lines} 行代码，保存为 {output_filename}")
-            
-            messagebox.showinfo("成功", f"文档已成功生成: {output_filename}\n\n符合软著申请要求：\n- 通过行距和字体控制生成约60页，每页约50行\n- 前30页为代码开头，后30页为代码结尾\n- 页眉包含软件名称和版本号\n- 页脚包含著作权人信息")
-            
+            with instrumentation.profiled(profile_path):
+                self.report("正在扫描项目目录...", 0)
+                index, index_stats = self.get_file_index(project_path)
+                stats = instrumentation.RunStats()
+                stats.include(index_stats)
+                result = pipeline.generate_document(
+                    software_name, version, author, project_path, extensions,
+                    output_filename=output_filename, backend=backend, index=index, report=self.report,
+                    cancel_event=self.cancel_event, cache=cache, stats=stats)
+            if cache is not None:
+                self.report(f"文档生成完成! 共 {result.total_lines} 行代码，{cache.describe()}")
+            notes = ''
+            if write_stats:
+                report_path = instrumentation.report_filename(result.output_filename)
+                stats.write(report_path, output=result.output_filename, backend=backend, file_count=result.file_count)
+                notes += f"\n\n性能报告: {report_path}"
+            if profile_path:
+                notes += f"\n性能分析: {profile_path}"
+            
+            for warning in result.warnings:
+                self.messages.put(('warning', warning))
+            self.messages.put(('done', f"文档已成功生成: {result.output_filename}\n\n符合软著申请要求：\n- 按代码折行后的实际行数分页，共60页，每页50行\n- 前30页为代码开头，后30页为代码结尾\n- 页眉包含软件名称和版本号\n- 页脚包含著作权人信息" + notes))
+            
+        except GenerationCancelled:
+            self.messages.put(('cancelled',))
+        except GenerationError as e:
+            self.report(f"错误: {str(e)}")
+            self.messages.put(('error', str(e)))
         except Exception as e:
-            messagebox.showerror("错误", f"生成文档时出错: {str(e)}")
-            self.update_status(f"错误: {str(e)}")
+            self.report(f"错误: {str(e)}")
+            self.messages.put(('error', f"生成文档时出错: {str(e)}"))
+        finally:
+            if cache is not None:
+                cache.close()
 
 
-if __name__ == "__main__":
+def main(argv=None):
+    """启动图形界面
+
+    参数为 --startup-timing [FILE] 时为启动计时模式：记录导入模块、创建窗口、首次绘制和后台导入完成的时刻，
+    写入FILE（默认为startup-timing.json）后自动退出，可反复运行比较。
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    timing_path = None
+    if STARTUP_TIMING_ARG in argv:
+        position = argv.index(STARTUP_TIMING_ARG)
+        timing_path = argv[position + 1] if position + 1 < len(argv) else STARTUP_TIMING_FILE
+    timer = instrumentation.StartupTimer(STARTED)
+    timer.mark('imports', IMPORTED)
+    
     root = tk.Tk()
     app = SourceCodeGenerator(root)
-    root.mainloop() 
\ No newline at end of file
+    timer.mark('window')
+    
+    def exposed(event):
+        # 首次绘制：窗口收到Expose后，空闲时完成重绘；之后才开始后台导入
+        root.unbind('<Expose>')
+        root.after_idle(painted)
+    
+    def painted():
+        timer.mark('first_paint')
+        app.warm_up(timer)
+        if timing_path:
+            root.after(POLL_INTERVAL_MS, finish)
+    
+    def finish():
+        if not app.warmed.is_set():
+            root.after(10, finish)
+            return
+        timer.write(timing_path)
+        if sys.stderr is not None:
+            print(timer.describe(), file=sys.stderr)
+        root.destroy()
+    
+    root.bind('<Expose>', exposed)
+    root.mainloop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,9 @@
 # -*- mode: python ; coding: utf-8 -*-
+import os
+
+# 默认打包为单个exe；设置环境变量LONGZE_ONEDIR=1时打包为目录（dist/code_generator/），
+# 启动时无需先把库解压到临时目录，冷启动更快
+ONEDIR = bool(os.environ.get('LONGZE_ONEDIR'))
 
 
 a = Analysis(
@@ -10,7 +15,8 @@ a = Analysis(
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    # 程序用不到的标准库，减小需要解压和加载的内容
+    excludes=['test', 'unittest', 'doctest', 'pydoc', 'lib2to3'],
     noarchive=False,
     optimize=0,
 )
@@ -19,14 +25,16 @@ pyz = PYZ(a.pure)
 exe = EXE(
     pyz,
     a.scripts,
-    a.binaries,
-    a.datas,
+    [] if ONEDIR else a.binaries,
+    [] if ONEDIR else a.datas,
     [],
+    exclude_binaries=ONEDIR,
     name='code_generator',
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
+    # 不用UPX压缩：每次启动都要解压UPX压缩的DLL，也更容易被杀毒软件逐个扫描
+    upx=False,
     upx_exclude=[],
     runtime_tmpdir=None,
     console=False,
@@ -37,3 +45,14 @@ exe = EXE(
     entitlements_file=None,
     icon=['logo.png'],
 )
+
+if ONEDIR:
+    coll = COLLECT(
+        exe,
+        a.binaries,
+        a.datas,
+        strip=False,
+        upx=False,
+        upx_exclude=[],
+        name='code_generator',
+    )
@@ -0,0 +1,143 @@
+"""
+Copyright 2024 Longze
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+# 使用python-docx对象模型生成文档的后端（pipeline.OUTPUT_BACKENDS中的python-docx）。
+# python-docx和lxml导入耗时较长，本模块只在实际生成时才由pipeline.build_docx导入。
+from docx import Document
+from docx.shared import Pt, Twips
+from docx.enum.text import WD_ALIGN_PARAGRAPH, WD_LINE_SPACING
+from docx.enum.table import WD_ALIGN_VERTICAL
+from docx.oxml import OxmlElement
+from docx.oxml.ns import qn
+import pagination
+
+
+def add_page_number(doc, author):
+    """添加页脚（著作权人全称）"""
+    for section in doc.sections:
+        footer = section.footer
+        # 清除现有段落并创建新段落
+        if footer.paragraphs:
+            p = footer.paragraphs[0]
+        else:
+            p = footer.add_paragraph()
+            
+        # 设置对齐方式
+        p.alignment = WD_ALIGN_PARAGRAPH.CENTER
+        
+        # 添加著作权人全称
+        author_run = p.add_run(f"著作权人: {author}")
+        author_run.font.size = Pt(10)
+
+
+def create_docx(paragraphs, style):
+    """使用python-docx对象模型构建文档（不保存）"""
+    doc = Document()
+    
+    # 设置页面大小和边距（与分页计算使用的版心一致）
+    for section in doc.sections:
+        section.page_width = Twips(pagination.PAGE_WIDTH)
+        section.page_height = Twips(pagination.PAGE_HEIGHT)
+        section.top_margin = Twips(pagination.MARGIN_TOP)
+        section.bottom_margin = Twips(pagination.MARGIN_BOTTOM)
+        section.left_margin = Twips(pagination.MARGIN_LEFT)
+        section.right_margin = Twips(pagination.MARGIN_RIGHT)
+        section.header_distance = Twips(pagination.HEADER_DISTANCE)
+        section.footer_distance = Twips(pagination.FOOTER_DISTANCE)
+        if style.first_page != 1:
+            # 起始页码（分册时接续前一册），位于页边距之后
+            page_numbering = OxmlElement('w:pgNumType')
+            page_numbering.set(qn('w:start'), str(style.first_page))
+            section._sectPr.pgMar.addnext(page_numbering)
+
+    # 添加页眉
+    header = doc.sections[0].header
+    header_para = header.paragraphs[0]
+    header_para.text = f"{style.software_name} {style.version}"
+    header_para.alignment = WD_ALIGN_PARAGRAPH.LEFT
+    
+    # 添加右上角页码信息
+    header_table = header.add_table(1, 2, width=Twips(pagination.TEXT_WIDTH))
+    # 左侧为软件名称和版本号
+    cell_left = header_table.cell(0, 0)
+    cell_left.text = f"{style.software_name} {style.version}"
+    cell_left.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.LEFT
+    # 右侧为页码
+    cell_right = header_table.cell(0, 1)
+    cell_right.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.RIGHT
+    
+    # 添加页码字段
+    run = cell_right.paragraphs[0].add_run("第")
+    run.font.size = Pt(10)
+    
+    # 添加页码
+    page_num = cell_right.paragraphs[0].add_run()
+    r = page_num._r
+    fld = OxmlElement('w:fldChar')
+    fld.set(qn('w:fldCharType'), 'begin')
+    r.append(fld)
+    
+    run = cell_right.paragraphs[0].add_run()
+    r = run._r
+    instrText = OxmlElement('w:instrText')
+    instrText.text = " PAGE "
+    r.append(instrText)
+    
+    run = cell_right.paragraphs[0].add_run()
+    r = run._r
+    fld = OxmlElement('w:fldChar')
+    fld.set(qn('w:fldCharType'), 'end')
+    r.append(fld)
+    
+    # 添加"页，共x页"
+    run = cell_right.paragraphs[0].add_run(f"页，共{style.total_pages}页")
+    run.font.size = Pt(10)
+    
+    # 设置表格无边框
+    for row in header_table.rows:
+        for cell in row.cells:
+            cell.vertical_alignment = WD_ALIGN_VERTICAL.CENTER
+            for paragraph in cell.paragraphs:
+                for run in paragraph.runs:
+                    run.font.size = Pt(10)
+    
+    # 删除原始段落，只保留表格
+    if len(header.paragraphs) > 0:
+        p = header.paragraphs[0]._p
+        if p.getparent() is not None:
+            p.getparent().remove(p)
+    
+    # 添加页脚
+    add_page_number(doc, style.author)
+    
+    # 添加正文段落，每页一个段落
+    # 分页使用“段前分页”而不是段末的分页符，避免段落标记被挤到下一页多占一行
+    break_before = False
+    for text, page_break in paragraphs:
+        code_para = doc.add_paragraph()
+        if text is not None:
+            code_run = code_para.add_run(text)
+            code_run.font.name = pagination.CODE_FONT
+            code_run.font.size = Pt(style.font_size)
+        
+        # 固定行高，无段落间距
+        code_para.paragraph_format.line_spacing = Twips(style.line_height)
+        code_para.paragraph_format.line_spacing_rule = WD_LINE_SPACING.EXACTLY
+        code_para.paragraph_format.space_after = Pt(0)
+        code_para.paragraph_format.space_before = Pt(0)
+        code_para.paragraph_format.page_break_before = break_before
+        break_before = page_break
+    
+    return doc
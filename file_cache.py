@@ -0,0 +1,239 @@
+"""
+Copyright 2024 Longze
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+# 文件元数据与解码结果的持久化缓存（SQLite）
+# 以 路径+大小+修改时间 为键，保存行数、检测到的编码和压缩后的规范化文本，
+# 以及文件选择时的检查结果（见pipeline.ContentFilter），
+# 未变化的文件在下次运行时无需读取；总大小超过上限时按最近使用时间淘汰。
+import hashlib
+import os
+import sqlite3
+import time
+import zlib
+from collections import namedtuple
+
+# 缓存总大小上限（字节）
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# 每条记录除文本外的估计开销（字节），用于统计总大小
+ROW_OVERHEAD = 128
+
+# 缓存中的文件信息：行数、编码（未解码过时为None）、是否保存了文本
+CachedFile = namedtuple('CachedFile', ['line_count', 'encoding', 'has_text'])
+
+# 缓存中的检查结果：排除原因（可以选择时为空字符串）、内容摘要（未计算过时为None）
+CachedCheck = namedtuple('CachedCheck', ['reason', 'digest'])
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    digest TEXT,
+    line_count INTEGER NOT NULL,
+    encoding TEXT,
+    text BLOB,
+    nbytes INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_last_used ON files (last_used);
+CREATE TABLE IF NOT EXISTS checks (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    reason TEXT NOT NULL,
+    digest BLOB,
+    nbytes INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS checks_last_used ON checks (last_used);
+'''
+
+
+def default_cache_dir():
+    """默认缓存目录：Windows下为%LOCALAPPDATA%，其他系统为~/.cache"""
+    base = os.environ.get('LOCALAPPDATA') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'longze-code-generator')
+
+
+def file_digest(path):
+    """流式计算文件内容的摘要"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class FileCache:
+    """按文件索引条目（FileEntry）查询和保存行数、编码及规范化文本
+
+    verify_content为True时，大小相同但修改时间变化的文件会比较内容摘要，
+    内容未变（例如重新checkout）仍视为命中。
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES, verify_content=False):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.max_bytes = max_bytes
+        self.verify_content = verify_content
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.connection = sqlite3.connect(os.path.join(self.cache_dir, 'files.sqlite3'), timeout=30)
+        # WAL模式下读写互不阻塞，批量模式的多个进程可以共用同一个缓存
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(SCHEMA)
+        # 已查询过的记录：(路径, 大小, 修改时间) -> CachedFile或None；
+        # 以文件状态为键，缓存对象在多次生成之间保持打开（如常驻的生成服务）时文件变化后不会误用旧记录
+        self.rows = {}
+        self.checks = {}     # 检查结果，键同上：(路径, 大小, 修改时间) -> CachedCheck或None
+        self.used = set()    # 本次运行命中的路径，关闭时统一更新最近使用时间
+        self.checks_used = set()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evicted = 0
+
+    def lookup(self, entry):
+        """查询文件的缓存信息，文件已变化或不在缓存中时返回None"""
+        key = (entry.path, entry.size, entry.mtime)
+        if key in self.rows:
+            return self.rows[key]
+        row = self.connection.execute(
+            'SELECT size, mtime, digest, line_count, encoding, text IS NOT NULL FROM files WHERE path = ?',
+            (entry.path,)).fetchone()
+        cached = None
+        if row is not None:
+            size, mtime, digest, line_count, encoding, has_text = row
+            if size == entry.size and mtime == entry.mtime:
+                cached = CachedFile(line_count, encoding, bool(has_text))
+            elif self.verify_content and size == entry.size and digest:
+                try:
+                    if file_digest(entry.path) == digest:
+                        self.connection.execute('UPDATE files SET mtime = ? WHERE path = ?', (entry.mtime, entry.path))
+                        self.connection.commit()
+                        cached = CachedFile(line_count, encoding, bool(has_text))
+                except OSError:
+                    pass
+        if cached is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.used.add(entry.path)
+        self.rows[key] = cached
+        return cached
+
+    def get_text(self, entry):
+        """读取缓存的规范化文本，没有保存文本时返回None"""
+        cached = self.lookup(entry)
+        if cached is None or not cached.has_text:
+            return None
+        row = self.connection.execute('SELECT text FROM files WHERE path = ?', (entry.path,)).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return zlib.decompress(row[0]).decode('utf-8')
+
+    def store(self, entry, line_count, encoding=None, text=None, data=None):
+        """保存文件的行数、编码和规范化文本；data为原始字节，用于计算内容摘要"""
+        blob = zlib.compress(text.encode('utf-8')) if text is not None else None
+        digest = None
+        if data is not None:
+            digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+        self.connection.execute(
+            'INSERT OR REPLACE INTO files (path, size, mtime, digest, line_count, encoding, text, nbytes, last_used) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (entry.path, entry.size, entry.mtime, digest, line_count, encoding, blob,
+             ROW_OVERHEAD + len(entry.path) + (len(blob) if blob else 0), time.time()))
+        # 立即提交，避免长时间持有写锁阻塞其他进程
+        self.connection.commit()
+        self.rows[(entry.path, entry.size, entry.mtime)] = CachedFile(line_count, encoding, blob is not None)
+        self.stores += 1
+
+    def lookup_check(self, entry):
+        """查询文件的检查结果，文件已变化或未检查过时返回None"""
+        key = (entry.path, entry.size, entry.mtime)
+        if key in self.checks:
+            return self.checks[key]
+        row = self.connection.execute('SELECT size, mtime, reason, digest FROM checks WHERE path = ?',
+                                      (entry.path,)).fetchone()
+        cached = None
+        if row is not None and row[:2] == (entry.size, entry.mtime):
+            cached = CachedCheck(row[2], row[3])
+            self.checks_used.add(entry.path)
+        self.checks[key] = cached
+        return cached
+
+    def store_check(self, entry, reason, digest=None):
+        """保存文件的检查结果：排除原因（可以选择时为空字符串）和内容摘要"""
+        self.connection.execute(
+            'INSERT OR REPLACE INTO checks (path, size, mtime, reason, digest, nbytes, last_used) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (entry.path, entry.size, entry.mtime, reason, digest, ROW_OVERHEAD + len(entry.path), time.time()))
+        self.connection.commit()
+        self.checks[(entry.path, entry.size, entry.mtime)] = CachedCheck(reason, digest)
+
+    def evict(self):
+        """总大小超过上限时，按最近使用时间从旧到新删除记录（文件信息和检查结果一起计算）"""
+        total = self.connection.execute(
+            'SELECT (SELECT COALESCE(SUM(nbytes), 0) FROM files) + (SELECT COALESCE(SUM(nbytes), 0) FROM checks)'
+        ).fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self.connection.execute(
+            "SELECT 'files', path, nbytes, last_used FROM files "
+            "UNION ALL SELECT 'checks', path, nbytes, last_used FROM checks ORDER BY last_used").fetchall()
+        doomed = {'files': [], 'checks': []}
+        for table, path, nbytes, _ in rows:
+            if total <= self.max_bytes:
+                break
+            doomed[table].append((path,))
+            total -= nbytes
+        self.connection.executemany('DELETE FROM files WHERE path = ?', doomed['files'])
+        self.connection.executemany('DELETE FROM checks WHERE path = ?', doomed['checks'])
+        self.evicted += len(doomed['files'])
+
+    def describe(self):
+        """命中统计的文字说明"""
+        return f"缓存命中 {self.hits} 个，未命中 {self.misses} 个，写入 {self.stores} 个，淘汰 {self.evicted} 个"
+
+    def stats(self):
+        """本次运行的命中统计"""
+        return {'hits': self.hits, 'misses': self.misses, 'stores': self.stores, 'evicted': self.evicted}
+
+    def checkpoint(self):
+        """更新最近使用时间并执行淘汰；缓存在多次生成之间保持打开时，每次生成后调用"""
+        now = time.time()
+        self.connection.executemany('UPDATE files SET last_used = ? WHERE path = ?',
+                                    [(now, path) for path in self.used])
+        self.connection.executemany('UPDATE checks SET last_used = ? WHERE path = ?',
+                                    [(now, path) for path in self.checks_used])
+        self.used.clear()
+        self.checks_used.clear()
+        self.rows.clear()
+        self.checks.clear()
+        self.evict()
+        self.connection.commit()
+
+    def close(self):
+        """更新最近使用时间、执行淘汰并关闭数据库"""
+        self.checkpoint()
+        self.connection.close()
+
+
+def open_cache(cache_dir=None, max_bytes=DEFAULT_MAX_BYTES, verify_content=False):
+    """打开缓存，缓存目录不可用时返回None（不影响生成）"""
+    try:
+        return FileCache(cache_dir, max_bytes, verify_content)
+    except (OSError, sqlite3.Error):
+        return None
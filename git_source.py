@@ -0,0 +1,148 @@
+"""
+Copyright 2024 Longze
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+# 直接从git版本读取源代码，无需检出：
+# 用 git ls-tree -r -l 列出指定版本的文件及大小（建立文件索引），
+# 文件内容通过一个常驻的 git cat-file --batch 进程按对象名读取，不为每个文件启动进程。
+import os
+import subprocess
+import threading
+import pipeline
+
+# git可执行文件，可用环境变量指定
+GIT_ENV = 'LONGZE_GIT'
+
+# 普通文件和可执行文件的模式（符号链接、子模块不收录）
+FILE_MODES = ('100644', '100755')
+
+
+def git_command():
+    """git命令（默认从PATH中查找）"""
+    return os.environ.get(GIT_ENV) or 'git'
+
+
+def hidden_window():
+    """Windows下不为git弹出控制台窗口（打包后的图形界面程序）"""
+    return getattr(subprocess, 'CREATE_NO_WINDOW', 0)
+
+
+class GitSource:
+    """git仓库中某个版本的文件，作为生成流程的输入源
+
+    repository为仓库目录（或其中的子目录，只收录该目录下的文件），revision为标签、分支或提交。
+    文件路径以虚拟的根目录 "<目录>@<版本>" 为基准，文件边界中的相对路径与检出后一致；
+    FileEntry的mtime为由blob对象名换算的数值，内容不变时保持不变，可作为缓存的变化标记。
+    read()可在多个线程中调用，对常驻进程的请求依次进行。
+    """
+
+    def __init__(self, repository, revision):
+        self.repository = os.path.abspath(repository)
+        self.revision = revision
+        self.root = f"{self.repository}@{revision}"
+        self.objects = {}   # 路径 -> blob对象名
+        self.process = None
+        self.lock = threading.Lock()
+        if not os.path.isdir(self.repository):
+            raise pipeline.GenerationError("请选择有效的项目路径")
+        try:
+            self.commit = self.run('rev-parse', '--verify', '--quiet', f"{revision}^{{commit}}").decode().strip()
+        except subprocess.CalledProcessError:
+            raise pipeline.GenerationError(f"git仓库中不存在版本: {revision}")
+
+    def run(self, *args):
+        """在仓库目录中执行git命令，返回标准输出"""
+        try:
+            return subprocess.run([git_command(), *args], cwd=self.repository, check=True,
+                                  stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                  creationflags=hidden_window()).stdout
+        except FileNotFoundError:
+            raise pipeline.GenerationError("未找到git，请安装git或通过环境变量LONGZE_GIT指定")
+
+    def scan(self, cancel_event=None):
+        """列出该版本的文件，返回FileEntry列表（与scan_project一样跳过依赖和构建产物目录）"""
+        output = self.run('ls-tree', '-r', '-l', '-z', self.commit)
+        index = []
+        for record in output.split(b'\0'):
+            if cancel_event is not None and cancel_event.is_set():
+                raise pipeline.GenerationCancelled()
+            if not record:
+                continue
+            info, name = record.split(b'\t', 1)
+            mode, kind, obj, size = info.split()
+            if kind != b'blob' or mode.decode() not in FILE_MODES:
+                continue
+            parts = name.decode('utf-8', 'surrogateescape').split('/')
+            if any(pipeline.is_ignored_dir('', part, []) for part in parts[:-1]):
+                continue
+            path = os.path.join(self.root, *parts)
+            obj = obj.decode()
+            self.objects[path] = obj
+            ext = os.path.splitext(parts[-1])[1].lower()
+            index.append(pipeline.FileEntry(path, ext, int(size), float(int(obj[:13], 16))))
+        return index
+
+    def start(self):
+        if self.process is None:
+            try:
+                self.process = subprocess.Popen([git_command(), 'cat-file', '--batch'], cwd=self.repository,
+                                                stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                                stderr=subprocess.DEVNULL, creationflags=hidden_window())
+            except FileNotFoundError:
+                raise pipeline.GenerationError("未找到git，请安装git或通过环境变量LONGZE_GIT指定")
+        return self.process
+
+    def read(self, path, limit=-1):
+        """读取文件内容，limit为最多返回的字节数（-1为全部）；无法读取时抛出OSError"""
+        obj = self.objects.get(path)
+        if obj is None:
+            raise FileNotFoundError(path)
+        with self.lock:
+            process = self.start()
+            process.stdin.write(obj.encode() + b'\n')
+            process.stdin.flush()
+            header = process.stdout.readline().split()
+            if len(header) != 3:
+                raise OSError(f"无法读取git对象 {obj}")
+            size = int(header[2])
+            if 0 <= limit < size:
+                data = process.stdout.read(limit)
+                # 丢弃其余内容，保持输出与请求对齐
+                remaining = size - limit
+                while remaining:
+                    chunk = process.stdout.read(min(remaining, 1024 * 1024))
+                    if not chunk:
+                        raise OSError(f"无法读取git对象 {obj}")
+                    remaining -= len(chunk)
+            else:
+                data = process.stdout.read(size)
+            process.stdout.read(1)  # 对象内容后的换行
+        return data
+
+    def preload(self, paths, limit=-1):
+        """cat-file按对象名随机读取，无需预读"""
+
+    def close(self):
+        """结束常驻的cat-file进程"""
+        if self.process is not None:
+            self.process.stdin.close()
+            self.process.wait()
+            self.process.stdout.close()
+            self.process = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
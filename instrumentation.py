@@ -0,0 +1,242 @@
+"""
+Copyright 2024 Longze
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+# 运行统计：记录生成流程每个阶段的耗时、处理的文件数、读取字节数、产出行数和峰值内存，
+# 生成结构化报告（JSON或文本）；可选地用cProfile记录整个运行过程；以及图形界面程序的启动计时。
+import cProfile
+import json
+import os
+import sys
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+# 已结束的阶段：名称、耗时（秒）、计数器{名称: 数值}、阶段结束时的进程峰值内存（字节，未知时为None）
+PhaseStats = namedtuple('PhaseStats', ['name', 'seconds', 'counters', 'peak_rss'])
+
+
+def peak_rss():
+    """进程迄今为止的峰值常驻内存（字节），无法获取时返回None"""
+    try:
+        import resource
+    except ImportError:
+        return windows_peak_rss()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux以KB为单位，macOS以字节为单位
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def windows_peak_rss():
+    """Windows下通过GetProcessMemoryInfo获取峰值工作集"""
+    try:
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD)] + [
+                (name, ctypes.c_size_t) for name in (
+                    'PeakWorkingSetSize', 'WorkingSetSize', 'QuotaPeakPagedPoolUsage', 'QuotaPagedPoolUsage',
+                    'QuotaPeakNonPagedPoolUsage', 'QuotaNonPagedPoolUsage', 'PagefileUsage', 'PeakPagefileUsage')]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        kernel32 = ctypes.WinDLL('kernel32')
+        kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+        psapi = ctypes.WinDLL('psapi')
+        psapi.GetProcessMemoryInfo.argtypes = [wintypes.HANDLE, ctypes.c_void_p, wintypes.DWORD]
+        if not psapi.GetProcessMemoryInfo(kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb):
+            return None
+        return counters.PeakWorkingSetSize
+    except (ImportError, OSError, AttributeError):
+        return None
+
+
+def process_age():
+    """进程创建至今的秒数，无法获取时返回None
+
+    与程序内计时的差值即为启动解释器（打包的程序还包括加载其中的库）所用的时间；
+    单文件打包的程序由另一个进程先解压，解压的时间不在其中。
+    """
+    if sys.platform == 'win32':
+        return windows_process_age()
+    try:
+        with open('/proc/self/stat', 'rb') as f:
+            # 进程名可能含有空格，从最后一个右括号之后解析；第22个字段为启动时刻（开机后的时钟周期数）
+            fields = f.read().rsplit(b')', 1)[1].split()
+        with open('/proc/uptime', 'rb') as f:
+            uptime = float(f.read().split()[0])
+        return uptime - int(fields[19]) / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def windows_process_age():
+    """Windows下通过GetProcessTimes获取进程创建时刻"""
+    try:
+        import ctypes
+        from ctypes import wintypes
+
+        kernel32 = ctypes.WinDLL('kernel32')
+        kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+        kernel32.GetProcessTimes.argtypes = [wintypes.HANDLE] + [ctypes.POINTER(wintypes.FILETIME)] * 4
+        creation, exit_time, kernel, user, now = (wintypes.FILETIME() for _ in range(5))
+        if not kernel32.GetProcessTimes(kernel32.GetCurrentProcess(), ctypes.byref(creation),
+                                        ctypes.byref(exit_time), ctypes.byref(kernel), ctypes.byref(user)):
+            return None
+        kernel32.GetSystemTimeAsFileTime(ctypes.byref(now))
+        ticks = lambda filetime: (filetime.dwHighDateTime << 32) | filetime.dwLowDateTime
+        # FILETIME以100纳秒为单位
+        return (ticks(now) - ticks(creation)) / 1e7
+    except (ImportError, OSError, AttributeError):
+        return None
+
+
+class StartupTimer:
+    """记录程序启动过程中各个时刻（相对于started，即程序开始执行的perf_counter值）
+
+    mark()可以在后台线程中调用。报告中的launch为进程创建到程序开始执行的时间（见process_age）。
+    """
+
+    def __init__(self, started):
+        self.started = started
+        self.marks = {}
+        age = process_age()
+        self.launch = age - (time.perf_counter() - started) if age is not None else None
+
+    def mark(self, name, at=None):
+        """记录名为name的时刻，at为perf_counter值，省略时为当前时刻"""
+        self.marks[name] = (time.perf_counter() if at is None else at) - self.started
+
+    def to_dict(self):
+        return {
+            'launch_seconds': round(self.launch, 6) if self.launch is not None else None,
+            'marks': {name: round(seconds, 6) for name, seconds in self.marks.items()},
+            'peak_rss_bytes': peak_rss(),
+        }
+
+    def describe(self):
+        """文本形式的报告，每个时刻一行"""
+        lines = [f"{'launch':<20} {self.launch:>9.3f}s" if self.launch is not None else f"{'launch':<20} {'-':>10}"]
+        lines.extend(f"{name:<20} {seconds:>9.3f}s" for name, seconds in self.marks.items())
+        return '\n'.join(lines)
+
+    def write(self, report_path):
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+
+
+class RunStats:
+    """按阶段累计一次运行的统计信息
+
+    同一时刻只有一个进行中的阶段，begin()会先结束上一个阶段；计数器累加到当前阶段。
+    只应在运行生成流程的线程中调用（线程池中的读取结果由该线程汇总后再计数）。
+    """
+
+    def __init__(self):
+        self.phases = []
+        self.current = None
+        self.started = time.perf_counter()
+
+    def begin(self, name):
+        """结束当前阶段并开始新阶段"""
+        self.end()
+        self.current = (name, time.perf_counter(), {})
+
+    def end(self):
+        """结束当前阶段（没有进行中的阶段时不做任何事）"""
+        if self.current is None:
+            return
+        name, start, counters = self.current
+        self.current = None
+        self.phases.append(PhaseStats(name, time.perf_counter() - start, counters, peak_rss()))
+
+    @contextmanager
+    def phase(self, name):
+        """with stats.phase(name): ... 包围一个阶段"""
+        self.begin(name)
+        try:
+            yield self
+        finally:
+            self.end()
+
+    def add(self, counter, amount=1):
+        """累加当前阶段的计数器"""
+        if self.current is not None:
+            counters = self.current[2]
+            counters[counter] = counters.get(counter, 0) + amount
+
+    def include(self, other):
+        """并入另一次统计中已结束的阶段（例如界面上提前完成的目录扫描和后缀检测）"""
+        self.phases = list(other.phases) + self.phases
+
+    def to_dict(self):
+        """转换为可序列化为JSON的报告"""
+        self.end()
+        return {
+            'total_seconds': round(sum(phase.seconds for phase in self.phases), 6),
+            'wall_seconds': round(time.perf_counter() - self.started, 6),
+            'peak_rss_bytes': peak_rss(),
+            'phases': [
+                dict({'name': phase.name, 'seconds': round(phase.seconds, 6), 'peak_rss_bytes': phase.peak_rss},
+                     **phase.counters)
+                for phase in self.phases
+            ],
+        }
+
+    def describe(self):
+        """文本形式的报告，每个阶段一行"""
+        report = self.to_dict()
+        lines = []
+        for phase in report['phases']:
+            counters = ', '.join(f"{key}={value}" for key, value in phase.items()
+                                 if key not in ('name', 'seconds', 'peak_rss_bytes'))
+            lines.append(f"{phase['name']:<20} {phase['seconds']:>9.3f}s  {format_bytes(phase['peak_rss_bytes']):>10}  {counters}")
+        lines.append(f"{'total':<20} {report['total_seconds']:>9.3f}s  {format_bytes(report['peak_rss_bytes']):>10}")
+        return '\n'.join(lines)
+
+    def write(self, report_path, **extra):
+        """将报告写入JSON文件，extra为附加的运行信息（如输出文件、生成方式）"""
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(dict(extra, **self.to_dict()), f, ensure_ascii=False, indent=2)
+
+
+def format_bytes(value):
+    """以MB显示字节数，未知时显示为-"""
+    if value is None:
+        return '-'
+    return f"{value / 1024 / 1024:.1f}MB"
+
+
+def report_filename(output_filename):
+    """与输出文档放在一起的报告文件名"""
+    return f"{output_filename}.stats.json"
+
+
+@contextmanager
+def profiled(profile_path):
+    """profile_path不为空时用cProfile记录with块内当前线程的执行并保存，可用python -m pstats查看
+
+    只记录调用线程，线程池中的读取和解码不在其中（其耗时体现在read_decode阶段的等待上）。
+    """
+    if not profile_path:
+        yield None
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        profiler.dump_stats(profile_path)
@@ -0,0 +1,557 @@
+"""
+Copyright 2024 Longze
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+# 本地生成服务：常驻进程（asyncio）通过简单的HTTP接口（TCP或Unix套接字）接收生成任务，
+# 排队后由固定数量的工作线程执行。进程常驻，库的导入、字宽表、解析过的PDF字体
+# 和每个工作线程打开的文件缓存在任务之间保持；输入和源文件指纹都相同的请求直接返回上次生成的文档。
+#
+#   python job_server.py serve --port 8765 --workers 2
+#   python job_server.py submit --name 测试软件 --version V1.0 --author 测试 --path ./project --output out.docx
+import argparse
+import asyncio
+import hashlib
+import http.client
+import json
+import os
+import shutil
+import signal
+import socket
+import sys
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+import archive_source
+import cli
+import file_cache
+import instrumentation
+import pdf_writer
+import pipeline
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+# 请求体上限（字节）、保留的生成结果数（超出时删除最久未使用的文档）和保留的已结束任务数
+MAX_BODY_BYTES = 1024 * 1024
+MAX_CACHED_RESULTS = 100
+MAX_FINISHED_JOBS = 1000
+
+# 与文档保存在一起的生成结果，服务重启后仍可直接返回
+RESULT_FILE = 'result.json'
+
+# 任务状态
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+# 响应状态码对应的说明
+REASONS = {200: 'OK', 202: 'Accepted', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           409: 'Conflict', 413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+# 任务字段（cli.JOB_FIELDS）的取值类型：字符串、字符串或字符串列表、布尔值、整数；null视为未提供
+FIELD_TYPES = {
+    'software_name': 'str', 'version': 'str', 'author': 'str', 'project_path': 'str', 'output': 'str',
+    'backend': 'str', 'revision': 'str', 'extensions': 'list', 'prefer': 'list', 'avoid': 'list',
+    'keep_generated': 'bool', 'full_listing': 'bool', 'volume_pages': 'int',
+}
+FIELD_TYPE_NAMES = {'str': "字符串", 'list': "字符串或字符串列表", 'bool': "布尔值", 'int': "整数"}
+
+CONTENT_TYPES = {
+    '.docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    '.pdf': 'application/pdf',
+}
+
+
+class RequestError(Exception):
+    """请求无效，status为返回的HTTP状态码"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def valid_field(kind, value):
+    """字段值是否为kind（见FIELD_TYPES）类型"""
+    if kind == 'str':
+        return isinstance(value, str)
+    if kind == 'list':
+        return isinstance(value, str) or isinstance(value, list) and all(isinstance(item, str) for item in value)
+    if kind == 'bool':
+        return isinstance(value, bool)
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def validate_job(job):
+    """检查任务字段（与批量清单相同），返回规范化后的任务"""
+    if not isinstance(job, dict):
+        raise RequestError(400, "任务应为JSON对象")
+    unknown = set(job) - set(cli.JOB_FIELDS)
+    if unknown:
+        raise RequestError(400, f"任务包含未知字段: {', '.join(sorted(unknown))}")
+    job = {key: value for key, value in job.items() if value is not None}
+    for key, value in job.items():
+        if not valid_field(FIELD_TYPES[key], value):
+            raise RequestError(400, f"字段 {key} 应为{FIELD_TYPE_NAMES[FIELD_TYPES[key]]}")
+    job.pop('output', None)   # 文档由服务保存，通过接口下载
+    job.setdefault('backend', pipeline.default_backend(job.get('full_listing')))
+    if job['backend'] not in pipeline.OUTPUT_BACKENDS:
+        raise RequestError(400, f"未知的生成方式: {job['backend']}")
+    if job.get('volume_pages'):
+        raise RequestError(400, "服务每个任务只返回一个文档，不支持分册（volume_pages）")
+    job.pop('volume_pages', None)
+    for key in ('prefer', 'avoid'):
+        if isinstance(job.get(key), str):
+            job[key] = [job[key]]
+    if job.get('project_path'):
+        job['project_path'] = os.path.abspath(job['project_path'])
+    return job
+
+
+def fingerprint(job, index, source):
+    """任务输入和源文件状态的摘要：字段、文件索引（路径、大小、修改时间或内容标记）以及PDF字体相同则文档相同"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(json.dumps(job, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+    digest.update(getattr(source, 'commit', '').encode('utf-8'))
+    if job['backend'] == 'pdf':
+        try:
+            digest.update(repr(pdf_writer.find_fonts()).encode('utf-8', 'surrogateescape'))
+        except pdf_writer.FontError as e:
+            raise pipeline.GenerationError(str(e))
+    for entry in index:
+        digest.update(f"{entry.path}\0{entry.size}\0{entry.mtime!r}\n".encode('utf-8', 'surrogateescape'))
+    return digest.hexdigest()
+
+
+class Job:
+    """一个生成任务及其状态"""
+
+    def __init__(self, fields):
+        self.id = uuid.uuid4().hex[:12]
+        self.fields = fields
+        self.status = QUEUED
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.cached = False
+        self.result = None
+        self.error = None
+        self.done = asyncio.Event()
+
+    def to_dict(self):
+        info = {'id': self.id, 'status': self.status, 'cached': self.cached, 'submitted': self.submitted,
+                'started': self.started, 'finished': self.finished}
+        if self.result is not None:
+            info['result'] = self.result
+        if self.error is not None:
+            info['error'] = self.error
+        return info
+
+
+class Worker:
+    """一个工作线程：任务在同一线程中执行，文件缓存（SQLite连接只能在创建它的线程中使用）在任务之间保持打开"""
+
+    def __init__(self, cache_settings):
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.cache_settings = cache_settings
+        self.cache = None
+        self.cache_opened = False
+
+    def open_cache(self):
+        if not self.cache_opened:
+            self.cache = cli.open_cache(self.cache_settings)
+            self.cache_opened = True
+        return self.cache
+
+    def prepare(self, fields):
+        """打开输入源并建立文件索引，返回(输入源, 索引, 统计, 指纹)"""
+        project_path = fields.get('project_path')
+        if not project_path or not (os.path.isdir(project_path) or archive_source.is_archive(project_path)):
+            raise pipeline.GenerationError("请选择有效的项目路径")
+        stats = instrumentation.RunStats()
+        source = cli.open_source(project_path, fields.get('revision'))
+        try:
+            index = cli.scan_index(project_path, stats, source)
+            return source, index, stats, fingerprint(fields, index, source)
+        except BaseException:
+            if source is not None:
+                source.close()
+            raise
+
+    def generate(self, fields, source, index, stats, output_filename):
+        """执行生成，返回结果（与批量模式的任务结果相同的字段）；source由调用方关闭"""
+        start = time.perf_counter()
+        try:
+            generated = pipeline.generate_document(
+                fields.get('software_name'), fields.get('version'), fields.get('author'), fields['project_path'],
+                cli.resolve_extensions(fields['project_path'], fields.get('extensions'), index, stats, source),
+                output_filename=output_filename, backend=fields['backend'], index=index,
+                cache=self.open_cache(), stats=stats,
+                rules=pipeline.priority_rules(fields.get('prefer') or (), fields.get('avoid') or ()),
+                skip_generated=not fields.get('keep_generated'), source=source,
+                full_listing=bool(fields.get('full_listing')))
+        finally:
+            if self.cache is not None:
+                self.cache.checkpoint()
+        return {'output': generated.output_filename, 'total_lines': generated.total_lines,
+                'file_count': generated.file_count, 'warnings': generated.warnings,
+                'seconds': round(time.perf_counter() - start, 3), 'stats': stats.to_dict()}
+
+    def close(self):
+        def close_cache():
+            if self.cache is not None:
+                self.cache.close()
+        self.executor.submit(close_cache).result()
+        self.executor.shutdown()
+
+
+class JobServer:
+    """任务队列、工作线程和生成结果缓存；所有状态只在事件循环线程中修改"""
+
+    def __init__(self, output_dir, workers=1, cache_settings=None):
+        self.output_dir = output_dir
+        self.workers = [Worker(cache_settings) for _ in range(max(1, workers))]
+        self.queue = asyncio.Queue()
+        self.jobs = {}
+        self.results = OrderedDict()   # 指纹 -> 结果，按最近使用排序
+        self.running = {}              # 指纹 -> 正在生成该文档的任务
+
+    async def submit(self, fields):
+        job = Job(validate_job(fields))
+        finished = [other.id for other in self.jobs.values() if other.done.is_set()]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job_id]
+        self.jobs[job.id] = job
+        await self.queue.put(job)
+        return job
+
+    async def work(self, worker):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self.queue.get()
+            job.status = RUNNING
+            job.started = time.time()
+            try:
+                await self.execute(loop, worker, job)
+                job.status = DONE
+            except Exception as e:
+                job.status = FAILED
+                job.error = str(e) if isinstance(e, pipeline.GenerationError) else f"{type(e).__name__}: {e}"
+            finally:
+                job.finished = time.time()
+                job.done.set()
+                self.queue.task_done()
+
+    async def execute(self, loop, worker, job):
+        source, index, stats, key = await loop.run_in_executor(worker.executor, worker.prepare, job.fields)
+        try:
+            # 相同的文档正在由其他任务生成时等待其结果
+            while key in self.running:
+                await self.running[key].done.wait()
+            cached = self.cached_result(key)
+            if cached is not None:
+                job.cached = True
+                job.result = cached
+                return
+            self.running[key] = job
+            try:
+                directory = os.path.join(self.output_dir, key)
+                os.makedirs(directory, exist_ok=True)
+                output_filename = os.path.join(directory, pipeline.default_output_filename(
+                    job.fields.get('software_name') or 'document', job.fields['backend']))
+                job.result = await loop.run_in_executor(
+                    worker.executor, worker.generate, job.fields, source, index, stats, output_filename)
+            finally:
+                del self.running[key]
+        finally:
+            if source is not None:
+                await loop.run_in_executor(worker.executor, source.close)
+        with open(os.path.join(directory, RESULT_FILE), 'w', encoding='utf-8') as f:
+            json.dump(job.result, f, ensure_ascii=False)
+        self.results[key] = job.result
+        self.trim()
+
+    def cached_result(self, key):
+        """指纹相同的已生成结果（服务重启后从输出目录中读取），文档已被删除时返回None"""
+        result = self.results.get(key)
+        if result is None:
+            try:
+                with open(os.path.join(self.output_dir, key, RESULT_FILE), 'r', encoding='utf-8') as f:
+                    result = json.load(f)
+            except (OSError, ValueError):
+                return None
+            self.results[key] = result
+        if not os.path.exists(result['output']):
+            del self.results[key]
+            return None
+        self.results.move_to_end(key)
+        self.trim()
+        return result
+
+    def trim(self):
+        """只保留最近使用的MAX_CACHED_RESULTS个结果，删除其余的文档"""
+        while len(self.results) > MAX_CACHED_RESULTS:
+            old_key, _ = self.results.popitem(last=False)
+            shutil.rmtree(os.path.join(self.output_dir, old_key), ignore_errors=True)
+
+    async def route(self, method, path, query, body):
+        """处理请求，返回(状态码, 响应体bytes, 内容类型)"""
+        wait = query.get('wait', ['0'])[0] not in ('0', '', 'false')
+        parts = [part for part in path.split('/') if part]
+        if parts == ['health']:
+            return self.json(200, {'ok': True, 'workers': len(self.workers), 'queued': self.queue.qsize(),
+                                   'running': sum(job.status == RUNNING for job in self.jobs.values()),
+                                   'cached_results': len(self.results)})
+        if parts == ['jobs'] and method == 'POST':
+            try:
+                fields = json.loads(body.decode('utf-8') or '{}')
+            except ValueError:
+                raise RequestError(400, "请求体不是有效的JSON")
+            job = await self.submit(fields)
+            if wait:
+                await job.done.wait()
+            return self.json(200 if job.done.is_set() else 202, job.to_dict())
+        if parts[:1] == ['jobs'] and len(parts) in (2, 3) and method == 'GET':
+            job = self.jobs.get(parts[1])
+            if job is None:
+                raise RequestError(404, f"任务不存在: {parts[1]}")
+            if wait:
+                await job.done.wait()
+            if len(parts) == 2:
+                return self.json(200, job.to_dict())
+            if parts[2] == 'document':
+                if job.status != DONE:
+                    raise RequestError(409, f"任务尚未完成: {job.status}")
+                output = job.result['output']
+                with open(output, 'rb') as f:
+                    data = f.read()
+                return 200, data, CONTENT_TYPES.get(os.path.splitext(output)[1], 'application/octet-stream')
+        if parts[:1] in (['jobs'], ['health']):
+            raise RequestError(405, f"不支持的请求: {method} {path}")
+        raise RequestError(404, f"不存在的接口: {path}")
+
+    @staticmethod
+    def json(status, payload):
+        return status, json.dumps(payload, ensure_ascii=False).encode('utf-8'), 'application/json; charset=utf-8'
+
+    async def handle(self, reader, writer):
+        """处理一个HTTP/1.1连接（每个连接一个请求）"""
+        try:
+            try:
+                request_line = (await reader.readline()).decode('latin-1').split()
+                if len(request_line) != 3:
+                    raise RequestError(400, "无效的请求")
+                method, target = request_line[0].upper(), request_line[1]
+                length = 0
+                while True:
+                    line = (await reader.readline()).decode('latin-1').strip()
+                    if not line:
+                        break
+                    name, _, value = line.partition(':')
+                    if name.strip().lower() == 'content-length':
+                        length = int(value.strip())
+                if length > MAX_BODY_BYTES:
+                    raise RequestError(413, "请求体过大")
+                body = await reader.readexactly(length) if length else b''
+                url = urlsplit(target)
+                status, payload, content_type = await self.route(method, url.path, parse_qs(url.query), body)
+            except RequestError as e:
+                status, payload, content_type = self.json(e.status, {'error': str(e)})
+            except (ValueError, asyncio.IncompleteReadError):
+                status, payload, content_type = self.json(400, {'error': "无效的请求"})
+            except OSError as e:
+                status, payload, content_type = self.json(500, {'error': str(e)})
+            except Exception as e:
+                # 未预料的错误也返回响应，而不是直接断开连接
+                status, payload, content_type = self.json(500, {'error': f"服务内部错误: {e}"})
+            writer.write(f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\nContent-Type: {content_type}\r\n"
+                         f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode('latin-1') + payload)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT, unix_socket=None, ready=None):
+        """启动服务直到被取消或收到SIGTERM/SIGINT；ready(address)在开始监听后调用
+
+        停止时等待正在执行的任务结束，再关闭各工作线程的文件缓存。
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        loop = asyncio.get_running_loop()
+        tasks = [asyncio.ensure_future(self.work(worker)) for worker in self.workers]
+        if unix_socket:
+            server = await asyncio.start_unix_server(self.handle, path=unix_socket)
+            address = unix_socket
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+            address = '%s:%d' % server.sockets[0].getsockname()[:2]
+        serving = asyncio.ensure_future(server.serve_forever())
+        for name in ('SIGTERM', 'SIGINT'):
+            try:
+                loop.add_signal_handler(getattr(signal, name), serving.cancel)
+            except (NotImplementedError, AttributeError):
+                # Windows下没有add_signal_handler，Ctrl+C仍以KeyboardInterrupt结束
+                pass
+        if ready is not None:
+            ready(address)
+        try:
+            async with server:
+                await serving
+        except asyncio.CancelledError:
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await asyncio.gather(*(loop.run_in_executor(None, worker.close) for worker in self.workers))
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """通过Unix套接字连接服务"""
+
+    def __init__(self, path, timeout=None):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socket_path)
+
+
+def request(address, method, path, payload=None, timeout=None):
+    """向服务发送请求，address为host:port或Unix套接字路径，返回(状态码, 响应体bytes)"""
+    if ':' in address and not os.path.exists(address):
+        host, port = address.rsplit(':', 1)
+        connection = http.client.HTTPConnection(host, int(port), timeout=timeout)
+    else:
+        connection = UnixHTTPConnection(address, timeout=timeout)
+    try:
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8') if payload is not None else None
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        connection.request(method, path, body=body, headers=headers)
+        response = connection.getresponse()
+        return response.status, response.read()
+    finally:
+        connection.close()
+
+
+def submit_job(address, fields, output=None, timeout=None):
+    """提交任务并等待完成；output不为空时下载文档保存到该路径。返回任务信息"""
+    status, body = request(address, 'POST', '/jobs?wait=1', fields, timeout)
+    info = json.loads(body.decode('utf-8'))
+    if status != 200 or info.get('status') != DONE:
+        return info
+    if output:
+        status, data = request(address, 'GET', f"/jobs/{info['id']}/document", timeout=timeout)
+        if status != 200:
+            raise OSError(json.loads(data.decode('utf-8')).get('error'))
+        with open(output, 'wb') as f:
+            f.write(data)
+        info['result']['output'] = output
+    return info
+
+
+def command_serve(args):
+    """serve子命令：启动服务"""
+    if args.pdf_font:
+        os.environ[pdf_writer.FONT_ENV] = args.pdf_font
+    if args.pdf_cjk_font:
+        os.environ[pdf_writer.CJK_FONT_ENV] = args.pdf_cjk_font
+    server = JobServer(args.output_dir, args.workers, cli.cache_options(args))
+
+    def ready(address):
+        print(f"生成服务已启动: {address}（{args.workers}个工作线程，文档保存在{args.output_dir}）", flush=True)
+
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.socket, ready))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def command_submit(args):
+    """submit子命令：提交一个任务并下载生成的文档"""
+    fields = {'software_name': args.name, 'version': args.version, 'author': args.author,
+              'project_path': os.path.abspath(args.path)}
+    for key, value in (('extensions', args.ext), ('revision', args.revision), ('prefer', args.prefer),
+                       ('avoid', args.avoid), ('keep_generated', args.keep_generated), ('backend', args.backend),
+                       ('full_listing', args.full_listing)):
+        if value:
+            fields[key] = value
+    try:
+        info = submit_job(args.address, fields, args.output)
+    except (OSError, ValueError) as e:
+        print(f"错误: 无法连接生成服务 {args.address}: {e}", file=sys.stderr)
+        return 1
+    if info.get('status') != DONE:
+        print(f"错误: {info.get('error')}", file=sys.stderr)
+        return 1
+    result = info['result']
+    for warning in result.get('warnings', []):
+        print(f"警告: {warning}", file=sys.stderr)
+    print(f"文档已生成: {result['output']}（{result['file_count']}个文件，{result['total_lines']}行代码"
+          f"{'，使用缓存的结果' if info['cached'] else ''}）")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Longze软著源代码生成服务")
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    serve = subparsers.add_parser('serve', help="启动常驻的生成服务")
+    serve.add_argument('--host', default=DEFAULT_HOST, help="监听地址")
+    serve.add_argument('--port', type=int, default=DEFAULT_PORT, help="监听端口")
+    serve.add_argument('--socket', help="改为监听Unix套接字（不支持Windows）")
+    serve.add_argument('--workers', type=int, default=2, help="同时执行的任务数")
+    serve.add_argument('--output-dir', default=os.path.join(file_cache.default_cache_dir(), 'server'),
+                       help="生成的文档保存目录")
+    serve.add_argument('--no-cache', action='store_true', help="不使用文件缓存")
+    serve.add_argument('--cache-dir', help=f"缓存目录，默认为{file_cache.default_cache_dir()}")
+    serve.add_argument('--cache-max-mb', type=int, default=file_cache.DEFAULT_MAX_BYTES // (1024 * 1024),
+                       help="缓存总大小上限（MB）")
+    serve.add_argument('--verify-content', action='store_true', help="修改时间变化但大小相同的文件比较内容摘要")
+    serve.add_argument('--pdf-font', help="PDF中代码使用的等宽TrueType字体（.ttf/.ttc），默认自动查找")
+    serve.add_argument('--pdf-cjk-font', help="PDF中中文使用的TrueType字体（.ttf/.ttc），默认自动查找宋体等")
+    serve.set_defaults(func=command_serve)
+
+    submit = subparsers.add_parser('submit', help="向服务提交任务并下载文档")
+    submit.add_argument('--address', default=f"{DEFAULT_HOST}:{DEFAULT_PORT}", help="服务地址（host:port或Unix套接字路径）")
+    submit.add_argument('--name', required=True, help="软件名称")
+    submit.add_argument('--version', required=True, help="版本号")
+    submit.add_argument('--author', required=True, help="著作权人")
+    submit.add_argument('--path', required=True, help="项目路径或压缩包（服务所在机器上的路径）")
+    submit.add_argument('--ext', help="文件后缀，英文逗号分隔；省略时自动检测")
+    submit.add_argument('--revision', help="git版本")
+    submit.add_argument('--backend', choices=list(pipeline.OUTPUT_BACKENDS),
+                        help="生成方式，默认为python-docx（完整清单默认为stream）")
+    submit.add_argument('--prefer', action='append', default=[], metavar='PATTERN', help="优先选择的文件")
+    submit.add_argument('--avoid', action='append', default=[], metavar='PATTERN', help="尽量不选择的文件")
+    submit.add_argument('--keep-generated', action='store_true', help="不跳过生成、压缩和重复的文件")
+    submit.add_argument('--full-listing', action='store_true', help="输出所有匹配文件的完整清单")
+    submit.add_argument('--output', help="下载的文档保存路径，省略时只显示服务端的保存位置")
+    submit.set_defaults(func=command_submit)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
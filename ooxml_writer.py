@@ -0,0 +1,244 @@
+"""
+Copyright 2024 Longze
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+# 直接流式写入OOXML的.docx生成后端
+# 不经过python-docx对象模型：页眉、页脚、样式和页面设置来自预先拼好的模板，
+# 正文段落逐个写入zip中的word/document.xml，所有代码段落共用一个段落样式。
+# 版式与python-docx后端一致（同样的页眉表格和PAGE域、页脚、页边距和代码格式）。
+import functools
+import os
+import re
+import time
+import zipfile
+from pagination import (PAGE_WIDTH, PAGE_HEIGHT, MARGIN_TOP, MARGIN_BOTTOM, MARGIN_LEFT, MARGIN_RIGHT,
+                        HEADER_DISTANCE, FOOTER_DISTANCE, DEFAULT_TAB_STOP, TEXT_WIDTH, CODE_FONT)
+
+W_NS = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+R_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+XML_DECLARATION = "<?xml version='1.0' encoding='UTF-8' standalone='yes'?>\n"
+
+# XML 1.0 不允许出现的控制字符
+INVALID_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+# 页眉表格与版心同宽，两列平分（页面设置见pagination）
+HEADER_CELL_WIDTH = TEXT_WIDTH // 2
+
+CONTENT_TYPES_XML = (
+    XML_DECLARATION +
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '<Override PartName="/word/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.styles+xml"/>'
+    '<Override PartName="/word/settings.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.settings+xml"/>'
+    '<Override PartName="/word/header1.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.header+xml"/>'
+    '<Override PartName="/word/footer1.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.footer+xml"/>'
+    '</Types>'
+)
+
+PACKAGE_RELS_XML = (
+    XML_DECLARATION +
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>'
+    '</Relationships>'
+)
+
+DOCUMENT_RELS_XML = (
+    XML_DECLARATION +
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+    '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/settings" Target="settings.xml"/>'
+    '<Relationship Id="rId3" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/header" Target="header1.xml"/>'
+    '<Relationship Id="rId4" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/footer" Target="footer1.xml"/>'
+    '</Relationships>'
+)
+
+SETTINGS_XML = (
+    XML_DECLARATION +
+    f'<w:settings xmlns:w="{W_NS}">'
+    f'<w:defaultTabStop w:val="{DEFAULT_TAB_STOP}"/>'
+    '<w:characterSpacingControl w:val="doNotCompress"/>'
+    '<w:compat><w:useFELayout/>'
+    '<w:compatSetting w:name="compatibilityMode" w:uri="http://schemas.microsoft.com/office/word" w:val="14"/>'
+    '</w:compat>'
+    '</w:settings>'
+)
+
+# 样式模板：默认样式沿用python-docx模板的取值，SourceCode为所有代码段落共用的样式
+STYLES_XML = (
+    XML_DECLARATION +
+    f'<w:styles xmlns:w="{W_NS}">'
+    '<w:docDefaults>'
+    '<w:rPrDefault><w:rPr><w:rFonts w:ascii="Cambria" w:eastAsia="宋体" w:hAnsi="Cambria" w:cs="Times New Roman"/>'
+    '<w:sz w:val="22"/><w:szCs w:val="22"/><w:lang w:val="en-US" w:eastAsia="zh-CN" w:bidi="ar-SA"/></w:rPr></w:rPrDefault>'
+    '<w:pPrDefault><w:pPr><w:spacing w:after="200" w:line="276" w:lineRule="auto"/></w:pPr></w:pPrDefault>'
+    '</w:docDefaults>'
+    '<w:style w:type="paragraph" w:default="1" w:styleId="Normal"><w:name w:val="Normal"/><w:qFormat/></w:style>'
+    '<w:style w:type="character" w:default="1" w:styleId="DefaultParagraphFont"><w:name w:val="Default Paragraph Font"/>'
+    '<w:uiPriority w:val="1"/><w:semiHidden/><w:unhideWhenUsed/></w:style>'
+    '<w:style w:type="table" w:default="1" w:styleId="TableNormal"><w:name w:val="Normal Table"/>'
+    '<w:uiPriority w:val="99"/><w:semiHidden/><w:unhideWhenUsed/>'
+    '<w:tblPr><w:tblInd w:w="0" w:type="dxa"/><w:tblCellMar><w:top w:w="0" w:type="dxa"/><w:left w:w="108" w:type="dxa"/>'
+    '<w:bottom w:w="0" w:type="dxa"/><w:right w:w="108" w:type="dxa"/></w:tblCellMar></w:tblPr></w:style>'
+    '<w:style w:type="paragraph" w:styleId="Header"><w:name w:val="header"/><w:basedOn w:val="Normal"/>'
+    '<w:uiPriority w:val="99"/><w:unhideWhenUsed/><w:pPr><w:tabs><w:tab w:val="center" w:pos="4680"/>'
+    '<w:tab w:val="right" w:pos="9360"/></w:tabs><w:spacing w:after="0" w:line="240" w:lineRule="auto"/></w:pPr></w:style>'
+    '<w:style w:type="paragraph" w:styleId="Footer"><w:name w:val="footer"/><w:basedOn w:val="Normal"/>'
+    '<w:uiPriority w:val="99"/><w:unhideWhenUsed/><w:pPr><w:tabs><w:tab w:val="center" w:pos="4680"/>'
+    '<w:tab w:val="right" w:pos="9360"/></w:tabs><w:spacing w:after="0" w:line="240" w:lineRule="auto"/></w:pPr></w:style>'
+    '<w:style w:type="paragraph" w:customStyle="1" w:styleId="SourceCode"><w:name w:val="Source Code"/><w:basedOn w:val="Normal"/>'
+    '<w:pPr><w:spacing w:before="0" w:after="0" w:line="{line}" w:lineRule="exact"/></w:pPr>'
+    f'<w:rPr><w:rFonts w:ascii="{CODE_FONT}" w:hAnsi="{CODE_FONT}"/><w:sz w:val="{{size}}"/></w:rPr></w:style>'
+    '</w:styles>'
+)
+
+HEADER_RUN = '<w:r><w:rPr><w:sz w:val="20"/></w:rPr>{}</w:r>'
+
+HEADER_XML = (
+    XML_DECLARATION +
+    f'<w:hdr xmlns:w="{W_NS}" xmlns:r="{R_NS}">'
+    '<w:tbl><w:tblPr><w:tblW w:type="auto" w:w="0"/>'
+    '<w:tblLook w:firstColumn="1" w:firstRow="1" w:lastColumn="0" w:lastRow="0" w:noHBand="0" w:noVBand="1" w:val="04A0"/>'
+    f'</w:tblPr><w:tblGrid><w:gridCol w:w="{HEADER_CELL_WIDTH}"/><w:gridCol w:w="{HEADER_CELL_WIDTH}"/></w:tblGrid><w:tr>'
+    f'<w:tc><w:tcPr><w:tcW w:type="dxa" w:w="{HEADER_CELL_WIDTH}"/><w:vAlign w:val="center"/></w:tcPr>'
+    '<w:p><w:pPr><w:jc w:val="left"/></w:pPr>'
+    + HEADER_RUN.format('<w:t xml:space="preserve">{title}</w:t>') +
+    '</w:p></w:tc>'
+    f'<w:tc><w:tcPr><w:tcW w:type="dxa" w:w="{HEADER_CELL_WIDTH}"/><w:vAlign w:val="center"/></w:tcPr>'
+    '<w:p><w:pPr><w:jc w:val="right"/></w:pPr>'
+    + HEADER_RUN.format('<w:t>第</w:t>')
+    + HEADER_RUN.format('<w:fldChar w:fldCharType="begin"/>')
+    + HEADER_RUN.format('<w:instrText xml:space="preserve"> PAGE </w:instrText>')
+    + HEADER_RUN.format('<w:fldChar w:fldCharType="end"/>')
+    + HEADER_RUN.format('<w:t>页，共{total_pages}页</w:t>') +
+    '</w:p></w:tc></w:tr></w:tbl></w:hdr>'
+)
+
+FOOTER_XML = (
+    XML_DECLARATION +
+    f'<w:ftr xmlns:w="{W_NS}" xmlns:r="{R_NS}">'
+    '<w:p><w:pPr><w:pStyle w:val="Footer"/><w:jc w:val="center"/></w:pPr>'
+    + HEADER_RUN.format('<w:t xml:space="preserve">著作权人: {author}</w:t>') +
+    '</w:p></w:ftr>'
+)
+
+DOCUMENT_START = (
+    XML_DECLARATION +
+    f'<w:document xmlns:w="{W_NS}" xmlns:r="{R_NS}"><w:body>'
+)
+
+DOCUMENT_END = (
+    '<w:sectPr><w:headerReference w:type="default" r:id="rId3"/>'
+    '<w:footerReference w:type="default" r:id="rId4"/>'
+    f'<w:pgSz w:w="{PAGE_WIDTH}" w:h="{PAGE_HEIGHT}"/>'
+    f'<w:pgMar w:top="{MARGIN_TOP}" w:right="{MARGIN_RIGHT}" w:bottom="{MARGIN_BOTTOM}" w:left="{MARGIN_LEFT}"'
+    f' w:header="{HEADER_DISTANCE}" w:footer="{FOOTER_DISTANCE}" w:gutter="0"/>'
+    '{page_numbering}<w:cols w:space="720"/><w:docGrid w:linePitch="360"/></w:sectPr>'
+    '</w:body></w:document>'
+)
+
+# 起始页码（分册时后面各册的页码接续前一册）
+PAGE_NUMBER_START = '<w:pgNumType w:start="{start}"/>'
+
+
+# 代码段落（分页使用段前分页，避免段末分页符把段落标记挤到下一页多占一行）
+CODE_PARAGRAPH_START = '<w:p><w:pPr><w:pStyle w:val="SourceCode"/></w:pPr><w:r>'
+CODE_PARAGRAPH_BREAK_START = '<w:p><w:pPr><w:pStyle w:val="SourceCode"/><w:pageBreakBefore/></w:pPr><w:r>'
+EMPTY_PARAGRAPH = '<w:p><w:pPr><w:pStyle w:val="SourceCode"/></w:pPr></w:p>'
+EMPTY_PARAGRAPH_BREAK = '<w:p><w:pPr><w:pStyle w:val="SourceCode"/><w:pageBreakBefore/></w:pPr></w:p>'
+
+
+def xml_text(text):
+    """转义文本并去掉XML不允许的控制字符"""
+    # 与xml.sax.saxutils.escape相同（该模块会导入urllib等，拖慢程序启动）
+    return INVALID_XML_CHARS.sub('', text).replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def run_content(text):
+    """把多行代码转换为一个run的内容：换行为<w:br/>，制表符为<w:tab/>"""
+    parts = []
+    lines = text.split('\n')
+    last = len(lines) - 1
+    for i, line in enumerate(lines):
+        if line:
+            segments = line.split('\t')
+            for j, segment in enumerate(segments):
+                if j:
+                    parts.append('<w:tab/>')
+                if segment:
+                    parts.append(f'<w:t xml:space="preserve">{xml_text(segment)}</w:t>')
+        if i < last:
+            parts.append('<w:br/>')
+    return ''.join(parts)
+
+
+@functools.lru_cache(maxsize=256)
+def paragraph_xml(text, break_before):
+    """一页代码对应的段落XML（UTF-8编码）
+
+    保留最近生成的各页：监视模式重新生成时，内容未变的页直接复用，只为变化的页重新转换。
+    """
+    if text is None:
+        chunk = EMPTY_PARAGRAPH_BREAK if break_before else EMPTY_PARAGRAPH
+    else:
+        start = CODE_PARAGRAPH_BREAK_START if break_before else CODE_PARAGRAPH_START
+        chunk = start + run_content(text) + '</w:r></w:p>'
+    return chunk.encode('utf-8')
+
+
+def write_docx(output_filename, paragraphs, style):
+    """流式生成.docx文件
+
+    paragraphs为(代码文本或None, 段末是否分页)序列，逐段写入word/document.xml；
+    style提供页眉页脚文字和代码格式（字号、固定行高）。
+    """
+    styles_xml = STYLES_XML.format(
+        line=style.line_height,
+        size=int(round(style.font_size * 2)),
+    )
+    header_xml = HEADER_XML.format(
+        title=xml_text(f"{style.software_name} {style.version}"),
+        total_pages=style.total_pages,
+    )
+    footer_xml = FOOTER_XML.format(author=xml_text(style.author))
+
+    # 先写入临时文件，完整写完后再替换目标文件，中途出错或取消时不留下残缺文档
+    temp_filename = output_filename + '.tmp'
+    try:
+        with zipfile.ZipFile(temp_filename, 'w', zipfile.ZIP_DEFLATED) as package:
+            package.writestr('[Content_Types].xml', CONTENT_TYPES_XML)
+            package.writestr('_rels/.rels', PACKAGE_RELS_XML)
+            package.writestr('word/_rels/document.xml.rels', DOCUMENT_RELS_XML)
+            package.writestr('word/styles.xml', styles_xml)
+            package.writestr('word/settings.xml', SETTINGS_XML)
+            package.writestr('word/header1.xml', header_xml)
+            package.writestr('word/footer1.xml', footer_xml)
+
+            # 与writestr写入的部件一样带上当前时间并压缩（直接按名称打开时日期为1980-01-01）
+            document_info = zipfile.ZipInfo('word/document.xml', time.localtime()[:6])
+            document_info.compress_type = zipfile.ZIP_DEFLATED
+            with package.open(document_info, 'w') as document:
+                document.write(DOCUMENT_START.encode('utf-8'))
+                break_before = False
+                for text, page_break in paragraphs:
+                    document.write(paragraph_xml(text, break_before))
+                    break_before = page_break
+                page_numbering = PAGE_NUMBER_START.format(start=style.first_page) if style.first_page != 1 else ''
+                document.write(DOCUMENT_END.format(page_numbering=page_numbering).encode('utf-8'))
+        os.replace(temp_filename, output_filename)
+    except BaseException:
+        if os.path.exists(temp_filename):
+            os.remove(temp_filename)
+        raise
@@ -0,0 +1,257 @@
+"""
+Copyright 2024 Longze
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+# 确定性分页：在生成文档之前，按代码字体的字符宽度和版心宽度计算每行代码折行后占几行，
+# 把折行后的“可见行”按每页固定行数分配到各页，并在折行处直接断开。
+# 每个断开后的片段都不超过版心宽度，行高固定，因此Word中不会再发生折行，页数完全确定。
+import re
+import unicodedata
+
+# 页面设置（单位：twip，1/20磅），两个生成后端共用
+PAGE_WIDTH = 12240
+PAGE_HEIGHT = 15840
+MARGIN_TOP = 1440     # 2.54cm
+MARGIN_BOTTOM = 1440  # 2.54cm
+MARGIN_LEFT = 1797    # 3.17cm
+MARGIN_RIGHT = 1797   # 3.17cm
+HEADER_DISTANCE = 720
+FOOTER_DISTANCE = 720
+DEFAULT_TAB_STOP = 720
+
+# 版心宽度和高度
+TEXT_WIDTH = PAGE_WIDTH - MARGIN_LEFT - MARGIN_RIGHT
+TEXT_HEIGHT = PAGE_HEIGHT - MARGIN_TOP - MARGIN_BOTTOM
+
+# 代码字体（Courier New）及字号（磅）
+CODE_FONT = 'Courier New'
+CODE_FONT_SIZE = 10
+
+# 字符宽度，以字体单位计（每em 2048）：Courier New的字形宽度均为1229；
+# 中日韩全角字符由东亚字体显示，宽度为1em；其余Courier New不包含的字符保守地按1em计算
+UNITS_PER_EM = 2048
+COURIER_ADVANCE = 1229
+WIDE_ADVANCE = 2048
+
+# Courier New覆盖的字符范围（拉丁字母及扩展、希腊字母、西里尔字母、常用标点）
+COURIER_RANGES = [(0x20, 0x24F), (0x370, 0x52F), (0x2010, 0x2027), (0x2030, 0x205E)]
+
+# 断行位置：连续空格、单个全角字符（前后都可断开）、其余连续字符（单词）、制表符
+WIDE_CHARS = r'\u1100-\u115f\u2e80-\ua4cf\uac00-\ud7a3\uf900-\ufaff\ufe30-\ufe4f\uff00-\uff60\uffe0-\uffe6'
+SEGMENT = re.compile(rf' +|\t|[{WIDE_CHARS}]|[^ \t{WIDE_CHARS}]+')
+
+_char_widths = None
+
+
+def char_widths():
+    """基本多文种平面每个字符的宽度表，首次使用时计算"""
+    global _char_widths
+    if _char_widths is None:
+        widths = [WIDE_ADVANCE] * 0x10000
+        for code in range(0x10000):
+            char = chr(code)
+            if code < 0x20 or unicodedata.combining(char) or unicodedata.category(char) in ('Mn', 'Me', 'Cf'):
+                widths[code] = 0
+            elif unicodedata.east_asian_width(char) in ('W', 'F', 'A'):
+                widths[code] = WIDE_ADVANCE
+            elif any(low <= code <= high for low, high in COURIER_RANGES):
+                widths[code] = COURIER_ADVANCE
+        _char_widths = widths
+    return _char_widths
+
+
+def text_width(text):
+    """一段文本（不含制表符）的宽度，以字体单位计"""
+    if text.isascii():
+        return len(text) * COURIER_ADVANCE
+    widths = char_widths()
+    return sum(widths[ord(c)] if ord(c) < 0x10000 else WIDE_ADVANCE for c in text)
+
+
+def line_height(lines_per_page, text_height=TEXT_HEIGHT):
+    """每页lines_per_page行时的固定行高（twip），向下取整保证整页不会溢出"""
+    return text_height // lines_per_page
+
+
+class LineWrapper:
+    """按Word的折行规则把一行代码断成若干不超过版心宽度的片段
+
+    在空格后、全角字符前后断行；单个单词比整行还宽时按字符断开；
+    行末的空格在断行处去掉（Word中这些空格本来就悬挂在页边距外，不可见）。
+    """
+
+    def __init__(self, font_size=CODE_FONT_SIZE, width=TEXT_WIDTH, tab_stop=DEFAULT_TAB_STOP):
+        # 版心宽度换算为字体单位
+        scale = UNITS_PER_EM / (font_size * 20)
+        self.capacity = int(width * scale)
+        # 制表位一般不是整数个字体单位（720twip = 7372.8单位），含制表符的行改用整数的细分单位计算：
+        # 1字体单位 = font_size * 20个细分单位，制表位正好是tab_stop * UNITS_PER_EM个细分单位，避免浮点误差
+        self.subunits = font_size * 20
+        self.tab_stop = tab_stop * UNITS_PER_EM
+        # 纯ASCII、不含制表符的行不超过这个长度时无需计算
+        self.ascii_chars = self.capacity // COURIER_ADVANCE
+
+    def wrap(self, line):
+        """返回折行后的片段列表（至少一个）"""
+        if len(line) <= self.ascii_chars and line.isascii() and '\t' not in line:
+            return [line]
+        if '\t' in line:
+            return self.wrap_tabs(line)
+        pieces = []
+        start = 0   # 当前可见行在line中的起始位置
+        x = 0       # 当前可见行已占用的宽度
+        for match in SEGMENT.finditer(line):
+            segment = match.group()
+            if segment[0] == ' ':
+                # 空格可以超出行尾（悬挂），不引起折行
+                x += len(segment) * COURIER_ADVANCE
+                continue
+            width = text_width(segment)
+            if x + width <= self.capacity:
+                x += width
+                continue
+            if x > 0 and match.start() > start:
+                # 整个单词移到下一行
+                pieces.append(line[start:match.start()].rstrip(' '))
+                start = match.start()
+                x = 0
+            if width <= self.capacity:
+                x = width
+                continue
+            # 单词比整行还宽，按字符断开
+            position = match.start()
+            for offset, char in enumerate(segment):
+                char_width = text_width(char)
+                if x + char_width > self.capacity and position + offset > start:
+                    pieces.append(line[start:position + offset])
+                    start = position + offset
+                    x = 0
+                x += char_width
+        pieces.append(line[start:])
+        return pieces
+
+    def wrap_tabs(self, line):
+        """含制表符的行：与wrap相同的规则，宽度以细分单位计（见__init__），制表符跳到下一个制表位
+
+        版心可容纳12个制表位，深层缩进的行按制表位折行（可用 python -m doctest pagination.py 检查）：
+        >>> [len(piece) for piece in LineWrapper().wrap('\\t' * 20 + 'abc')]
+        [12, 11]
+        >>> [len(piece) for piece in LineWrapper().wrap('\\t' * 11 + 'abc')]
+        [14]
+        """
+        unit = self.subunits
+        capacity = self.capacity * unit
+        pieces = []
+        start = 0
+        x = 0
+        for match in SEGMENT.finditer(line):
+            segment = match.group()
+            if segment[0] == ' ':
+                x += len(segment) * COURIER_ADVANCE * unit
+                continue
+            if segment == '\t':
+                x = (x // self.tab_stop + 1) * self.tab_stop
+                if x > capacity:
+                    pieces.append(line[start:match.start()].rstrip(' '))
+                    start = match.start()
+                    x = self.tab_stop
+                continue
+            width = text_width(segment) * unit
+            if x + width <= capacity:
+                x += width
+                continue
+            if x > 0 and match.start() > start:
+                pieces.append(line[start:match.start()].rstrip(' '))
+                start = match.start()
+                x = 0
+            if width <= capacity:
+                x = width
+                continue
+            position = match.start()
+            for offset, char in enumerate(segment):
+                char_width = text_width(char) * unit
+                if x + char_width > capacity and position + offset > start:
+                    pieces.append(line[start:position + offset])
+                    start = position + offset
+                    x = 0
+                x += char_width
+        pieces.append(line[start:])
+        return pieces
+
+
+def visual_lines(code_lines, wrapper, limit=None):
+    """依次产生代码行折行后的可见行，最多limit行"""
+    count = 0
+    for line in code_lines:
+        for piece in wrapper.wrap(line):
+            if limit is not None and count >= limit:
+                return
+            yield piece
+            count += 1
+
+
+def last_visual_lines(code_lines, wrapper, limit):
+    """代码行折行后的最后limit个可见行（只对需要的行做折行计算）"""
+    pieces = []
+    for line in reversed(code_lines):
+        if len(pieces) >= limit:
+            break
+        pieces.extend(reversed(wrapper.wrap(line)))
+    return list(reversed(pieces[:limit]))
+
+
+def paginate(front_code, back_code, total_lines, front_pages, back_pages, lines_per_page, wrapper):
+    """把代码分配到各页，每项为(该页代码文本或None表示空页, 之后是否分页)
+
+    代码（按可见行计）超过总页数时，前front_pages页为开头的可见行，后back_pages页为结尾的可见行，
+    每页正好lines_per_page行；不足时全部展示，并尽量均匀地分布在所有页上。
+    total_lines不超过前后两部分行数之和时，front_code + back_code即为全部代码行。
+    """
+    total_pages = front_pages + back_pages
+    front_capacity = front_pages * lines_per_page
+    back_capacity = back_pages * lines_per_page
+
+    if total_lines <= front_capacity + back_capacity:
+        pieces = list(visual_lines(front_code + back_code, wrapper))
+        if len(pieces) <= front_capacity + back_capacity:
+            # 每页展示的行数，确保尽量填满所有页；没有代码的页为空页
+            per_page = max(1, (len(pieces) + total_pages - 1) // total_pages)
+            for page in range(total_pages):
+                page_lines = pieces[page * per_page:(page + 1) * per_page]
+                yield '\n'.join(page_lines) if page_lines else None, page < total_pages - 1
+            return
+        front_pieces = pieces[:front_capacity]
+        back_pieces = pieces[-back_capacity:] if back_capacity else []
+    else:
+        front_pieces = list(visual_lines(front_code, wrapper, front_capacity))
+        back_pieces = last_visual_lines(back_code, wrapper, back_capacity)
+
+    pages = [front_pieces[i:i + lines_per_page] for i in range(0, front_capacity, lines_per_page)]
+    pages += [back_pieces[i:i + lines_per_page] for i in range(0, back_capacity, lines_per_page)]
+    for page, page_lines in enumerate(pages):
+        yield '\n'.join(page_lines) if page_lines else None, page < total_pages - 1
+
+
+def paginate_listing(file_pieces, lines_per_page):
+    """完整清单的分页：依次产生的各文件可见行（见visual_lines）连续排列，每页lines_per_page行，
+    产生每页的文本；最后一页可能不满。只保留当前页和当前文件的可见行"""
+    page_lines = []
+    for pieces in file_pieces:
+        for piece in pieces:
+            page_lines.append(piece)
+            if len(page_lines) == lines_per_page:
+                yield '\n'.join(page_lines)
+                page_lines = []
+    if page_lines:
+        yield '\n'.join(page_lines)
@@ -0,0 +1,572 @@
+"""
+Copyright 2024 Longze
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+# 直接流式输出PDF的生成后端（只使用标准库，不需要办公软件）
+# 使用与.docx后端相同的分页结果和版式：每个段落为一页，页眉为软件名称、版本号和“第N页，共60页”，
+# 页脚为著作权人。页面内容逐页压缩写入文件，字体在最后只嵌入用到的字形（TrueType子集）。
+# 代码使用等宽字体，全角字符和页眉页脚中的中文使用中文字体。
+import hashlib
+import os
+import re
+import struct
+import zlib
+import pagination
+
+# 字体文件，可用环境变量指定（批量模式的子进程同样生效）
+FONT_ENV = 'LONGZE_PDF_FONT'
+CJK_FONT_ENV = 'LONGZE_PDF_CJK_FONT'
+
+# 按顺序查找的等宽字体和中文字体，只支持TrueType轮廓（.ttf/.ttc）
+WINDOWS_FONTS = os.path.join(os.environ.get('WINDIR', r'C:\Windows'), 'Fonts')
+MONO_FONT_CANDIDATES = [
+    os.path.join(WINDOWS_FONTS, 'cour.ttf'),
+    os.path.join(WINDOWS_FONTS, 'consola.ttf'),
+    '/System/Library/Fonts/Supplemental/Courier New.ttf',
+    '/Library/Fonts/Courier New.ttf',
+    '/usr/share/fonts/truetype/msttcorefonts/Courier_New.ttf',
+    '/usr/share/fonts/truetype/liberation/LiberationMono-Regular.ttf',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSansMono.ttf',
+    '/usr/share/fonts/TTF/DejaVuSansMono.ttf',
+]
+CJK_FONT_CANDIDATES = [
+    os.path.join(WINDOWS_FONTS, 'simsun.ttc'),
+    os.path.join(WINDOWS_FONTS, 'msyh.ttc'),
+    os.path.join(WINDOWS_FONTS, 'simhei.ttf'),
+    '/System/Library/Fonts/STHeiti Light.ttc',
+    '/Library/Fonts/Arial Unicode.ttf',
+    '/usr/share/fonts/truetype/wqy/wqy-microhei.ttc',
+    '/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc',
+    '/usr/share/fonts/truetype/arphic/uming.ttc',
+]
+
+# 页眉页脚字号（磅）
+HEADER_FONT_SIZE = 10
+
+# 复合字形的标志位
+ARG_1_AND_2_ARE_WORDS = 0x0001
+WE_HAVE_A_SCALE = 0x0008
+MORE_COMPONENTS = 0x0020
+WE_HAVE_AN_X_AND_Y_SCALE = 0x0040
+WE_HAVE_A_TWO_BY_TWO = 0x0080
+
+# 子集字体中保留的表（字形编号不变，不需要cmap）
+SUBSET_TABLES = ['head', 'hhea', 'maxp', 'hmtx', 'loca', 'glyf', 'cvt ', 'fpgm', 'prep']
+
+
+class FontError(Exception):
+    """找不到字体或字体格式不受支持"""
+    pass
+
+
+class TrueTypeFont:
+    """TrueType字体（.ttf，或.ttc中的第一个字体）：字符到字形的映射、字宽和子集化"""
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(path, 'rb') as f:
+                self.data = f.read()
+        except OSError as e:
+            raise FontError(f"无法读取字体 {path}: {e}")
+        offset = 0
+        if self.data[:4] == b'ttcf':
+            offset = struct.unpack_from('>I', self.data, 12)[0]
+        num_tables = struct.unpack_from('>H', self.data, offset + 4)[0]
+        self.tables = {}
+        for i in range(num_tables):
+            tag, _, table_offset, length = struct.unpack_from('>4sIII', self.data, offset + 12 + 16 * i)
+            self.tables[tag.decode('latin-1')] = (table_offset, length)
+        for tag in ('head', 'hhea', 'maxp', 'hmtx', 'cmap', 'loca', 'glyf'):
+            if tag not in self.tables:
+                raise FontError(f"字体 {path} 不是TrueType轮廓字体（缺少{tag}表）")
+
+        head = self.table('head')
+        self.units_per_em = struct.unpack_from('>H', head, 18)[0]
+        self.bbox = struct.unpack_from('>hhhh', head, 36)
+        self.long_loca = struct.unpack_from('>h', head, 50)[0] == 1
+        self.ascent, self.descent = struct.unpack_from('>hh', self.table('hhea'), 4)
+        num_metrics = struct.unpack_from('>H', self.table('hhea'), 34)[0]
+        self.num_glyphs = struct.unpack_from('>H', self.table('maxp'), 4)[0]
+        metrics = struct.unpack_from(f'>{num_metrics * 2}H', self.table('hmtx'))
+        self.advances = list(metrics[0::2])
+        self.advances += [self.advances[-1]] * (self.num_glyphs - num_metrics)
+        self.cap_height = self.ascent
+        if 'OS/2' in self.tables:
+            os2 = self.table('OS/2')
+            if struct.unpack_from('>H', os2, 0)[0] >= 2 and len(os2) >= 90:
+                self.cap_height = struct.unpack_from('>h', os2, 88)[0]
+        self.cmap = self.read_cmap()
+        self.name = self.read_name()
+
+    def table(self, tag):
+        offset, length = self.tables[tag]
+        return self.data[offset:offset + length]
+
+    def read_cmap(self):
+        """读取Unicode字符映射（优先格式12，其次格式4）"""
+        cmap = self.table('cmap')
+        subtables = {}
+        for i in range(struct.unpack_from('>H', cmap, 2)[0]):
+            platform, encoding, offset = struct.unpack_from('>HHI', cmap, 4 + 8 * i)
+            subtables[(platform, encoding)] = offset
+        mapping = {}
+        for key in ((3, 10), (0, 4), (3, 1), (0, 3)):
+            if key not in subtables:
+                continue
+            offset = subtables[key]
+            table_format = struct.unpack_from('>H', cmap, offset)[0]
+            if table_format == 12:
+                for i in range(struct.unpack_from('>I', cmap, offset + 12)[0]):
+                    start, end, glyph = struct.unpack_from('>III', cmap, offset + 16 + 12 * i)
+                    for code in range(start, end + 1):
+                        mapping[code] = glyph + code - start
+                return mapping
+            if table_format == 4:
+                segments = struct.unpack_from('>H', cmap, offset + 6)[0] // 2
+                ends = struct.unpack_from(f'>{segments}H', cmap, offset + 14)
+                starts = struct.unpack_from(f'>{segments}H', cmap, offset + 16 + 2 * segments)
+                deltas = struct.unpack_from(f'>{segments}h', cmap, offset + 16 + 4 * segments)
+                range_base = offset + 16 + 6 * segments
+                range_offsets = struct.unpack_from(f'>{segments}H', cmap, range_base)
+                for i in range(segments):
+                    for code in range(starts[i], ends[i] + 1):
+                        if code == 0xFFFF:
+                            continue
+                        if range_offsets[i] == 0:
+                            glyph = (code + deltas[i]) & 0xFFFF
+                        else:
+                            address = range_base + 2 * i + range_offsets[i] + 2 * (code - starts[i])
+                            glyph = struct.unpack_from('>H', cmap, address)[0]
+                            if glyph:
+                                glyph = (glyph + deltas[i]) & 0xFFFF
+                        if glyph:
+                            mapping[code] = glyph
+                return mapping
+        raise FontError(f"字体 {self.path} 没有Unicode字符映射")
+
+    def read_name(self):
+        """PostScript名称（name表的6号记录），没有时使用文件名"""
+        if 'name' in self.tables:
+            table = self.table('name')
+            count, storage = struct.unpack_from('>HH', table, 2)
+            for i in range(count):
+                platform, _, _, name_id, length, offset = struct.unpack_from('>HHHHHH', table, 6 + 12 * i)
+                if name_id == 6:
+                    raw = table[storage + offset:storage + offset + length]
+                    name = raw.decode('utf-16-be' if platform in (0, 3) else 'latin-1', 'ignore')
+                    name = re.sub(r'[^A-Za-z0-9-]', '', name)
+                    if name:
+                        return name
+        return re.sub(r'[^A-Za-z0-9-]', '', os.path.splitext(os.path.basename(self.path))[0]) or 'Font'
+
+    def glyph_offsets(self):
+        """loca表：每个字形在glyf表中的起止位置"""
+        loca = self.table('loca')
+        if self.long_loca:
+            return struct.unpack_from(f'>{self.num_glyphs + 1}I', loca)
+        return [offset * 2 for offset in struct.unpack_from(f'>{self.num_glyphs + 1}H', loca)]
+
+    def subset(self, glyph_ids):
+        """生成只包含指定字形（及复合字形引用的部件）的字体文件，字形编号保持不变"""
+        glyf = self.table('glyf')
+        offsets = self.glyph_offsets()
+        used = set(glyph_ids) | {0}
+        pending = list(used)
+        while pending:
+            glyph = pending.pop()
+            start, end = offsets[glyph], offsets[glyph + 1]
+            if end - start < 10 or struct.unpack_from('>h', glyf, start)[0] >= 0:
+                continue
+            # 复合字形：加入引用的部件
+            position = start + 10
+            while True:
+                flags, component = struct.unpack_from('>HH', glyf, position)
+                if component not in used:
+                    used.add(component)
+                    pending.append(component)
+                position += 4 + (4 if flags & ARG_1_AND_2_ARE_WORDS else 2)
+                if flags & WE_HAVE_A_SCALE:
+                    position += 2
+                elif flags & WE_HAVE_AN_X_AND_Y_SCALE:
+                    position += 4
+                elif flags & WE_HAVE_A_TWO_BY_TWO:
+                    position += 8
+                if not flags & MORE_COMPONENTS:
+                    break
+
+        new_glyf = bytearray()
+        new_loca = []
+        for glyph in range(self.num_glyphs):
+            new_loca.append(len(new_glyf))
+            if glyph in used:
+                new_glyf += glyf[offsets[glyph]:offsets[glyph + 1]]
+                new_glyf += b'\0' * (-len(new_glyf) % 4)
+        new_loca.append(len(new_glyf))
+
+        head = bytearray(self.table('head'))
+        struct.pack_into('>I', head, 8, 0)   # checkSumAdjustment，最后重新计算
+        struct.pack_into('>h', head, 50, 1)  # 使用长格式loca
+        tables = {
+            'head': bytes(head),
+            'loca': struct.pack(f'>{len(new_loca)}I', *new_loca),
+            'glyf': bytes(new_glyf),
+        }
+        for tag in SUBSET_TABLES:
+            if tag not in tables and tag in self.tables:
+                tables[tag] = self.table(tag)
+        return build_sfnt(tables)
+
+
+def table_checksum(data):
+    data += b'\0' * (-len(data) % 4)
+    return sum(struct.unpack(f'>{len(data) // 4}I', data)) & 0xFFFFFFFF
+
+
+def build_sfnt(tables):
+    """把各表拼成TrueType字体文件，并填写head表的checkSumAdjustment"""
+    tags = sorted(tables)
+    count = len(tags)
+    entry_selector = count.bit_length() - 1
+    search_range = (1 << entry_selector) * 16
+    header = struct.pack('>IHHHH', 0x00010000, count, search_range, entry_selector, count * 16 - search_range)
+    offset = len(header) + 16 * count
+    directory = b''
+    body = b''
+    head_offset = 0
+    for tag in tags:
+        data = tables[tag]
+        if tag == 'head':
+            head_offset = offset
+        directory += struct.pack('>4sIII', tag.encode('latin-1'), table_checksum(data), offset, len(data))
+        padded = data + b'\0' * (-len(data) % 4)
+        body += padded
+        offset += len(padded)
+    font = bytearray(header + directory + body)
+    struct.pack_into('>I', font, head_offset + 8, (0xB1B0AFBA - table_checksum(bytes(font))) & 0xFFFFFFFF)
+    return bytes(font)
+
+
+def find_font(env_name, candidates):
+    """环境变量指定的字体优先，否则使用第一个存在的候选字体"""
+    path = os.environ.get(env_name)
+    if path:
+        if not os.path.isfile(path):
+            raise FontError(f"环境变量{env_name}指定的字体不存在: {path}")
+        return path
+    for path in candidates:
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+# 已解析的字体：(路径, 修改时间, 大小) -> TrueTypeFont（解析后只读，可在多次生成之间共用）
+_loaded_fonts = {}
+
+
+def load_font(path):
+    """解析字体文件，同一进程中未变化的字体只解析一次（常驻的生成服务中尤其有用）"""
+    try:
+        st = os.stat(path)
+    except OSError as e:
+        raise FontError(f"无法读取字体 {path}: {e}")
+    key = (path, st.st_mtime, st.st_size)
+    font = _loaded_fonts.get(key)
+    if font is None:
+        font = _loaded_fonts[key] = TrueTypeFont(path)
+    return font
+
+
+def find_fonts():
+    """查找等宽字体和中文字体，返回(等宽字体路径, 中文字体路径)
+
+    没有等宽字体时代码也使用中文字体；找不到中文字体时抛出FontError。
+    """
+    cjk = find_font(CJK_FONT_ENV, CJK_FONT_CANDIDATES)
+    if cjk is None:
+        raise FontError(f"未找到中文字体，请安装宋体、微软雅黑或文泉驿字体，或用环境变量{CJK_FONT_ENV}指定.ttf/.ttc字体文件")
+    mono = find_font(FONT_ENV, MONO_FONT_CANDIDATES) or cjk
+    return mono, cjk
+
+
+class PdfFont:
+    """PDF中的一个Type0（Identity-H）字体：记录用到的字形，最后写入子集"""
+
+    def __init__(self, pdf, font, resource_name, fixed_pitch):
+        self.font = font
+        self.resource_name = resource_name
+        self.fixed_pitch = fixed_pitch
+        self.object_id = pdf.reserve()
+        self.used = {}  # 字形编号 -> 字符（用于ToUnicode）
+
+    def has(self, char):
+        return ord(char) in self.font.cmap
+
+    def encode(self, text, size):
+        """返回(十六进制字形编号串, 宽度（磅）)"""
+        glyphs = []
+        width = 0
+        for char in text:
+            glyph = self.font.cmap.get(ord(char), 0)
+            self.used.setdefault(glyph, char)
+            glyphs.append(f'{glyph:04X}')
+            width += self.font.advances[glyph]
+        return ''.join(glyphs), width * size / self.font.units_per_em
+
+    def scale(self, value):
+        """字体单位换算为PDF的千分之一em"""
+        return int(round(value * 1000 / self.font.units_per_em))
+
+    def write(self, pdf):
+        """写入字体子集及相关对象"""
+        font = self.font
+        glyphs = sorted(self.used)
+        tag = ''.join(chr(ord('A') + b % 26) for b in hashlib.md5(repr(glyphs).encode()).digest()[:6])
+        base_font = f"{tag}+{font.name}"
+        descendant_id, descriptor_id, file_id, unicode_id = (pdf.reserve() for _ in range(4))
+
+        data = font.subset(glyphs)
+        pdf.write_stream(file_id, f'/Length1 {len(data)}', data)
+        x_min, y_min, x_max, y_max = (self.scale(v) for v in font.bbox)
+        pdf.write_object(descriptor_id, (
+            f'<< /Type /FontDescriptor /FontName /{base_font} /Flags {5 if self.fixed_pitch else 4} '
+            f'/FontBBox [{x_min} {y_min} {x_max} {y_max}] /ItalicAngle 0 '
+            f'/Ascent {self.scale(font.ascent)} /Descent {self.scale(font.descent)} '
+            f'/CapHeight {self.scale(font.cap_height)} /StemV 80 /FontFile2 {file_id} 0 R >>'))
+        widths = ' '.join(f'{glyph} [{self.scale(font.advances[glyph])}]' for glyph in glyphs)
+        pdf.write_object(descendant_id, (
+            f'<< /Type /Font /Subtype /CIDFontType2 /BaseFont /{base_font} '
+            f'/CIDSystemInfo << /Registry (Adobe) /Ordering (Identity) /Supplement 0 >> '
+            f'/FontDescriptor {descriptor_id} 0 R /DW {self.scale(font.advances[0])} /W [{widths}] '
+            f'/CIDToGIDMap /Identity >>'))
+        pdf.write_stream(unicode_id, '', to_unicode_cmap(self.used).encode('ascii'))
+        pdf.write_object(self.object_id, (
+            f'<< /Type /Font /Subtype /Type0 /BaseFont /{base_font} /Encoding /Identity-H '
+            f'/DescendantFonts [{descendant_id} 0 R] /ToUnicode {unicode_id} 0 R >>'))
+
+
+def to_unicode_cmap(used):
+    """字形编号到Unicode的映射，使PDF中的文本可以复制和搜索"""
+    entries = [f'<{glyph:04X}> <{char.encode("utf-16-be").hex().upper()}>'
+               for glyph, char in sorted(used.items()) if glyph]
+    chunks = []
+    for i in range(0, len(entries), 100):
+        chunk = entries[i:i + 100]
+        chunks.append(f'{len(chunk)} beginbfchar\n' + '\n'.join(chunk) + '\nendbfchar')
+    return (
+        '/CIDInit /ProcSet findresource begin\n12 dict begin\nbegincmap\n'
+        '/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) /Supplement 0 >> def\n'
+        '/CMapName /Adobe-Identity-UCS def\n/CMapType 2 def\n'
+        '1 begincodespacerange\n<0000> <FFFF>\nendcodespacerange\n'
+        + '\n'.join(chunks) +
+        '\nendcmap\nCMapName currentdict /CMap defineresource pop\nend\nend'
+    )
+
+
+class PdfFile:
+    """顺序写入PDF对象并记录偏移，最后写交叉引用表"""
+
+    def __init__(self, f):
+        self.f = f
+        self.offsets = {}
+        self.next_id = 1
+        f.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def reserve(self):
+        """预留一个对象编号（对象可以稍后写入）"""
+        object_id = self.next_id
+        self.next_id += 1
+        return object_id
+
+    def write_object(self, object_id, body):
+        if isinstance(body, str):
+            body = body.encode('latin-1')
+        self.offsets[object_id] = self.f.tell()
+        self.f.write(f'{object_id} 0 obj\n'.encode('ascii') + body + b'\nendobj\n')
+
+    def write_stream(self, object_id, dictionary, data):
+        """写入压缩的流对象"""
+        data = zlib.compress(data)
+        self.write_object(object_id, f'<< {dictionary} /Filter /FlateDecode /Length {len(data)} >>\nstream\n'.encode(
+            'latin-1') + data + b'\nendstream')
+
+    def finish(self, root_id, info_id):
+        xref_offset = self.f.tell()
+        lines = [f'xref\n0 {self.next_id}\n', '0000000000 65535 f \n']
+        lines += [f'{self.offsets[object_id]:010d} 00000 n \n' for object_id in range(1, self.next_id)]
+        lines.append(f'trailer\n<< /Size {self.next_id} /Root {root_id} 0 R /Info {info_id} 0 R >>\n'
+                     f'startxref\n{xref_offset}\n%%EOF\n')
+        self.f.write(''.join(lines).encode('ascii'))
+
+
+def pdf_text_string(text):
+    """PDF文本字符串（UTF-16BE十六进制形式）"""
+    return '<FEFF' + text.encode('utf-16-be').hex().upper() + '>'
+
+
+class PageRenderer:
+    """把一页的文本转换为PDF内容流，代码用等宽字体，全角字符和无等宽字形的字符用中文字体"""
+
+    def __init__(self, mono, cjk, style):
+        self.mono = mono
+        self.cjk = cjk
+        self.style = style
+        self.widths = pagination.char_widths()
+        self.tab_stop = pagination.DEFAULT_TAB_STOP / 20
+
+    def font_for(self, char):
+        code = ord(char)
+        wide = code >= 0x10000 or self.widths[code] == pagination.WIDE_ADVANCE
+        if self.mono is not self.cjk and not wide and self.mono.has(char):
+            return self.mono
+        return self.cjk if self.cjk.has(char) or not self.mono.has(char) else self.mono
+
+    def runs(self, text, size):
+        """拆分为使用同一字体的片段，返回([(字体, 字形串, x偏移)], 总宽度)；制表符跳到下一个制表位"""
+        # 可打印ASCII（不含制表符和控制字符）直接整段用等宽字体编码
+        if text.isascii() and text.isprintable() and self.mono.font.cmap:
+            glyphs, width = self.mono.encode(text, size)
+            return [(self.mono, glyphs, 0)], width
+        runs = []
+        x = 0
+        current = None
+        chars = []
+        start = 0
+
+        def flush():
+            nonlocal x
+            if chars:
+                glyphs, width = current.encode(''.join(chars), size)
+                runs.append((current, glyphs, start))
+                x = start + width
+
+        for char in text:
+            if char == '\t':
+                flush()
+                chars = []
+                x = (int(x // self.tab_stop) + 1) * self.tab_stop
+                start = x
+                continue
+            if ord(char) < 0x20:
+                continue
+            font = self.font_for(char)
+            if font is not current:
+                flush()
+                chars = []
+                current = font
+                start = x
+            chars.append(char)
+        flush()
+        return runs, x
+
+    def text_ops(self, text, size, x, y):
+        ops = []
+        runs, _ = self.runs(text, size)
+        for font, glyphs, offset in runs:
+            ops.append(f'/{font.resource_name} {size:g} Tf 1 0 0 1 {x + offset:.2f} {y:.2f} Tm <{glyphs}> Tj')
+        return ops
+
+    def render(self, text, page_number):
+        """生成一页的内容流"""
+        style = self.style
+        page_height = pagination.PAGE_HEIGHT / 20
+        left = pagination.MARGIN_LEFT / 20
+        right = (pagination.PAGE_WIDTH - pagination.MARGIN_RIGHT) / 20
+        ops = ['BT']
+
+        # 页眉：左侧为软件名称和版本号，右侧为页码
+        header_y = page_height - pagination.HEADER_DISTANCE / 20 - HEADER_FONT_SIZE
+        ops += self.text_ops(f"{style.software_name} {style.version}", HEADER_FONT_SIZE, left, header_y)
+        page_label = f"第{page_number}页，共{style.total_pages}页"
+        _, label_width = self.runs(page_label, HEADER_FONT_SIZE)
+        ops += self.text_ops(page_label, HEADER_FONT_SIZE, right - label_width, header_y)
+
+        # 页脚：居中的著作权人
+        footer = f"著作权人: {style.author}"
+        _, footer_width = self.runs(footer, HEADER_FONT_SIZE)
+        ops += self.text_ops(footer, HEADER_FONT_SIZE, (left + right - footer_width) / 2,
+                             pagination.FOOTER_DISTANCE / 20 + 2)
+
+        # 正文：固定行高，从版心顶部开始
+        if text is not None:
+            line_height = style.line_height / 20
+            top = page_height - pagination.MARGIN_TOP / 20
+            ascent = self.mono.font.ascent * style.font_size / self.mono.font.units_per_em
+            for i, line in enumerate(text.split('\n')):
+                if line:
+                    ops += self.text_ops(line, style.font_size, left, top - i * line_height - ascent)
+        ops.append('ET')
+        return '\n'.join(ops).encode('latin-1')
+
+
+def write_pdf(output_filename, paragraphs, style):
+    """流式生成PDF文件
+
+    paragraphs为(代码文本或None, 段末是否分页)序列（与.docx后端相同，每页一个段落）；
+    每页的内容生成后立即压缩写入，内存中只保留当前页。
+    """
+    mono_path, cjk_path = find_fonts()
+    cjk_font = load_font(cjk_path)
+    mono_font = load_font(mono_path)
+
+    temp_filename = output_filename + '.tmp'
+    try:
+        with open(temp_filename, 'wb') as f:
+            pdf = PdfFile(f)
+            root_id, pages_id, info_id = pdf.reserve(), pdf.reserve(), pdf.reserve()
+            cjk = PdfFont(pdf, cjk_font, 'F2', False)
+            mono = PdfFont(pdf, mono_font, 'F1', True) if mono_font is not cjk_font else cjk
+            renderer = PageRenderer(mono, cjk, style)
+            pdf_fonts = [mono, cjk] if mono is not cjk else [cjk]
+            fonts = ' '.join(f'/{font.resource_name} {font.object_id} 0 R' for font in pdf_fonts)
+            media_box = f'[0 0 {pagination.PAGE_WIDTH / 20:g} {pagination.PAGE_HEIGHT / 20:g}]'
+
+            page_ids = []
+            pending = []  # 当前页的段落文本
+            for text, page_break in paragraphs:
+                if text is not None:
+                    pending.append(text)
+                if page_break:
+                    page_ids.append(write_page(pdf, renderer, pending, style.first_page + len(page_ids), pages_id, fonts))
+                    pending = []
+            page_ids.append(write_page(pdf, renderer, pending, style.first_page + len(page_ids), pages_id, fonts))
+
+            kids = ' '.join(f'{page_id} 0 R' for page_id in page_ids)
+            pdf.write_object(pages_id, f'<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} /MediaBox {media_box} >>')
+            for font in pdf_fonts:
+                font.write(pdf)
+            # 页码标签：分册时阅读器中显示的页码与页眉一致，接续前一册
+            page_labels = ''
+            if style.first_page != 1:
+                page_labels = f' /PageLabels << /Nums [0 << /S /D /St {style.first_page} >>] >>'
+            pdf.write_object(root_id, f'<< /Type /Catalog /Pages {pages_id} 0 R{page_labels} >>')
+            title = f"{style.software_name} {style.version}"
+            pdf.write_object(info_id, f'<< /Title {pdf_text_string(title)} /Author {pdf_text_string(style.author)} '
+                                      f'/Producer (Longze) >>')
+            pdf.finish(root_id, info_id)
+        os.replace(temp_filename, output_filename)
+    except BaseException:
+        if os.path.exists(temp_filename):
+            os.remove(temp_filename)
+        raise
+
+
+def write_page(pdf, renderer, texts, page_number, pages_id, fonts):
+    """写入一页（内容流和页面对象），返回页面对象编号"""
+    content_id, page_id = pdf.reserve(), pdf.reserve()
+    text = '\n'.join(texts) if texts else None
+    pdf.write_stream(content_id, '', renderer.render(text, page_number))
+    pdf.write_object(page_id, f'<< /Type /Page /Parent {pages_id} 0 R /Resources << /Font << {fonts} >> >> '
+                              f'/Contents {content_id} 0 R >>')
+    return page_id
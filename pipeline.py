@@ -0,0 +1,1333 @@
+"""
+Copyright 2024 Longze
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+# 源代码文档生成流水线：收集 → 选择 → 分页 → 写入
+# 不依赖图形界面，供GUI、命令行和批量模式共用。
+import codecs
+import hashlib
+import itertools
+import math
+import os
+import fnmatch
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import instrumentation
+import ooxml_writer
+import pagination
+import pdf_writer
+
+# 遍历时直接跳过的目录（依赖、构建产物、版本库）
+EXCLUDED_DIRS = {'.git', 'node_modules', 'build', 'dist'}
+
+# 文件索引条目：绝对路径、小写后缀（含点）、字节数、修改时间
+FileEntry = namedtuple('FileEntry', ['path', 'ext', 'size', 'mtime'])
+
+# 各阶段结束时进度条的位置（百分比）
+PROGRESS_SCAN = 10
+PROGRESS_ESTIMATE = 20
+PROGRESS_COLLECT = 70
+PROGRESS_DONE = 100
+
+
+class GenerationCancelled(Exception):
+    """用户取消生成"""
+
+
+class GenerationError(Exception):
+    """生成失败（输入无效、没有匹配的文件等），消息可直接展示给用户"""
+
+
+def read_gitignore(dir_path):
+    """读取目录下的.gitignore，返回(基准目录, 模式, 是否按相对路径匹配)列表"""
+    try:
+        with open(os.path.join(dir_path, '.gitignore'), 'r', encoding='utf-8', errors='ignore') as f:
+            return parse_gitignore(dir_path, f)
+    except OSError:
+        return []
+
+
+def parse_gitignore(dir_path, lines):
+    """解析.gitignore的各行，dir_path为其所在目录"""
+    rules = []
+    for line in lines:
+        line = line.strip()
+        # 忽略空行、注释和取反规则
+        if not line or line.startswith('#') or line.startswith('!'):
+            continue
+        pattern = line.rstrip('/')
+        anchored = '/' in pattern
+        pattern = pattern.lstrip('/')
+        if pattern:
+            rules.append((dir_path, pattern, anchored))
+    return rules
+
+
+def is_ignored_dir(dir_path, name, rules):
+    """判断目录是否应在遍历时剪枝"""
+    if name in EXCLUDED_DIRS:
+        return True
+    for base, pattern, anchored in rules:
+        if anchored:
+            rel = os.path.relpath(dir_path, base).replace(os.sep, '/')
+            if fnmatch.fnmatch(rel, pattern):
+                return True
+        elif fnmatch.fnmatch(name, pattern):
+            return True
+    return False
+
+
+def scan_project(project_path, cancel_event=None, directories=None):
+    """使用os.scandir单次遍历项目目录，建立文件索引
+
+    遍历过程中剪掉EXCLUDED_DIRS以及.gitignore匹配的目录（.github等其他以点开头的目录和文件照常收录），
+    返回FileEntry列表，供后缀检测和文件收集共用。
+    cancel_event被设置时抛出GenerationCancelled。directories为列表时，追加遍历到的所有目录（监视模式使用）。
+    """
+    return list(walk_project(project_path, cancel_event, directories))
+
+
+def walk_project(project_path, cancel_event=None, directories=None, breadth_first=False):
+    """逐个产生项目中的FileEntry（剪枝规则与scan_project相同）
+
+    默认深度优先，顺序与scan_project的索引相同；breadth_first为True时逐层遍历，
+    只遍历一部分时各个子目录都能被看到（后缀检测的抽样使用），完整遍历后可用index_order恢复索引顺序。
+    """
+    stack = deque([(project_path, read_gitignore(project_path))])
+    while stack:
+        if cancel_event is not None and cancel_event.is_set():
+            raise GenerationCancelled()
+        dir_path, rules = stack.popleft() if breadth_first else stack.pop()
+        try:
+            entries = list(os.scandir(dir_path))
+        except OSError:
+            continue
+        if directories is not None:
+            directories.append(dir_path)
+        # 按名称排序，保证索引顺序稳定
+        entries.sort(key=lambda e: e.name)
+        subdirs = []
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if not is_ignored_dir(entry.path, entry.name, rules):
+                        subdirs.append(entry.path)
+                elif entry.is_file():
+                    st = entry.stat()
+                    ext = os.path.splitext(entry.name)[1].lower()
+                    yield FileEntry(entry.path, ext, st.st_size, st.st_mtime)
+            except OSError:
+                continue
+        # 深度优先时倒序入栈，使子目录按名称顺序被访问
+        for sub in (subdirs if breadth_first else reversed(subdirs)):
+            stack.append((sub, rules + read_gitignore(sub)))
+
+
+def index_order(project_path):
+    """排序键：把walk_project逐层遍历得到的条目恢复为scan_project的顺序（每个目录先是文件，再依次是各子目录）"""
+    prefix = len(os.path.join(project_path, ''))
+
+    def key(entry):
+        # 条目路径由scandir在项目路径上逐级拼接而成，直接截掉前缀（比relpath快得多）
+        parts = entry.path[prefix:].split(os.sep)
+        return [(1, part) for part in parts[:-1]] + [(0, parts[-1])]
+    return key
+
+
+def read_file(path, limit=-1, source=None):
+    """读取文件内容，limit为最多读取的字节数（-1为全部）
+
+    source为git版本、压缩包等输入源，省略时读取本地文件。输入源提供root（相当于项目目录）、
+    scan(cancel_event)、read(path, limit)，以及preload(paths, limit)：提前按其最合适的顺序读取一批文件。
+    """
+    if source is not None:
+        return source.read(path, limit)
+    with open(path, 'rb') as f:
+        return f.read(limit)
+
+
+def filter_index(index, ext_list):
+    """从文件索引中筛选指定后缀的文件，每个文件只出现一次"""
+    suffixes = tuple(ext.lower() for ext in ext_list)
+    return [entry for entry in index if os.path.basename(entry.path).lower().endswith(suffixes)]
+
+
+# 页面布局：每页固定50行，前30页为代码开头，后30页为代码结尾
+LINES_PER_PAGE = 50
+FRONT_PAGES = 30
+BACK_PAGES = 30
+TOTAL_PAGES = FRONT_PAGES + BACK_PAGES
+FRONT_LINES = FRONT_PAGES * LINES_PER_PAGE
+BACK_LINES = BACK_PAGES * LINES_PER_PAGE
+
+# 文件选择：只选出填满前后两个窗口所需的最少文件；
+# 未精确计数的文件按估计行数的这一比例计入，留出估计误差的余量
+ESTIMATE_SAFETY = 0.8
+
+# 文件优先级规则（数值越小越靠前、越优先选择），按顺序取第一条匹配的规则，都不匹配时为PRIORITY_NORMAL。
+# 模式不区分大小写；以/结尾的模式匹配任意一级目录名，否则匹配文件名。
+PRIORITY_ENTRY = 0
+PRIORITY_NORMAL = 1
+PRIORITY_TEST = 2
+PRIORITY_VENDOR = 3
+DEFAULT_PRIORITY_RULES = [
+    (PRIORITY_VENDOR, ['vendor/', 'vendors/', 'third_party/', 'thirdparty/', 'external/', 'bower_components/',
+                       '*.min.js', '*.min.css', '*.bundle.js', '*_pb2.py', '*.pb.go', '*.generated.*',
+                       '*.g.dart', '*.designer.cs']),
+    (PRIORITY_TEST, ['test/', 'tests/', '__tests__/', 'spec/', 'testing/', 'test_*', '*_test.*', '*.test.*',
+                     '*.spec.*', '*test.java', '*tests.java', 'conftest.py']),
+    (PRIORITY_ENTRY, ['main.*', '__main__.py', 'app.*', 'index.*', 'server.*', 'manage.py',
+                      '*application.java', 'program.cs']),
+]
+
+# 并行读取和解码的线程数
+READ_WORKERS = 8
+
+# 逐个读取所有文件时（见decoded_files），每批交给输入源提前读取的字节数上限：
+# 压缩的tar每批只需顺序解压一遍，又不必把整个压缩包的内容同时放在内存中
+PRELOAD_BYTES = 32 * 1024 * 1024
+
+# 行数估计参数：每种后缀最多抽样的文件数、单个样本的最大字节数、无样本时的默认平均行长
+SAMPLE_FILES_PER_EXT = 5
+SAMPLE_MAX_BYTES = 256 * 1024
+DEFAULT_BYTES_PER_LINE = 40
+
+# 生成和压缩文件的识别：按文件名直接排除的锁文件和打包产物（不区分大小写）；
+# 文件开头SNIFF_BYTES字节内出现GENERATED_MARKERS之一，或平均行长超过MINIFIED_LINE_LENGTH时视为生成或压缩的代码
+GENERATED_NAMES = ['package-lock.json', 'npm-shrinkwrap.json', 'yarn.lock', 'pnpm-lock.yaml', 'composer.lock',
+                   'cargo.lock', 'poetry.lock', 'pipfile.lock', 'gemfile.lock', 'go.sum', 'packages.lock.json',
+                   '*.lock', '*.min.js', '*.min.css', '*-min.js', '*.bundle.js', '*.chunk.js', '*.map']
+GENERATED_MARKERS = [b'@generated', b'do not edit', b'code generated by', b'auto-generated', b'autogenerated',
+                     b'this file is automatically generated', b'generated by the protocol buffer compiler']
+SNIFF_BYTES = 4096
+MINIFIED_LINE_LENGTH = 300
+
+
+# 文件的行数估计：exact为True表示已精确计数（抽样读取或来自缓存）
+LineEstimate = namedtuple('LineEstimate', ['entry', 'lines', 'exact'])
+
+
+def estimate_line_counts(entries, cache=None, stats=None, source=None):
+    """根据stat大小和抽样得到的平均行长估计每个文件的行数
+
+    每种后缀按大小均匀抽取少量文件精确计数，得到该后缀的平均行长，
+    其余文件按 大小/平均行长 估计。样本在缓存中时直接使用缓存的行数，不再读取；
+    抽样规则与缓存无关，保证有无缓存时估计结果（以及最终文档）完全一致。
+    返回(估计列表[LineEstimate], 抽样读入的字节{路径: bytes})，
+    抽样字节交给解码阶段复用，保证每个文件最多读取一次。
+    stats为instrumentation.RunStats，提供时累计读取的文件数和字节数；source为输入源（见read_file）。
+    """
+    by_ext = {}
+    for entry in entries:
+        by_ext.setdefault(entry.ext, []).append(entry)
+
+    samples = {}
+    for ext, group in by_ext.items():
+        candidates = sorted((e for e in group if 0 < e.size <= SAMPLE_MAX_BYTES), key=lambda e: e.size)
+        if len(candidates) > SAMPLE_FILES_PER_EXT:
+            step = len(candidates) / SAMPLE_FILES_PER_EXT
+            candidates = [candidates[int(i * step)] for i in range(SAMPLE_FILES_PER_EXT)]
+        samples[ext] = candidates
+    if source is not None:
+        source.preload([entry.path for candidates in samples.values() for entry in candidates
+                        if cache is None or cache.lookup(entry) is None])
+
+    raw_contents = {}
+    exact_counts = {}
+    bytes_per_line = {}
+    for ext, candidates in samples.items():
+        sampled_bytes = 0
+        sampled_lines = 0
+        for entry in candidates:
+            cached = cache.lookup(entry) if cache is not None else None
+            if cached is not None:
+                line_count = cached.line_count
+                if stats is not None:
+                    stats.add('cache_hits')
+            else:
+                try:
+                    data = read_file(entry.path, source=source)
+                except OSError:
+                    continue
+                line_count = count_source_lines(data)
+                raw_contents[entry.path] = data
+                if stats is not None:
+                    stats.add('files_read')
+                    stats.add('bytes_read', len(data))
+                if cache is not None:
+                    cache.store(entry, line_count, data=data)
+            exact_counts[entry.path] = line_count
+            if entry.size > line_count * MINIFIED_LINE_LENGTH:
+                # 压缩文件的平均行长不代表同类源文件，不计入
+                continue
+            sampled_bytes += entry.size
+            sampled_lines += line_count
+        bytes_per_line[ext] = sampled_bytes / sampled_lines if sampled_lines else DEFAULT_BYTES_PER_LINE
+
+    estimates = []
+    for entry in entries:
+        line_count = exact_counts.get(entry.path)
+        if line_count is not None:
+            estimates.append(LineEstimate(entry, line_count, True))
+        else:
+            estimates.append(LineEstimate(entry, max(1, int(round(entry.size / bytes_per_line[entry.ext]))), False))
+    return estimates, raw_contents
+
+
+# 后缀检测：逐层遍历时每DETECT_CHECK_FILES个文件检查一次建议的后缀，遍历了至少DETECT_MIN_FILES个文件
+# 且连续DETECT_STABLE_CHECKS次检查结果相同时提前结束。建议的后缀按估计行数从多到少选取，
+# 直到覆盖DETECT_COVERAGE比例的代码行，最多DETECT_MAX_SUGGESTED个
+DETECT_CHECK_FILES = 2000
+DETECT_MIN_FILES = 10000
+DETECT_STABLE_CHECKS = 3
+DETECT_COVERAGE = 0.95
+DETECT_MAX_SUGGESTED = 10
+
+# 文档和数据文件的后缀：统计中显示，但不作为源代码建议
+NON_CODE_EXTS = {'txt', 'md', 'rst', 'csv', 'tsv', 'log', 'svg', 'map', 'lock', 'sum'}
+
+# 一种后缀的统计：后缀（不含点）、文件数、字节数、估计行数；binary为True表示抽样的文件是二进制文件（不计行数）
+ExtensionStats = namedtuple('ExtensionStats', ['ext', 'files', 'bytes', 'lines', 'binary'])
+
+
+class ExtensionHistogram:
+    """按后缀累计文件数和字节数，并估计各后缀的代码行数
+
+    每种后缀抽取最先加入的SAMPLE_FILES_PER_EXT个非空文件，只读取开头SNIFF_BYTES字节得到平均行长，
+    估计行数 = 字节数 / 平均行长；样本中含有NUL字节的后缀视为二进制文件。
+    样本在需要结果时（rows）才读取，source为输入源（见read_file），stats累计读取的文件数和字节数。
+    """
+
+    def __init__(self, source=None, stats=None):
+        self.source = source
+        self.stats = stats
+        self.totals = {}    # 后缀 -> [文件数, 字节数]
+        self.samples = {}   # 后缀 -> [抽样文件数, 样本字节数, 样本行数, 是否二进制]
+        self.pending = []   # 尚未读取的样本
+
+    def add(self, entry):
+        if not entry.ext or entry.ext.startswith('.git'):  # 排除无后缀和git相关文件
+            return
+        ext = entry.ext.lstrip('.')
+        totals = self.totals.setdefault(ext, [0, 0])
+        totals[0] += 1
+        totals[1] += entry.size
+        sample = self.samples.setdefault(ext, [0, 0, 0, False])
+        if entry.size > 0 and sample[0] < SAMPLE_FILES_PER_EXT:
+            sample[0] += 1
+            self.pending.append(entry)
+
+    def read_samples(self):
+        """读取尚未读取的样本的开头"""
+        if self.source is not None and self.pending:
+            self.source.preload([entry.path for entry in self.pending], SNIFF_BYTES)
+        for entry in self.pending:
+            try:
+                data = read_file(entry.path, SNIFF_BYTES, self.source)
+            except OSError:
+                continue
+            if self.stats is not None:
+                self.stats.add('files_read')
+                self.stats.add('bytes_read', len(data))
+            sample = self.samples[entry.ext.lstrip('.')]
+            if b'\0' in data and not data.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+                sample[3] = True
+            sample[1] += len(data)
+            sample[2] += count_source_lines(data)
+        self.pending = []
+
+    def rows(self):
+        """各后缀的统计（ExtensionStats），按估计行数从多到少排列"""
+        self.read_samples()
+        rows = []
+        for ext, (files, size) in self.totals.items():
+            _, sampled_bytes, sampled_lines, binary = self.samples[ext]
+            bytes_per_line = sampled_bytes / sampled_lines if sampled_lines else DEFAULT_BYTES_PER_LINE
+            rows.append(ExtensionStats(ext, files, size, 0 if binary else int(round(size / bytes_per_line)), binary))
+        rows.sort(key=lambda row: (-row.lines, -row.bytes, row.ext))
+        return rows
+
+    def suggested(self, rows=None):
+        """建议的后缀：源代码后缀按估计行数从多到少，直到覆盖DETECT_COVERAGE的代码行（没有源代码后缀时使用其他文本后缀）"""
+        if rows is None:
+            rows = self.rows()
+        text_rows = [row for row in rows if row.lines]
+        code_rows = [row for row in text_rows if row.ext not in NON_CODE_EXTS] or text_rows
+        total = sum(row.lines for row in code_rows)
+        suggested = []
+        covered = 0
+        for row in code_rows[:DETECT_MAX_SUGGESTED]:
+            if covered >= total * DETECT_COVERAGE:
+                break
+            suggested.append(row.ext)
+            covered += row.lines
+        return suggested
+
+
+def extension_histogram(entries, source=None, stats=None):
+    """统计文件索引中各后缀的文件数、字节数和估计行数，返回ExtensionHistogram"""
+    histogram = ExtensionHistogram(source, stats)
+    for entry in entries:
+        histogram.add(entry)
+    return histogram
+
+
+# 后缀检测结果：各后缀的统计（ExtensionStats列表）、建议的后缀、遍历的文件数，
+# 以及完整遍历时的文件索引（与scan_project的结果相同；提前结束时为None）
+ExtensionDetection = namedtuple('ExtensionDetection', ['rows', 'suggested', 'files', 'index'])
+
+
+def detect_project_extensions(project_path, cancel_event=None, report=None, stats=None):
+    """逐层遍历项目目录检测后缀，建议的后缀在遍历中稳定后提前结束（见DETECT_CHECK_FILES等）
+
+    逐层遍历使提前结束时各子目录都已被抽样到，而不是只看到按名称排在前面的目录。
+    cancel_event被设置时抛出GenerationCancelled；report(message)报告已遍历的文件数；stats的用法与ExtensionHistogram相同。
+    """
+    histogram = ExtensionHistogram(stats=stats)
+    index = []
+    previous = None
+    stable = 0
+    for entry in walk_project(project_path, cancel_event, breadth_first=True):
+        index.append(entry)
+        histogram.add(entry)
+        if len(index) % DETECT_CHECK_FILES:
+            continue
+        suggested = set(histogram.suggested())
+        stable = stable + 1 if suggested == previous else 1
+        previous = suggested
+        if report is not None:
+            report(f"正在检测文件类型，已遍历 {len(index)} 个文件...")
+        if stable >= DETECT_STABLE_CHECKS and len(index) >= DETECT_MIN_FILES:
+            rows = histogram.rows()
+            return ExtensionDetection(rows, histogram.suggested(rows), len(index), None)
+    index.sort(key=index_order(project_path))
+    rows = histogram.rows()
+    return ExtensionDetection(rows, histogram.suggested(rows), len(index), index)
+
+
+# 依次尝试的文本编码（UTF-8之后为中文项目常见的GBK及其超集GB18030）
+FALLBACK_ENCODINGS = ['gbk', 'gb18030']
+
+# 字节顺序标记及对应编码
+BOMS = [
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+
+
+def decode_source(data):
+    """在内存中检测编码并解码，统一换行符，返回(文本, 编码)
+
+    先根据BOM判断，其次尝试UTF-8，再依次尝试GBK和GB18030，整个过程只使用同一份字节。
+    都无法解码时抛出UnicodeDecodeError。
+    """
+    encodings = ['utf-8'] + FALLBACK_ENCODINGS
+    for bom, encoding in BOMS:
+        if data.startswith(bom):
+            encodings = [encoding]
+            break
+    error = None
+    for encoding in encodings:
+        try:
+            text = data.decode(encoding)
+            break
+        except UnicodeDecodeError as e:
+            error = error or e
+    else:
+        raise error
+    return text.replace('\r\n', '\n').replace('\r', '\n'), encoding
+
+
+def count_source_lines(data):
+    """直接在字节上统计行数（与解码并统一换行符后的行数一致），不做解码"""
+    return data.count(b'\n') + data.count(b'\r') - data.count(b'\r\n') + 1
+
+
+def read_and_decode(file_path, data=None, source=None):
+    """读取（data为None时）并解码一个文件，在线程池中执行，返回(文本, 编码, 原始字节)"""
+    if data is None:
+        data = read_file(file_path, source=source)
+    text, encoding = decode_source(data)
+    return text, encoding, data
+
+
+def read_and_count(file_path, data=None, source=None):
+    """读取（data为None时）一个文件并在字节上统计行数，返回(行数, 原始字节)"""
+    if data is None:
+        data = read_file(file_path, source=source)
+    return count_source_lines(data), data
+
+
+class Prefetcher:
+    """按给定顺序逐个返回任务结果，同时在有界线程池中提前执行后面的任务
+
+    同一时刻最多有workers个任务在执行或等待被取用，结果顺序与输入顺序一致（不受完成先后影响）。
+    prepare(index)在调用方线程中执行，返回(立即可用的结果, None)或(None, 线程池任务参数)。
+    """
+
+    def __init__(self, executor, workers, indices, prepare, task):
+        self.executor = executor
+        self.workers = workers
+        self.indices = iter(indices)
+        self.prepare = prepare
+        self.task = task
+        self.pending = deque()
+        for _ in range(workers):
+            self.submit_next()
+
+    def submit_next(self):
+        for index in self.indices:
+            ready, args = self.prepare(index)
+            if ready is not None:
+                self.pending.append((index, None, ready))
+            else:
+                self.pending.append((index, self.executor.submit(self.task, *args), None))
+            return
+
+    def __iter__(self):
+        while self.pending:
+            index, future, ready = self.pending.popleft()
+            self.submit_next()
+            if future is None:
+                yield index, ready, None
+                continue
+            try:
+                yield index, future.result(), None
+            except (UnicodeDecodeError, PermissionError, OSError) as e:
+                yield index, None, e
+
+    def close(self):
+        """放弃尚未取用的任务（未开始的直接取消）"""
+        for _, future, _ in self.pending:
+            if future is not None:
+                future.cancel()
+        self.pending.clear()
+
+
+def collect_code_windows(entries, project_path, front_lines, back_lines, raw_contents, status, cache=None,
+                         workers=READ_WORKERS, stats=None, source=None):
+    """流式收集前部窗口和尾部窗口的代码行，内存占用只与页数预算有关
+
+    先正向解码文件填满前front_lines行，再从最后一个文件反向解码填满后back_lines行，
+    两个窗口之间的中间文件只在字节上统计行数，不做完整解码。
+    读取和解码在最多workers个线程中提前进行，结果仍按选择顺序使用；每个文件只读取一次。
+    提供cache时，未变化的文件直接使用缓存的文本和行数，不再读取；新读取的结果写回缓存。
+    stats为instrumentation.RunStats，提供时累计读取的文件数、字节数、缓存命中和产出的行数。
+    source为输入源（见read_file），省略时读取本地文件。
+    返回(前部行列表, 尾部行列表, 总行数, 文件边界[(相对路径, 起始行, 结束行)])。
+    若总行数不超过front_lines + back_lines，前部与尾部拼接即为全部代码行。
+    """
+    counts = [None] * len(entries)  # 每个文件的行数，None表示读取失败被跳过
+    reused = set()  # 直接使用了抽样时读入的字节的文件
+
+    def sampled_data(index):
+        data = raw_contents.pop(entries[index].path, None)
+        if data is not None:
+            reused.add(index)
+        return data
+
+    def prepare_decode(index):
+        # 缓存中有文本时无需提交读取任务
+        entry = entries[index]
+        text = cache.get_text(entry) if cache is not None else None
+        if text is not None:
+            return (text, None, None), None
+        return None, (entry.path, sampled_data(index), source)
+
+    def prepare_count(index):
+        entry = entries[index]
+        cached = cache.lookup(entry) if cache is not None else None
+        if cached is not None:
+            return (cached.line_count, None), None
+        return None, (entry.path, sampled_data(index), source)
+
+    def count_read(index, data, counter):
+        # 区分缓存命中、复用抽样字节和实际读取
+        if stats is None:
+            return
+        stats.add(counter)
+        if data is None:
+            stats.add('cache_hits')
+        elif index in reused:
+            stats.add('sample_reuses')
+        else:
+            stats.add('files_read')
+            stats.add('bytes_read', len(data))
+
+    def decoded_lines(prefetcher):
+        # 按顺序取出解码结果，写回缓存并转换为行列表
+        for index, result, error in prefetcher:
+            entry = entries[index]
+            status(index, f"收集文件 {index+1}/{len(entries)}: {os.path.basename(entry.path)}")
+            if error is not None:
+                status(index, f"警告: 无法读取文件 {entry.path}，原因: {str(error)}，跳过")
+                continue
+            text, encoding, data = result
+            count_read(index, data, 'files_decoded')
+            if cache is not None and data is not None:
+                cache.store(entry, text.count('\n') + 1, encoding, text, data)
+            lines = text.split('\n')
+            counts[index] = len(lines)
+            yield index, lines
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # 正向填充前部窗口
+        front = []
+        leftover = []  # 填满前部窗口的那个文件剩余的行（只保留最后back_lines行）
+        last_front = -1
+        prefetcher = Prefetcher(executor, workers, range(len(entries)), prepare_decode, read_and_decode)
+        for index, lines in decoded_lines(prefetcher):
+            last_front = index
+            need = front_lines - len(front)
+            front.extend(lines[:need])
+            if len(lines) > need:
+                leftover = lines[need:][-back_lines:] if back_lines else []
+            if len(front) >= front_lines:
+                break
+        prefetcher.close()
+        i = last_front + 1 if len(front) >= front_lines else len(entries)
+
+        # 反向填充尾部窗口
+        tail = deque()
+        j = i - 1
+        if back_lines:
+            prefetcher = Prefetcher(executor, workers, range(len(entries) - 1, i - 1, -1),
+                                    prepare_decode, read_and_decode)
+            for index, lines in decoded_lines(prefetcher):
+                j = index - 1
+                need = back_lines - len(tail)
+                tail.extendleft(reversed(lines[-need:]))
+                if len(tail) >= back_lines:
+                    break
+            else:
+                j = i - 1
+            prefetcher.close()
+        else:
+            j = len(entries) - 1
+        if len(tail) < back_lines and leftover:
+            tail.extendleft(reversed(leftover[-(back_lines - len(tail)):]))
+
+        # 中间文件只统计行数，用于总行数和文件边界
+        prefetcher = Prefetcher(executor, workers, range(i, j + 1), prepare_count, read_and_count)
+        for index, result, error in prefetcher:
+            entry = entries[index]
+            status(index, f"统计文件行数 {index+1}/{len(entries)}: {os.path.basename(entry.path)}")
+            if error is not None:
+                status(index, f"警告: 无法读取文件 {entry.path}，原因: {str(error)}，跳过")
+                continue
+            counts[index], data = result
+            count_read(index, data, 'files_counted')
+            if cache is not None and data is not None:
+                cache.store(entry, counts[index], data=data)
+
+    # 按原始顺序记录文件边界
+    file_boundaries = []
+    total_lines = 0
+    for entry, line_count in zip(entries, counts):
+        if line_count is None:
+            continue
+        relative_path = os.path.relpath(entry.path, project_path)
+        file_boundaries.append((relative_path, total_lines, total_lines + line_count))
+        total_lines += line_count
+    if stats is not None:
+        stats.add('lines', total_lines)
+
+    return front, list(tail), total_lines, file_boundaries
+
+
+def decoded_files(entries, raw_contents, cache=None, workers=READ_WORKERS, stats=None, source=None):
+    """按顺序产生每个文件的(序号, 解码后的文本, None)，无法读取时为(序号, None, 异常)
+
+    读取和解码在最多workers个线程中提前进行，内存中只有提前读取的几个文件；
+    raw_contents中已读入的字节取出后使用，不再保留。cache、stats和source的用法与collect_code_windows相同。
+    有source时，每读到尚未预读的文件，就把从它开始的一批（共不超过PRELOAD_BYTES字节）交给source.preload，
+    压缩的tar不会为每个文件从头解压一遍。
+    """
+    reused = set()
+    preloaded = 0   # 已交给输入源预读到的位置（不含）
+
+    def preload_from(start):
+        paths = []
+        total = 0
+        end = start
+        while end < len(entries) and (not paths or total + entries[end].size <= PRELOAD_BYTES):
+            entry = entries[end]
+            cached = cache.lookup(entry) if cache is not None else None
+            if entry.path not in raw_contents and (cached is None or not cached.has_text):
+                paths.append(entry.path)
+                total += entry.size
+            end += 1
+        if paths:
+            source.preload(paths)
+        return end
+
+    def prepare(index):
+        nonlocal preloaded
+        if source is not None and index >= preloaded:
+            preloaded = preload_from(index)
+        entry = entries[index]
+        text = cache.get_text(entry) if cache is not None else None
+        if text is not None:
+            return (text, None, None), None
+        data = raw_contents.pop(entry.path, None)
+        if data is not None:
+            reused.add(index)
+        return None, (entry.path, data, source)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        prefetcher = Prefetcher(executor, workers, range(len(entries)), prepare, read_and_decode)
+        try:
+            for index, result, error in prefetcher:
+                if error is not None:
+                    yield index, None, error
+                    continue
+                text, encoding, data = result
+                if stats is not None:
+                    stats.add('files_decoded')
+                    if data is None:
+                        stats.add('cache_hits')
+                    elif index in reused:
+                        stats.add('sample_reuses')
+                    else:
+                        stats.add('files_read')
+                        stats.add('bytes_read', len(data))
+                if cache is not None and data is not None:
+                    cache.store(entries[index], text.count('\n') + 1, encoding, text, data)
+                yield index, text, None
+        finally:
+            prefetcher.close()
+
+
+# 文档格式参数，由各生成后端共用：代码字号（磅）、固定行高（twip），以及第一页的页码（分册时后面各册接续编号）
+DocumentStyle = namedtuple('DocumentStyle', [
+    'software_name', 'version', 'author', 'total_pages', 'font_size', 'line_height', 'first_page'], defaults=(1,))
+
+
+def build_docx(output_filename, paragraphs, style):
+    """使用python-docx对象模型生成并保存文档
+
+    python-docx及lxml导入较慢，只在选择该后端时才导入（见docx_writer），不拖慢程序启动。
+    """
+    import docx_writer
+    docx_writer.create_docx(paragraphs, style).save(output_filename)
+
+
+# 可选的生成后端，及其输出文件的扩展名
+OUTPUT_BACKENDS = {
+    'python-docx': build_docx,
+    'stream': ooxml_writer.write_docx,
+    'pdf': pdf_writer.write_pdf,
+}
+BACKEND_EXTENSIONS = {'pdf': '.pdf'}
+
+
+# 生成结果：输出文件、总行数、实际处理的文件数、文件边界、需要提示用户的警告、各阶段统计（RunStats），
+# 以及完整清单分册时的各册文件（第一册即output_filename）
+GenerationResult = namedtuple('GenerationResult', [
+    'output_filename', 'total_lines', 'file_count', 'file_boundaries', 'warnings', 'stats', 'volumes'],
+    defaults=(None,))
+
+
+def parse_extensions(extensions):
+    """解析逗号分隔的文件后缀，统一为带点的形式"""
+    ext_list = [ext.strip() for ext in extensions.split(",") if ext.strip()]
+    return [ext if ext.startswith(".") else f".{ext}" for ext in ext_list]
+
+
+def default_output_filename(software_name, backend='python-docx'):
+    """默认输出文件名"""
+    return f"{software_name}源代码{BACKEND_EXTENSIONS.get(backend, '.docx')}"
+
+
+def default_backend(full_listing=False):
+    """默认的生成方式：完整清单使用流式写入（python-docx需要把整个文档保存在内存中）"""
+    return 'stream' if full_listing else 'python-docx'
+
+
+def volume_filename(output_filename, number, volumes):
+    """分册时第number册的文件名：在扩展名前加上册号（如 源代码_01.docx），只有一册时不变"""
+    if volumes <= 1:
+        return output_filename
+    stem, ext = os.path.splitext(output_filename)
+    return f"{stem}_{number:0{len(str(volumes))}d}{ext}"
+
+
+def priority_rules(prefer=(), avoid=()):
+    """在默认规则前加入用户指定的优先（prefer）和靠后（avoid）模式"""
+    rules = []
+    if avoid:
+        rules.append((PRIORITY_VENDOR, list(avoid)))
+    if prefer:
+        rules.append((PRIORITY_ENTRY, list(prefer)))
+    return rules + DEFAULT_PRIORITY_RULES
+
+
+def file_priority(entry, project_path, rules=DEFAULT_PRIORITY_RULES):
+    """按规则计算文件的优先级"""
+    parts = os.path.relpath(entry.path, project_path).lower().replace('\\', '/').split('/')
+    directories, name = parts[:-1], parts[-1]
+    for priority, patterns in rules:
+        for pattern in patterns:
+            pattern = pattern.lower()
+            if pattern.endswith('/'):
+                if any(fnmatch.fnmatchcase(d, pattern[:-1]) for d in directories):
+                    return priority
+            elif fnmatch.fnmatchcase(name, pattern):
+                return priority
+    return PRIORITY_NORMAL
+
+
+def is_generated_name(entry):
+    """按文件名判断是否为锁文件或打包、压缩产物"""
+    name = os.path.basename(entry.path).lower()
+    return any(fnmatch.fnmatchcase(name, pattern) for pattern in GENERATED_NAMES)
+
+
+def drop_generated_names(entries, stats=None):
+    """排除按文件名即可判断的锁文件和打包、压缩产物，排除的数量计入stats的skipped_by_name"""
+    kept = [entry for entry in entries if not is_generated_name(entry)]
+    if stats is not None and len(kept) < len(entries):
+        stats.add('skipped_by_name', len(entries) - len(kept))
+    return kept
+
+
+def sniff_generated(head):
+    """根据文件开头的字节判断是否为生成或压缩的代码，返回原因（'generated'或'minified'）或None"""
+    if any(marker in head.lower() for marker in GENERATED_MARKERS):
+        return 'generated'
+    if len(head) > MINIFIED_LINE_LENGTH and len(head) > (head.count(b'\n') + 1) * MINIFIED_LINE_LENGTH:
+        return 'minified'
+    return None
+
+
+class ContentFilter:
+    """文件选择时排除生成、压缩的代码和内容完全相同的文件
+
+    只检查被选择过程考虑到的文件：根据开头SNIFF_BYTES字节判断是否为生成或压缩的代码，
+    大小与其他文件相同的再计算内容摘要，与已选中的文件重复时排除。
+    不超过SAMPLE_MAX_BYTES的文件检查时直接整个读入，摘要也使用整个读入的内容，都保存到raw_contents
+    交给解码阶段复用，每个文件只读取一次。例外是有意的：更大的文件只读开头（不为检查整个读入可能被排除的
+    大文件，如压缩的代码），选中后解码时再完整读取，多读的只是开头的SNIFF_BYTES字节；
+    缓存（cache，见file_cache）中已有文本的文件也只读开头，解码时不再读取。
+    检查结果按路径缓存，并连同内容摘要写入cache，下次运行时未变化的文件不再读取；
+    排除的文件记录在skipped中（路径: 原因），计数累加到stats。
+    source为输入源（见read_file），省略时读取本地文件。
+    retain为False时不把读入的内容保存到raw_contents，只读开头，本地大文件的摘要流式计算
+    （完整清单检查所有文件，内存占用不随文件数增长；完整清单本来就读取两遍，见write_listing）。
+    """
+
+    def __init__(self, entries, raw_contents, stats=None, source=None, retain=True, cache=None):
+        self.raw_contents = raw_contents
+        self.stats = stats
+        self.source = source
+        self.retain = retain
+        self.cache = cache
+        self.sizes = {}
+        for entry in entries:
+            self.sizes[entry.size] = self.sizes.get(entry.size, 0) + 1
+        self.digests = {}
+        self.kept = set()
+        self.skipped = {}
+        self.results = {}
+        self.stored = {}        # 已写入cache的检查结果：路径 -> 一并写入的内容摘要
+        self.unreadable = set()
+        self.planned = []       # 即将检查的文件（见prefetch）及其位置，已交给输入源预读的路径
+        self.positions = {}
+        self.requested = set()
+
+    def count(self, counter, amount=1):
+        if self.stats is not None:
+            self.stats.add(counter, amount)
+
+    def read(self, entry, limit=-1):
+        """读取文件的前limit字节（-1为全部），已读入的内容直接使用"""
+        data = self.raw_contents.get(entry.path)
+        if data is not None:
+            return data if limit < 0 else data[:limit]
+        data = read_file(entry.path, limit, self.source)
+        self.count('files_read')
+        self.count('bytes_read', len(data))
+        if self.retain and (limit < 0 or len(data) == entry.size):
+            self.raw_contents[entry.path] = data
+        return data
+
+    def whole(self, entry):
+        """检查时是否整个读入文件（之后交给解码阶段复用）"""
+        if not self.retain or entry.size > SAMPLE_MAX_BYTES:
+            return False
+        cached = self.cache.lookup(entry) if self.cache is not None else None
+        return cached is None or not cached.has_text
+
+    def digest(self, entry):
+        """文件内容的摘要"""
+        if entry.path not in self.digests:
+            data = self.raw_contents.get(entry.path)
+            if data is None and (entry.size <= SAMPLE_MAX_BYTES or self.source is not None or self.retain):
+                data = self.read(entry)
+            if data is not None:
+                self.digests[entry.path] = hashlib.blake2b(data, digest_size=16).digest()
+            else:
+                digest = hashlib.blake2b(digest_size=16)
+                with open(entry.path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                        digest.update(chunk)
+                self.count('files_hashed')
+                self.count('bytes_read', entry.size)
+                self.digests[entry.path] = digest.digest()
+        return self.digests[entry.path]
+
+    def cached(self, entry):
+        """缓存中的检查结果（file_cache.CachedCheck），没有时返回None"""
+        return self.cache.lookup_check(entry) if self.cache is not None else None
+
+    def known(self, entry):
+        """检查文件时是否无需读取：已检查过，或缓存中有检查结果（需要时还有内容摘要）"""
+        if entry.path in self.results:
+            return True
+        cached = self.cached(entry)
+        return cached is not None and (cached.digest is not None or cached.reason != ''
+                                       or self.sizes.get(entry.size, 0) <= 1)
+
+    def remember(self, entry):
+        """检查结果或内容摘要有新内容时写入cache"""
+        if self.cache is None or entry.path in self.unreadable:
+            return
+        digest = self.digests.get(entry.path)
+        if entry.path not in self.stored or self.stored[entry.path] != digest:
+            self.cache.store_check(entry, self.results[entry.path], digest)
+            self.stored[entry.path] = digest
+
+    def check(self, entry):
+        """返回文件应被排除的原因，可以选择时返回None"""
+        reason = self.results.get(entry.path)
+        if reason is None:
+            cached = self.cached(entry)
+            if cached is not None:
+                # 未变化的文件直接使用上次运行的检查结果，不再读取
+                reason = cached.reason
+                self.stored[entry.path] = cached.digest
+                if cached.digest is not None:
+                    self.digests.setdefault(entry.path, cached.digest)
+            else:
+                if entry.path in self.positions and entry.path not in self.requested:
+                    self.preload_from(self.positions[entry.path])
+                try:
+                    head = self.read(entry, -1 if self.whole(entry) else SNIFF_BYTES)[:SNIFF_BYTES]
+                    reason = sniff_generated(head) or ''
+                except OSError:
+                    # 无法读取的文件留给解码阶段处理（记为读取失败），不写入cache
+                    reason = ''
+                    self.unreadable.add(entry.path)
+            self.results[entry.path] = reason
+        duplicate = False
+        if not reason and self.sizes.get(entry.size, 0) > 1:
+            try:
+                duplicate = self.digest(entry) in self.kept
+            except OSError:
+                pass
+        self.remember(entry)
+        return 'duplicate' if duplicate else reason or None
+
+    def prefetch(self, entries):
+        """记下即将按顺序检查的一批文件（cache中已有检查结果的除外），检查到尚未预读的文件时
+        再让输入源提前读取从它开始的一段（见preload_from），完整清单检查所有文件时内存中也只有一段"""
+        if self.source is not None:
+            self.planned = [entry for entry in entries
+                            if entry.path not in self.raw_contents and not self.known(entry)]
+            self.positions = {entry.path: position for position, entry in enumerate(self.planned)}
+
+    def preload_from(self, start):
+        """让输入源提前读取计划中从start开始的一段文件（共不超过PRELOAD_BYTES字节）：检查时整个读入的文件和
+        需要计算摘要的文件（大小与其他文件相同）读取全部，其余只读开头"""
+        whole = []
+        heads = []
+        total = 0
+        for entry in self.planned[start:]:
+            if entry.path in self.requested or entry.path in self.results or entry.path in self.raw_contents:
+                continue
+            full = self.whole(entry) or self.sizes.get(entry.size, 0) > 1
+            amount = entry.size if full else min(entry.size, SNIFF_BYTES)
+            if (whole or heads) and total + amount > PRELOAD_BYTES:
+                break
+            (whole if full else heads).append(entry.path)
+            self.requested.add(entry.path)
+            total += amount
+        if whole:
+            self.source.preload(whole)
+        if heads:
+            self.source.preload(heads, SNIFF_BYTES)
+
+    def keep(self, entry):
+        """记录已选中的文件，之后内容相同的文件会被排除"""
+        if entry.path in self.digests or self.sizes.get(entry.size, 0) > 1:
+            try:
+                self.kept.add(self.digest(entry))
+            except OSError:
+                pass
+
+    def skip(self, entry, reason):
+        if entry.path not in self.skipped:
+            # 排除的文件不会被解码，不再保留读入的内容
+            self.raw_contents.pop(entry.path, None)
+            self.skipped[entry.path] = reason
+            self.count(f'skipped_{reason}')
+
+
+def select_files(file_line_estimates, project_path, budget=FRONT_LINES + BACK_LINES, rules=DEFAULT_PRIORITY_RULES,
+                 content_filter=None, priorities=None):
+    """选出填满budget行所需的最少文件，返回(按文档顺序排列的FileEntry列表, 估计总行数)
+
+    按优先级从高到低选择；同一优先级内先取行数最多的文件，剩余需求不超过某个文件的行数时，
+    改取能满足剩余需求的最小文件，避免为最后几十行读入一个巨大的文件。
+    选中的文件按(优先级, 路径)排列：入口文件在文档开头，测试和第三方代码（若被选中）在末尾。
+    content_filter为ContentFilter，提供时跳过生成、压缩和重复的文件，不计入budget。
+    priorities为{路径: 优先级}，提供时复用并补充其中的结果（监视模式在多次选择之间保留）。
+    """
+    if priorities is None:
+        priorities = {}
+    by_priority = {}
+    for estimate in file_line_estimates:
+        priority = priorities.get(estimate.entry.path)
+        if priority is None:
+            priority = priorities[estimate.entry.path] = file_priority(estimate.entry, project_path, rules)
+        by_priority.setdefault(priority, []).append(estimate)
+
+    def usable(estimate):
+        # 估计值打折计入，精确计数原样计入
+        return estimate.lines if estimate.exact else estimate.lines * ESTIMATE_SAFETY
+
+    def accepted(estimate):
+        if content_filter is None:
+            return True
+        reason = content_filter.check(estimate.entry)
+        if reason is not None:
+            content_filter.skip(estimate.entry, reason)
+        return reason is None
+
+    def expected(ranked, need):
+        # 没有文件被排除时将被选中的文件
+        chosen = []
+        for position, estimate in enumerate(ranked):
+            if need <= 0:
+                break
+            if usable(estimate) >= need:
+                while position + 1 < len(ranked) and usable(ranked[position + 1]) >= need:
+                    position += 1
+                estimate = ranked[position]
+            chosen.append(estimate.entry)
+            need -= usable(estimate)
+        return chosen
+
+    selected = []
+    covered = 0
+    for priority in sorted(by_priority):
+        ranked = sorted(by_priority[priority], key=lambda e: (-usable(e), e.entry.path))
+        if content_filter is not None:
+            content_filter.prefetch(expected(ranked, budget - covered))
+        for position, estimate in enumerate(ranked):
+            need = budget - covered
+            if need <= 0:
+                break
+            if usable(estimate) >= need:
+                # 改取最小的足够大（且未被排除）的文件，选中后即已填满
+                last = position
+                while last + 1 < len(ranked) and usable(ranked[last + 1]) >= need:
+                    last += 1
+                estimate = next((e for e in reversed(ranked[position:last + 1]) if accepted(e)), None)
+                if estimate is None:
+                    continue
+            elif not accepted(estimate):
+                continue
+            if content_filter is not None:
+                content_filter.keep(estimate.entry)
+            selected.append((priority, estimate))
+            covered += usable(estimate)
+        if covered >= budget:
+            break
+
+    selected.sort(key=lambda item: (item[0], item[1].entry.path))
+    return [estimate.entry for _, estimate in selected], sum(estimate.lines for _, estimate in selected)
+
+
+def document_style(software_name, version, author, total_pages=TOTAL_PAGES):
+    """文档格式参数：每页LINES_PER_PAGE行的代码字号和行高"""
+    return DocumentStyle(
+        software_name=software_name,
+        version=version,
+        author=author,
+        total_pages=total_pages,
+        font_size=pagination.CODE_FONT_SIZE,
+        line_height=pagination.line_height(LINES_PER_PAGE),
+    )
+
+
+def prepare_layout(front_code, back_code, total_lines, software_name, version, author):
+    """确定格式参数并分页，返回(DocumentStyle, 每页一个段落的序列)
+
+    折行和每页行数在这里一次算定（见pagination），生成的文档不需要再检查页数。
+    """
+    style = document_style(software_name, version, author)
+    wrapper = pagination.LineWrapper(style.font_size)
+    paragraphs = pagination.paginate(front_code, back_code, total_lines, FRONT_PAGES, BACK_PAGES, LINES_PER_PAGE,
+                                     wrapper)
+    return style, paragraphs
+
+
+def generate_document(software_name, version, author, project_path, extensions,
+                      output_filename=None, backend='python-docx', index=None,
+                      report=None, cancel_event=None, cache=None, stats=None, rules=DEFAULT_PRIORITY_RULES,
+                      skip_generated=True, source=None, full_listing=False, volume_pages=None):
+    """生成源代码文档
+
+    extensions为逗号分隔的后缀字符串；index为已建立的文件索引（省略时重新遍历）；
+    report(message, progress)接收状态和进度（百分比，可为None）；
+    cancel_event被设置时抛出GenerationCancelled。输入无效或没有匹配文件时抛出GenerationError。
+    cache为file_cache.FileCache，提供时复用上次运行的行数和解码结果（由调用方负责关闭）。
+    stats为instrumentation.RunStats，省略时新建；各阶段的耗时和计数记录在其中并随结果返回，
+    出错或取消时调用方传入的stats仍保留已完成阶段的统计。
+    rules为文件优先级规则（见priority_rules），决定选择哪些文件以及它们在文档中的顺序。
+    skip_generated为True时排除锁文件、生成和压缩的代码以及内容重复的文件（见ContentFilter）。
+    source为输入源（如git_source.GitSource），提供时从中列出和读取文件，project_path使用source.root。
+    full_listing为True时输出所有匹配文件的完整清单（不限于前后各30页，见write_listing），
+    volume_pages为每册的页数，提供时分为多个文件（见volume_filename），页码在各册间接续。
+    """
+    if report is None:
+        report = lambda message=None, progress=None: None
+    if stats is None:
+        stats = instrumentation.RunStats()
+    
+    def check_cancelled():
+        if cancel_event is not None and cancel_event.is_set():
+            raise GenerationCancelled()
+    
+    if not software_name:
+        raise GenerationError("请输入软件名称")
+    if not version:
+        raise GenerationError("请输入版本号")
+    if not author:
+        raise GenerationError("请输入作者名")
+    if source is not None:
+        project_path = source.root
+    elif not project_path or not os.path.exists(project_path):
+        raise GenerationError("请选择有效的项目路径")
+    ext_list = parse_extensions(extensions or "")
+    if not ext_list:
+        raise GenerationError("请输入至少一个文件后缀")
+    if backend not in OUTPUT_BACKENDS:
+        raise GenerationError(f"未知的生成方式: {backend}")
+    if full_listing and backend == 'python-docx':
+        raise GenerationError("完整清单请使用stream或pdf生成方式（python-docx需要把整个文档保存在内存中）")
+    if volume_pages is not None and (not isinstance(volume_pages, int) or volume_pages < 1):
+        raise GenerationError("每册页数应为正整数")
+    if backend == 'pdf':
+        # 在读取代码之前确认字体可用
+        try:
+            pdf_writer.find_fonts()
+        except pdf_writer.FontError as e:
+            raise GenerationError(str(e))
+    if output_filename is None:
+        output_filename = default_output_filename(software_name, backend)
+    
+    warnings = []
+    
+    # 从文件索引中收集所有匹配的文件（单次遍历，无重复）
+    report("正在扫描项目目录...", 0)
+    if index is None:
+        with stats.phase('discovery'):
+            index = source.scan(cancel_event) if source is not None else scan_project(project_path, cancel_event)
+            stats.add('files', len(index))
+    with stats.phase('filter'):
+        all_entries = filter_index(index, ext_list)
+        if skip_generated:
+            all_entries = drop_generated_names(all_entries, stats)
+        stats.add('files', len(all_entries))
+    check_cancelled()
+    report(f"找到 {len(all_entries)} 个匹配的文件", PROGRESS_SCAN)
+    
+    if not all_entries:
+        raise GenerationError("在指定路径下未找到任何匹配的文件")
+    
+    with stats.phase('estimation'):
+        # 首先根据索引中的文件大小和抽样平均行长估计每个文件的行数
+        # 抽样时读入的字节会保留下来，交给后面的解码阶段，避免重复读取
+        file_line_estimates, raw_contents = estimate_line_counts(all_entries, cache, stats, source)
+        stats.add('files', len(all_entries))
+    check_cancelled()
+    
+    # 只选择填满前后两个窗口所需的文件，之后只读取这些文件
+    with stats.phase('selection'):
+        content_filter = None
+        if skip_generated:
+            content_filter = ContentFilter(all_entries, raw_contents, stats, source, retain=not full_listing,
+                                           cache=cache)
+        budget = math.inf if full_listing else FRONT_LINES + BACK_LINES
+        processed_files, estimated_total_lines = select_files(file_line_estimates, project_path, budget, rules,
+                                                              content_filter)
+        stats.add('files', len(processed_files))
+        stats.add('estimated_lines', estimated_total_lines)
+    check_cancelled()
+    if content_filter is not None and content_filter.skipped:
+        report(f"跳过了{len(content_filter.skipped)}个生成、压缩或重复的文件")
+    report(f"选择了{len(processed_files)}/{len(all_entries)}个文件进行处理，估计总行数约{estimated_total_lines}行", PROGRESS_ESTIMATE)
+    
+    if full_listing:
+        volumes, total_lines, file_count, file_boundaries = write_listing(
+            processed_files, project_path, document_style(software_name, version, author, 0), output_filename,
+            backend, volume_pages, raw_contents, report, check_cancelled, cache, stats, source)
+        if total_lines < 3000:
+            warnings.append(f"收集到的代码行数不足3000行（当前{total_lines}行），可能无法满足软著要求")
+        report(f"文档生成完成! 总共处理了 {total_lines} 行代码，保存为 {', '.join(volumes)}", PROGRESS_DONE)
+        return GenerationResult(volumes[0], total_lines, file_count, file_boundaries, warnings, stats, volumes)
+    
+    # 流式处理选定的文件，只保留前后两个窗口的代码行
+    collected = set()
+    
+    def collect_status(index, message):
+        check_cancelled()
+        collected.add(index)
+        span = PROGRESS_COLLECT - PROGRESS_ESTIMATE
+        report(message, PROGRESS_ESTIMATE + span * len(collected) // len(processed_files))
+    
+    with stats.phase('read_decode'):
+        if source is not None:
+            # 选中的文件（未缓存、未读入的）交给输入源按其最合适的顺序提前读取
+            source.preload([entry.path for entry in processed_files if entry.path not in raw_contents and
+                            (cache is None or cache.lookup(entry) is None)])
+        front_code, back_code, total_lines, file_boundaries = collect_code_windows(
+            processed_files, project_path, FRONT_LINES, BACK_LINES, raw_contents, collect_status, cache,
+            stats=stats, source=source)
+    report(f"总共收集了 {total_lines} 行代码", PROGRESS_COLLECT)
+    
+    # 确保有足够的代码行
+    if total_lines < 3000:
+        warnings.append(f"收集到的代码行数不足3000行（当前{total_lines}行），可能无法满足软著要求")
+    
+    # 按折行后的可见行分页，每页固定50行，直接生成60页文档
+    report(f"正在分页：每页{LINES_PER_PAGE}行，共{TOTAL_PAGES}页...")
+    style, paragraphs = prepare_layout(front_code, back_code, total_lines, software_name, version, author)
+    
+    def track_pages(paragraphs):
+        # 逐页报告写入进度，并允许在写入过程中取消；段落取完后进入保存阶段
+        span = PROGRESS_DONE - PROGRESS_COLLECT
+        for page, paragraph in enumerate(paragraphs):
+            check_cancelled()
+            report(f"正在写入第 {min(page + 1, TOTAL_PAGES)}/{TOTAL_PAGES} 页...",
+                   PROGRESS_COLLECT + span * page // (TOTAL_PAGES + 1))
+            stats.add('paragraphs')
+            yield paragraph
+        report("正在保存文档...")
+        stats.begin('save')
+    
+    # 按选择的后端生成并保存文档（生成后不再重新打开解析）
+    stats.begin('build')
+    try:
+        OUTPUT_BACKENDS[backend](output_filename, track_pages(paragraphs), style)
+    except pdf_writer.FontError as e:
+        raise GenerationError(str(e))
+    stats.add('output_bytes', os.path.getsize(output_filename))
+    stats.end()
+    report(f"文档生成完成! 总共处理了 {total_lines} 行代码，保存为 {output_filename}", PROGRESS_DONE)
+    
+    return GenerationResult(output_filename, total_lines, len(processed_files), file_boundaries, warnings, stats)
+
+
+def write_listing(entries, project_path, style, output_filename, backend, volume_pages, raw_contents, report,
+                  check_cancelled, cache=None, stats=None, source=None):
+    """写入完整的源代码清单，返回(各册文件, 总行数, 文件数, 文件边界)
+
+    页眉中的“共N页”需要事先知道总页数，因此读取两遍：第一遍统计每个文件折行后的可见行数，
+    第二遍重新读取（有缓存时从缓存取出）并逐页写入。内存中只有每个文件的行数和当前页，与代码总量无关；
+    后端须为流式写入的stream或pdf。文件边界以可见行计（第n行在第n // LINES_PER_PAGE + 1页）。
+    两遍读取之间文件被修改时抛出GenerationError。
+    """
+    if stats is None:
+        stats = instrumentation.RunStats()
+    wrapper = pagination.LineWrapper(style.font_size)
+    counts = {}   # 序号 -> (行数, 可见行数)
+    with stats.phase('read_decode'):
+        span = PROGRESS_COLLECT - PROGRESS_ESTIMATE
+        for index, text, error in decoded_files(entries, raw_contents, cache, stats=stats, source=source):
+            check_cancelled()
+            entry = entries[index]
+            if error is not None:
+                report(f"警告: 无法读取文件 {entry.path}，原因: {str(error)}，跳过")
+                continue
+            lines = text.split('\n')
+            counts[index] = (len(lines), sum(len(wrapper.wrap(line)) for line in lines))
+            report(f"统计文件行数 {index+1}/{len(entries)}: {os.path.basename(entry.path)}",
+                   PROGRESS_ESTIMATE + span * (index + 1) // len(entries))
+        listed = [entries[index] for index in sorted(counts)]
+        expected = [counts[index] for index in sorted(counts)]
+        file_boundaries = []
+        total_lines = 0
+        visible_lines = 0
+        for entry, (line_count, visible) in zip(listed, expected):
+            file_boundaries.append((os.path.relpath(entry.path, project_path), visible_lines, visible_lines + visible))
+            total_lines += line_count
+            visible_lines += visible
+        stats.add('lines', total_lines)
+    if not listed:
+        raise GenerationError("没有可以读取的源代码文件")
+    
+    total_pages = max(1, math.ceil(visible_lines / LINES_PER_PAGE))
+    per_volume = volume_pages or total_pages
+    volume_count = math.ceil(total_pages / per_volume)
+    report(f"共 {total_lines} 行代码，{total_pages}页" + (f"，分为{volume_count}册" if volume_count > 1 else ""),
+           PROGRESS_COLLECT)
+    
+    def listed_pieces():
+        # 按第一遍的顺序重新读取，折行后的行数须与第一遍一致
+        for index, text, error in decoded_files(listed, {}, cache, stats=stats, source=source):
+            entry = listed[index]
+            if error is not None:
+                raise GenerationError(f"无法读取文件 {entry.path}: {error}")
+            lines = text.split('\n')
+            pieces = list(pagination.visual_lines(lines, wrapper))
+            if (len(lines), len(pieces)) != expected[index]:
+                raise GenerationError(f"文件在生成过程中被修改: {entry.path}，请重新生成")
+            yield pieces
+    
+    written = 0
+    
+    def volume_pages_of(pages, count):
+        # 一册中的各页（最后一页之后不分页），逐页报告进度并允许取消
+        nonlocal written
+        span = PROGRESS_DONE - PROGRESS_COLLECT
+        for position, text in enumerate(itertools.islice(pages, count)):
+            check_cancelled()
+            written += 1
+            if written % LINES_PER_PAGE == 1 or written == total_pages:
+                report(f"正在写入第 {written}/{total_pages} 页...", PROGRESS_COLLECT + span * written // (total_pages + 1))
+            stats.add('paragraphs')
+            yield text, position < count - 1
+    
+    pages = pagination.paginate_listing(listed_pieces(), LINES_PER_PAGE)
+    volumes = []
+    stats.begin('build')
+    for number in range(volume_count):
+        first = number * per_volume
+        count = min(per_volume, total_pages - first)
+        filename = volume_filename(output_filename, number + 1, volume_count)
+        try:
+            OUTPUT_BACKENDS[backend](filename, volume_pages_of(pages, count),
+                                     style._replace(total_pages=total_pages, first_page=first + 1))
+        except pdf_writer.FontError as e:
+            raise GenerationError(str(e))
+        stats.add('output_bytes', os.path.getsize(filename))
+        volumes.append(filename)
+    stats.end()
+    if written != total_pages or next(pages, None) is not None:
+        raise GenerationError("文件在生成过程中被修改，请重新生成")
+    return volumes, total_lines, len(listed), file_boundaries
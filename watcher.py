@@ -0,0 +1,385 @@
+"""
+Copyright 2024 Longze
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+# 监视模式：源文件保存后自动重新生成文档。
+# Linux下用inotify（通过ctypes调用libc）得知哪些文件变化，其他系统定时重新遍历目录并比较文件索引；
+# 一连串的保存在安静一段时间后合并为一次重新生成。
+# 两次生成之间在内存中保留文件索引、各文件的行数和解码后的文本、生成代码的检查结果：
+# 只重新读取变化的文件，重新计算前后窗口和分页；分页结果与上次相同时不重写文档，
+# stream后端只为内容变化的页重新生成XML（见ooxml_writer.paragraph_xml）。
+import ctypes
+import ctypes.util
+import os
+import select
+import stat
+import struct
+import sys
+import threading
+import time
+import file_cache
+import instrumentation
+import pdf_writer
+import pipeline
+
+# 最后一次变化后等待的秒数，期间的变化合并为一次重新生成
+DEFAULT_DEBOUNCE = 0.3
+# 轮询方式重新遍历目录的间隔（秒）
+DEFAULT_INTERVAL = 1.0
+
+# 需要重新遍历整个目录（目录结构或.gitignore变化、inotify事件溢出）
+RESCAN = 'rescan'
+
+# inotify事件（见linux/inotify.h）
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE |
+              IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+EVENT_HEADER = struct.Struct('iIII')
+
+
+class MemoryCache:
+    """在内存中保存文件的行数、编码和解码后的文本，接口与file_cache.FileCache相同
+
+    以路径、大小和修改时间判断文件是否变化，每个路径只保留最新的一份。
+    """
+
+    def __init__(self):
+        self.records = {}   # 路径 -> (大小, 修改时间, 行数, 编码, 文本)
+        self.checks = {}    # 路径 -> (大小, 修改时间, 排除原因, 内容摘要)
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, entry):
+        record = self.records.get(entry.path)
+        if record is None or record[:2] != (entry.size, entry.mtime):
+            return None
+        return record
+
+    def lookup(self, entry):
+        record = self.record(entry)
+        if record is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return file_cache.CachedFile(record[2], record[3], record[4] is not None)
+
+    def get_text(self, entry):
+        record = self.record(entry)
+        return record[4] if record is not None else None
+
+    def store(self, entry, line_count, encoding=None, text=None, data=None):
+        record = self.record(entry)
+        if text is None and record is not None and record[4] is not None:
+            # 只有行数时不覆盖已保存的文本
+            return
+        self.records[entry.path] = (entry.size, entry.mtime, line_count, encoding, text)
+
+    def lookup_check(self, entry):
+        check = self.checks.get(entry.path)
+        if check is None or check[:2] != (entry.size, entry.mtime):
+            return None
+        return file_cache.CachedCheck(check[2], check[3])
+
+    def store_check(self, entry, reason, digest=None):
+        self.checks[entry.path] = (entry.size, entry.mtime, reason, digest)
+
+    def retain(self, paths):
+        """只保留仍在索引中的文件"""
+        for path in [path for path in self.records if path not in paths]:
+            del self.records[path]
+        for path in [path for path in self.checks if path not in paths]:
+            del self.checks[path]
+
+
+class InotifyWatcher:
+    """用inotify监视各个目录，返回变化的文件路径（仅Linux）"""
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1失败")
+        self.directories = {}   # 监视描述符 -> 目录
+
+    def watch(self, directories, index):
+        """监视遍历到的目录（已监视的目录不会重复添加）"""
+        watched = set(self.directories.values())
+        for directory in directories:
+            if directory in watched:
+                continue
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+            if wd >= 0:
+                self.directories[wd] = directory
+
+    def wait(self, timeout):
+        """等待最多timeout秒，返回变化的文件路径集合，需要重新遍历时返回RESCAN"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        try:
+            buffer = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+        changes = set()
+        offset = 0
+        while offset < len(buffer):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(buffer, offset)
+            name = buffer[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b'\0')
+            offset += EVENT_HEADER.size + length
+            if mask & IN_IGNORED:
+                # 目录已被删除或移走
+                self.directories.pop(wd, None)
+                continue
+            directory = self.directories.get(wd)
+            if directory is None:
+                continue
+            name = os.fsdecode(name)
+            if mask & (IN_Q_OVERFLOW | IN_ISDIR | IN_DELETE_SELF | IN_MOVE_SELF) or name == '.gitignore':
+                changes = RESCAN
+            elif changes is not RESCAN and name:
+                changes.add(os.path.join(directory, name))
+        return changes
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """定时重新遍历项目目录，与上次的文件索引比较，返回变化的文件路径"""
+
+    def __init__(self, project_path, interval=DEFAULT_INTERVAL):
+        self.project_path = project_path
+        self.interval = interval
+        self.snapshot = None
+
+    def watch(self, directories, index):
+        """记录遍历得到的文件索引，作为下次比较的基准"""
+        self.snapshot = {entry.path: entry for entry in index}
+
+    def wait(self, timeout):
+        time.sleep(min(timeout, self.interval))
+        snapshot = {entry.path: entry for entry in pipeline.scan_project(self.project_path)}
+        previous, self.snapshot = self.snapshot or {}, snapshot
+        changes = {path for path, entry in snapshot.items() if previous.get(path) != entry}
+        return changes | (previous.keys() - snapshot.keys())
+
+    def close(self):
+        pass
+
+
+def open_watcher(project_path, interval=DEFAULT_INTERVAL, polling=False):
+    """Linux下使用inotify（不可用时，或polling为True时定时轮询）"""
+    if not polling and sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher()
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(project_path, interval)
+
+
+def scan_order(project_path, path):
+    """与scan_project相同的索引顺序：同一目录中先文件后子目录，各自按名称排序"""
+    parts = os.path.relpath(path, project_path).split(os.sep)
+    return tuple(parts[:-1]) + ('\0' + parts[-1],)
+
+
+class DocumentWatcher:
+    """监视项目目录，文件变化后增量地重新生成文档
+
+    参数与pipeline.generate_document相同；debounce为最后一次变化后等待的秒数，
+    interval为轮询间隔，polling为True时不使用inotify。report(message)接收状态信息。
+    """
+
+    def __init__(self, software_name, version, author, project_path, extensions, output_filename,
+                 backend='stream', rules=pipeline.DEFAULT_PRIORITY_RULES, skip_generated=True,
+                 debounce=DEFAULT_DEBOUNCE, interval=DEFAULT_INTERVAL, polling=False, report=None):
+        if not os.path.isdir(project_path or ''):
+            raise pipeline.GenerationError("监视模式需要有效的项目目录")
+        self.ext_list = pipeline.parse_extensions(extensions or "")
+        if not self.ext_list:
+            raise pipeline.GenerationError("请输入至少一个文件后缀")
+        if backend not in pipeline.OUTPUT_BACKENDS:
+            raise pipeline.GenerationError(f"未知的生成方式: {backend}")
+        if backend == 'pdf':
+            try:
+                pdf_writer.find_fonts()
+            except pdf_writer.FontError as e:
+                raise pipeline.GenerationError(str(e))
+        self.software_name = software_name
+        self.version = version
+        self.author = author
+        self.project_path = os.path.abspath(project_path)
+        self.output_filename = output_filename
+        self.backend = backend
+        self.rules = rules
+        self.skip_generated = skip_generated
+        self.debounce = debounce
+        self.interval = interval
+        self.report = report or (lambda message: None)
+        self.watcher = open_watcher(self.project_path, interval, polling)
+        self.cache = MemoryCache()
+        self.entries = {}     # 路径 -> FileEntry
+        self.directories = set()
+        self.checked = {}     # FileEntry -> (生成代码检查结果, 内容摘要)
+        self.names = {}       # 路径 -> (索引顺序, 是否为锁文件或打包产物)
+        self.priorities = {}  # 路径 -> 优先级
+        self.pages = None     # 上次写入的(DocumentStyle, [段落])
+        self.stop_event = threading.Event()
+
+    def rescan(self):
+        """重新遍历项目目录，返回变化的文件数"""
+        directories = []
+        index = pipeline.scan_project(self.project_path, directories=directories)
+        self.watcher.watch(directories, index)
+        self.directories = set(directories)
+        entries = {entry.path: entry for entry in index}
+        changed = sum(1 for path, entry in entries.items() if self.entries.get(path) != entry)
+        changed += len(self.entries.keys() - entries.keys())
+        self.entries = entries
+        return changed
+
+    def update(self, paths):
+        """重新获取变化的文件的大小和修改时间，返回实际变化的文件数"""
+        if any(os.path.dirname(path) not in self.directories for path in paths):
+            # 新建的目录中的文件（轮询方式）
+            return self.rescan()
+        changed = 0
+        for path in paths:
+            entry = None
+            name = os.path.basename(path)
+            try:
+                st = os.stat(path, follow_symlinks=False)
+                if stat.S_ISREG(st.st_mode):
+                    entry = pipeline.FileEntry(path, os.path.splitext(name)[1].lower(), st.st_size, st.st_mtime)
+            except OSError:
+                pass
+            if entry != self.entries.get(path):
+                changed += 1
+                if entry is None:
+                    del self.entries[path]
+                else:
+                    self.entries[path] = entry
+        return changed
+
+    def rebuild(self):
+        """按当前索引重新生成文档，分页结果与上次相同时不重写；返回更新的页数"""
+        stats = instrumentation.RunStats()
+        with stats.phase('filter'):
+            # 只依赖路径的结果（索引顺序、文件名判断、优先级）在多次生成之间保留
+            if len(self.names) > len(self.entries):
+                self.names = {path: self.names[path] for path in self.entries if path in self.names}
+                self.priorities = {path: self.priorities[path] for path in self.entries if path in self.priorities}
+            for path, entry in self.entries.items():
+                if path not in self.names:
+                    self.names[path] = (scan_order(self.project_path, path), pipeline.is_generated_name(entry))
+            index = sorted(self.entries.values(), key=lambda entry: self.names[entry.path][0])
+            entries = pipeline.filter_index(index, self.ext_list)
+            if self.skip_generated:
+                entries = [entry for entry in entries if not self.names[entry.path][1]]
+        if not entries:
+            raise pipeline.GenerationError("在指定路径下未找到任何匹配的文件")
+        self.cache.retain(self.entries)
+        with stats.phase('estimation'):
+            estimates, raw_contents = pipeline.estimate_line_counts(entries, self.cache, stats)
+        with stats.phase('selection'):
+            content_filter = None
+            if self.skip_generated:
+                content_filter = pipeline.ContentFilter(entries, raw_contents, stats, cache=self.cache)
+                # 未变化的文件沿用上次的检查结果和摘要，不再读取
+                for entry in entries:
+                    reason, digest = self.checked.get(entry, (None, None))
+                    if reason is not None:
+                        content_filter.results[entry.path] = reason
+                    if digest is not None:
+                        content_filter.digests[entry.path] = digest
+            files, _ = pipeline.select_files(estimates, self.project_path, rules=self.rules,
+                                             content_filter=content_filter, priorities=self.priorities)
+            if content_filter is not None:
+                self.checked = {entry: (content_filter.results.get(entry.path), content_filter.digests.get(entry.path))
+                                for entry in entries
+                                if entry.path in content_filter.results or entry.path in content_filter.digests}
+        with stats.phase('read_decode'):
+            front_code, back_code, total_lines, _ = pipeline.collect_code_windows(
+                files, self.project_path, pipeline.FRONT_LINES, pipeline.BACK_LINES, raw_contents,
+                lambda index, message: None, self.cache, stats=stats)
+        with stats.phase('layout'):
+            style, paragraphs = pipeline.prepare_layout(front_code, back_code, total_lines,
+                                                        self.software_name, self.version, self.author)
+            pages = list(paragraphs)
+        if self.pages is not None and self.pages == (style, pages):
+            return 0
+        previous = self.pages[1] if self.pages is not None else []
+        with stats.phase('build'):
+            pipeline.OUTPUT_BACKENDS[self.backend](self.output_filename, pages, style)
+        self.pages = (style, pages)
+        if total_lines < 3000:
+            self.report(f"警告: 收集到的代码行数不足3000行（当前{total_lines}行），可能无法满足软著要求")
+        return sum(1 for page, paragraph in enumerate(pages)
+                   if page >= len(previous) or previous[page] != paragraph)
+
+    def refresh(self, changed):
+        """重新生成并报告结果；出错时报告后继续监视，下次变化时再试"""
+        start = time.perf_counter()
+        try:
+            pages = self.rebuild()
+        except (pipeline.GenerationError, pdf_writer.FontError) as e:
+            self.report(f"错误: {e}")
+            return
+        except OSError as e:
+            # 如文档正在Word中打开而被锁定
+            self.report(f"无法写入 {self.output_filename}: {e}，将在下次变化时重试")
+            return
+        elapsed = time.perf_counter() - start
+        if pages:
+            self.report(f"已更新 {self.output_filename}：{changed}个文件变化，{pages}页更新，用时{elapsed:.2f}s")
+        else:
+            self.report(f"{changed}个文件变化，文档内容不变，用时{elapsed:.2f}s")
+
+    def run(self):
+        """先生成一次，之后持续监视直到stop()被调用"""
+        self.refresh(self.rescan())
+        self.report(f"正在监视 {self.project_path}，按Ctrl+C退出")
+        try:
+            while not self.stop_event.is_set():
+                changes = self.watcher.wait(self.interval)
+                if not changes:
+                    continue
+                # 去抖动：持续收集变化，直到安静debounce秒
+                while not self.stop_event.is_set():
+                    more = self.watcher.wait(self.debounce)
+                    if not more:
+                        break
+                    changes = RESCAN if RESCAN in (changes, more) else changes | more
+                changed = self.rescan() if changes == RESCAN else self.update(changes)
+                if changed:
+                    self.refresh(changed)
+        finally:
+            self.watcher.close()
+
+    def stop(self):
+        self.stop_event.set()